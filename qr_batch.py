@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+import qrcode
+
+from qr_decoders import resolve_decoders
+from qr_engine import GridEvaluator, create_qr_matrix, find_modified_qr_code_url
+from qr_exhaustive import write_packed
+from qr_kflip import find_modified_qr_code_url_k
+
+
+ERROR_CORRECTION_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+# Function to turn one input line into a job: either a bare URL or a JSON object
+# {"url": ..., "version": ..., "ecc": "L"}. Blank lines and # comments are skipped. Raises ValueError
+# for a line whose fields have the wrong type or an unknown value, so it becomes that line's error record.
+def parse_job(line):
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if not line.startswith('{'):
+        return {'url': line, 'version': None, 'ecc': 'L'}
+    job = json.loads(line)
+    if not isinstance(job, dict) or not isinstance(job.get('url'), str):
+        raise ValueError("Job must be a JSON object with a 'url' string")
+    version = job.get('version')
+    if version is not None and (isinstance(version, bool) or not isinstance(version, int) or not 1 <= version <= 40):
+        raise ValueError(f"Version must be an integer from 1 to 40, got {version!r}")
+    ecc = job.get('ecc', 'L')
+    if not isinstance(ecc, str) or ecc.upper() not in ERROR_CORRECTION_LEVELS:
+        raise ValueError(f"ECC level must be one of {', '.join(ERROR_CORRECTION_LEVELS)}, got {ecc!r}")
+    return {'url': job['url'], 'version': version, 'ecc': ecc.upper()}
+
+
+# Function to settle decoder='auto' once, by timing the backends on a sample symbol, and return the
+# (decoder, confirm_decoder) names every job of a batch then uses; named backends pass through
+def batch_decoders(decoder, confirm_decoder=None):
+    if decoder != 'auto':
+        return decoder, confirm_decoder
+    grid, qr = create_qr_matrix('https://example.com')
+    primary, confirmer = resolve_decoders(decoder, confirm_decoder, GridEvaluator(grid, qr.version).render(()))
+    return primary.name, confirmer.name if confirmer is not None else None
+
+
+# Function to run the flip search for one job and build its result record
+def run_job(job, k=1, adjacency='any', evaluator=None, cache=None, decoder='pyzbar', confirm_decoder=None,
+            order=None, time_limit=None, validator=None):
+    start_time = time.perf_counter()
+    record = {'url': job['url'], 'version': job['version'], 'ecc': job['ecc']}
+    try:
+        error_correction = ERROR_CORRECTION_LEVELS[job['ecc']]
+        if k == 1:
+            modified_url, position, stats = find_modified_qr_code_url(
+                job['url'], qr_version=job['version'], evaluator=evaluator or 'image', cache=cache,
+                error_correction=error_correction, decoder=decoder, confirm_decoder=confirm_decoder, order=order,
+                time_limit=time_limit, validator=validator)
+            positions = [list(position)] if position else None
+        else:
+            modified_url, positions, stats = find_modified_qr_code_url_k(
+                job['url'], k=k, qr_version=job['version'], adjacency=adjacency, evaluator=evaluator or 'analytic',
+                cache=cache, error_correction=error_correction, decoder=decoder, confirm_decoder=confirm_decoder,
+                order=order, time_limit=time_limit, validator=validator)
+            positions = [list(position) for position in positions] if positions else None
+        record.update({'modified_url': modified_url, 'positions': positions, 'stats': stats.as_dict()})
+    except Exception as error:  # One bad URL must not end a job of thousands
+        record['error'] = f'{type(error).__name__}: {error}'
+    record['seconds'] = round(time.perf_counter() - start_time, 4)
+    return record
+
+
+# Function to stream jobs from `lines` through the search and write one JSON line per URL as soon as
+# it finishes. Nothing is collected, so memory stays flat however long the input is; the process,
+# its imports, the cached function masks and symbol layouts, and the result cache stay warm across jobs.
+# time_limit (seconds) budgets each job separately. make_validator, if given, builds the
+# qr_validator.PayloadValidator for a job from its URL. decoder='auto' is timed once for the whole batch.
+# With packed (a directory) every hit is also kept as a qr_packed collection, its base grid bit-packed
+# and its flips as index arrays, in packed/<output line number>; the record names it under 'packed'.
+def run_batch(lines, output, k=1, adjacency='any', evaluator=None, cache=None, decoder='pyzbar',
+              confirm_decoder=None, order=None, time_limit=None, make_validator=None, packed=None):
+    if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+        raise ValueError(f"k must be a positive integer, got {k!r}")
+    decoder, confirm_decoder = batch_decoders(decoder, confirm_decoder)
+    processed = 0
+    for line in lines:
+        try:
+            job = parse_job(line)
+        except ValueError as error:  # json.JSONDecodeError is a ValueError too
+            record = {'input': line.rstrip('\n'), 'error': f'{type(error).__name__}: {error}'}
+        else:
+            if job is None:
+                continue
+            record = run_job(job, k=k, adjacency=adjacency, evaluator=evaluator, cache=cache, decoder=decoder,
+                             confirm_decoder=confirm_decoder, order=order, time_limit=time_limit,
+                             validator=make_validator(job['url']) if make_validator is not None else None)
+            if packed is not None and record.get('positions'):
+                record['packed'] = os.path.join(packed, f'{processed:06d}')
+                write_packed([{'url': record['modified_url'], 'positions': record['positions']}], record['packed'],
+                             job['url'], job['version'], ERROR_CORRECTION_LEVELS[job['ecc']])
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+        processed += 1
+    return processed
@@ -0,0 +1,260 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import qrcode
+
+from qr_batch import ERROR_CORRECTION_LEVELS
+from qr_decoders import DECODERS, available_decoders
+from qr_engine import (GridEvaluator, create_qr_matrix, decode_qr_image, is_human_readable, render_grid,
+                       single_flip_candidates)
+from qr_kflip import KFlipSearch
+from qr_stats import STAGES, SearchStats
+
+
+# Fixed corpus so runs on different commits measure the same symbols
+# (the first entry fits version 1 even at ECC level H)
+BENCHMARK_URLS = (
+    'a.co/qr',
+    'https://www.hello.com',
+    'https://example.com/login?next=/account/settings',
+    'http://intranet.local/reports/2024/Q3/summary.pdf',
+    'https://shop.example.org/products/12345678901234567890?ref=qr-campaign&utm_source=print',
+)
+
+# Flip modes measured: single modules, QR-2 bit style horizontal pairs, and the k-flip search
+BENCHMARK_MODES = ('single', 'pair', 'k')
+
+
+# Function to summarise a list of durations (seconds) as median and percentiles
+def summarize(samples):
+    if not samples:
+        return None
+    values = np.array(samples)
+    return {
+        'count': len(samples),
+        'median': float(np.median(values)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'mean': float(values.mean()),
+        'total': float(values.sum()),
+    }
+
+
+# Function to record where the numbers came from
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'qrcode': getattr(qrcode, '__version__', None),
+        'commit': commit,
+    }
+
+
+# Function to run work() under tracemalloc and return the most memory it held at once, in bytes. This
+# is per configuration, unlike the process-wide RSS high-water mark; tracing slows every allocation, so
+# it runs apart from the timed passes.
+def peak_allocated(work):
+    tracemalloc.start()
+    try:
+        work()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Function to list the flip sets of the single or pair mode in scan order
+def mode_flip_sets(grid, mode):
+    candidates = [tuple(position) for position in single_flip_candidates(grid).tolist()]
+    if mode == 'single':
+        return [(position,) for position in candidates]
+    free = set(candidates)
+    return [((row, col), (row, col + 1)) for row, col in candidates if (row, col + 1) in free]
+
+
+# Function to time the k-flip search itself (qr_kflip.KFlipSearch, analytic evaluator as the CLI runs it)
+# until it has made `samples` evaluations or run out of flip sets, `repeats` times over. A visited flip
+# set is one evaluated or pruned; each repeat gives one sample per stage, that stage's seconds per
+# visited set, with 'search' the whole run. Returns (stages, visited sets per second, visited per repeat).
+def benchmark_k_search(url, grid, qr, k, samples, repeats):
+    stage_samples = {stage: [] for stage in ('search',) + STAGES if stage != 'encode'}
+    visited, seconds = [], []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        search = KFlipSearch(grid, qr, k, original_url=url, stats=SearchStats())
+        search.search(url, max_evaluations=samples)
+        seconds.append(time.perf_counter() - start_time)
+        visited.append(max(search.stats.decodes_attempted + search.stats.pruned, 1))
+        stage_samples['search'].append(seconds[-1] / visited[-1])
+        for stage in STAGES:
+            if stage != 'encode':
+                stage_samples[stage].append(search.stats.stage_seconds[stage] / visited[-1])
+    stages = {stage: summarize(values) for stage, values in stage_samples.items() if any(values)}
+    return stages, sum(visited) / sum(seconds), visited
+
+
+# Function to time each decoder backend on the same candidate images. Agreement is the fraction of
+# images where the backend read the same thing as the reference (pyzbar) decode; read rate is the
+# fraction it read at all.
+def benchmark_decoders(images, reference, decoders):
+    backends = {}
+    for decoder in decoders:
+        times, agree, read = [], 0, 0
+        for img, expected in zip(images, reference):
+            start_time = time.perf_counter()
+            text = decoder.decode(img)
+            times.append(time.perf_counter() - start_time)
+            agree += text == expected
+            read += text is not None
+        backends[decoder.name] = {
+            'decode': summarize(times),
+            'candidates_per_second': len(times) / sum(times) if sum(times) else None,
+            'agreement': agree / len(images) if images else None,
+            'read_rate': read / len(images) if images else None,
+        }
+    return backends
+
+
+# Function to time every stage for one (URL, version, ECC level name, mode) configuration. The k mode
+# times the k-flip search (its backend comparison is left out, as the search reads through its own
+# evaluator); the others time flip sets one by one.
+def benchmark_configuration(url, qr_version, level, mode, k=3, samples=50, repeats=5, decoders=()):
+    error_correction = ERROR_CORRECTION_LEVELS[level]
+    encode_times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        grid, qr = create_qr_matrix(url, qr_version, error_correction)
+        encode_times.append(time.perf_counter() - start_time)
+    if qr.version != qr_version:
+        return None  # The URL does not fit this version at this ECC level
+
+    if mode == 'k':
+        stages, candidates_per_second, visited = benchmark_k_search(url, grid, qr, k, samples, repeats)
+        return {
+            'url': url,
+            'version': qr_version,
+            'ecc': level,
+            'mode': f'k={k}',
+            'search_space': None,
+            'visited': visited,
+            'stages': dict(stages, encode=summarize(encode_times)),
+            'candidates_per_second': candidates_per_second,
+            'decoders': {},
+            'peak_allocated_bytes': peak_allocated(
+                lambda: KFlipSearch(grid, qr, k, original_url=url).search(url, max_evaluations=samples)),
+        }
+
+    evaluator = GridEvaluator(grid, qr.version)
+    flip_sets = mode_flip_sets(grid, mode)
+    step = max(1, len(flip_sets) // samples)
+    sampled = flip_sets[::step][:samples]
+    render_times, decode_times, validate_times, allocating_times = [], [], [], []
+    images, decoded = [], []
+    for positions in sampled:
+        # The search path: flip in the shared render buffer, decode, revert the touched blocks
+        start_time = time.perf_counter()
+        img = evaluator.buffer.flip(positions)
+        render_time = time.perf_counter()
+        modified_url = decode_qr_image(img)
+        decode_time = time.perf_counter()
+        evaluator.buffer.revert()
+        revert_time = time.perf_counter()
+        if modified_url:
+            is_human_readable(modified_url)
+        validate_time = time.perf_counter()
+        render_times.append(render_time - start_time + revert_time - decode_time)
+        decode_times.append(decode_time - render_time)
+        validate_times.append(validate_time - revert_time)
+
+        # The earlier path for comparison: copy the grid and render a fresh bordered image
+        start_time = time.perf_counter()
+        modified_grid = grid.copy()
+        for row, col in positions:
+            modified_grid[row, col] = 0
+        images.append(render_grid(modified_grid, evaluator.scale, evaluator.border))
+        allocating_times.append(time.perf_counter() - start_time)
+        decoded.append(modified_url)
+
+    per_candidate = sum(render_times) + sum(decode_times) + sum(validate_times)
+    return {
+        'url': url,
+        'version': qr_version,
+        'ecc': level,
+        'mode': mode,
+        'search_space': len(flip_sets),
+        'stages': {
+            'encode': summarize(encode_times),
+            'render': summarize(render_times),
+            'render_allocating': summarize(allocating_times),
+            'decode': summarize(decode_times),
+            'validate': summarize(validate_times),
+        },
+        'candidates_per_second': len(render_times) / per_candidate if per_candidate else None,
+        'decoders': benchmark_decoders(images, decoded, decoders),
+        'peak_allocated_bytes': peak_allocated(lambda: [GridEvaluator(grid, qr.version).evaluate(positions)
+                                                        for positions in sampled]),
+    }
+
+
+# Function to sweep versions x ECC levels x modes over the URL corpus; returns a JSON-ready report
+def run_benchmark(versions=range(1, 41), levels=tuple(ERROR_CORRECTION_LEVELS), modes=BENCHMARK_MODES,
+                  urls=BENCHMARK_URLS, k=3, samples=50, repeats=5, progress=None, decoders=tuple(DECODERS)):
+    backends = available_decoders(decoders)
+    results, skipped = [], []
+    for qr_version in versions:
+        for level in levels:
+            for mode in modes:
+                for url in urls:
+                    result = benchmark_configuration(url, qr_version, level, mode, k=k, samples=samples,
+                                                     repeats=repeats, decoders=backends)
+                    if result is None:
+                        skipped.append({'url': url, 'version': qr_version, 'ecc': level, 'mode': mode})
+                        continue
+                    results.append(result)
+                    if progress:
+                        progress(result)
+    return {'environment': environment(),
+            'settings': {'k': k, 'samples': samples, 'repeats': repeats,
+                         'decoders': [decoder.name for decoder in backends]},
+            'results': results, 'skipped': skipped}
+
+
+# Function to compare two reports configuration by configuration (ratio > 1 means `new` is faster)
+def compare_benchmarks(old_report, new_report):
+    def key(result):
+        return result['url'], result['version'], result['ecc'], result['mode']
+
+    old_results = {key(result): result for result in old_report['results']}
+    comparison = []
+    for result in new_report['results']:
+        old = old_results.get(key(result))
+        if old and old['candidates_per_second'] and result['candidates_per_second']:
+            comparison.append({
+                'url': result['url'], 'version': result['version'], 'ecc': result['ecc'], 'mode': result['mode'],
+                'speedup': result['candidates_per_second'] / old['candidates_per_second'],
+            })
+    speedups = [entry['speedup'] for entry in comparison]
+    return {'median_speedup': statistics.median(speedups) if speedups else None, 'configurations': comparison}
+
+
+# Function to write a report as stable, diffable JSON
+def write_report(report, path):
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write('\n')
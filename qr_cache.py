@@ -0,0 +1,82 @@
+import hashlib
+import sqlite3
+
+
+# Persistent flip-set -> decoded-result cache in a local SQLite file.
+# Entries are keyed by the encoded symbol's identity (payload, version, ECC level, mask, the evaluator
+# that produced the result and, for rendered images, the pixels per module) plus the flip set.
+# Least recently used entries are evicted once the cache grows past max_entries. Recency is a counter,
+# not wall time, so it survives clock jumps. Writes are buffered for flush_every operations; get()
+# reads the buffer before the file.
+class ResultCache:
+    def __init__(self, path='qr_results.sqlite', max_entries=1_000_000, flush_every=1000):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key BLOB PRIMARY KEY, decoded TEXT, failed INTEGER NOT NULL, last_used INTEGER NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.clock = (self.connection.execute('SELECT MAX(last_used) FROM results').fetchone()[0] or 0) + 1
+        self.pending_writes = {}  # key -> [decoded, failed, last_used], not yet in the file
+        self.pending_touches = []
+        self.hits = 0
+        self.misses = 0
+
+    # Identity of an encoded symbol; everything that changes what a flip decodes to. scale is the render's
+    # pixels per module, since a decoder can read the same flip differently at another size (None for
+    # analytic predictions, which render nothing).
+    @staticmethod
+    def symbol_key(payload, qr_version, error_correction, mask_pattern, evaluator, scale=None):
+        symbol = f'{payload}\x00{qr_version}\x00{error_correction}\x00{mask_pattern}\x00{evaluator}'
+        return symbol if scale is None else f'{symbol}\x00{scale}'
+
+    @staticmethod
+    def _key(symbol, positions):
+        flips = ';'.join(f'{row},{col}' for row, col in sorted(positions))
+        return hashlib.sha1(f'{symbol}\x00{flips}'.encode('utf-8')).digest()
+
+    # Look up a flip set. Returns (found, decoded) where decoded is None for a decode failure.
+    def get(self, symbol, positions):
+        key = self._key(symbol, positions)
+        pending = self.pending_writes.get(key)
+        if pending is not None:
+            self.hits += 1
+            self.clock += 1
+            pending[2] = self.clock
+            return True, (None if pending[1] else pending[0])
+        row = self.connection.execute('SELECT decoded, failed FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self.clock += 1
+        self.pending_touches.append((self.clock, key))
+        return True, (None if row[1] else row[0])
+
+    # Remember what a flip set decoded to (None for a decode failure)
+    def put(self, symbol, positions, decoded):
+        self.clock += 1
+        self.pending_writes[self._key(symbol, positions)] = [decoded, int(decoded is None), self.clock]
+        if len(self.pending_writes) + len(self.pending_touches) >= self.flush_every:
+            self.flush()
+
+    # Write buffered entries and recency updates, then evict down to max_entries
+    def flush(self):
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                        [(key, *entry) for key, entry in self.pending_writes.items()])
+            self.connection.executemany('UPDATE results SET last_used = ? WHERE key = ?', self.pending_touches)
+            excess = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)', (excess,))
+        self.pending_writes = {}
+        self.pending_touches = []
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
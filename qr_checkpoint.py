@@ -0,0 +1,37 @@
+import json
+import os
+
+
+# Function to describe what a checkpoint belongs to; a resume is refused unless all of it matches
+def checkpoint_identity(original_url, qr_version, error_correction, mode):
+    return {'url': original_url, 'version': qr_version, 'error_correction': error_correction, 'mode': mode}
+
+
+# Function to write a checkpoint atomically (write a temp file, then rename over the old one).
+# The cursor is the number of candidates (top-level candidates for k-flip searches) fully evaluated;
+# everything before it is the evaluated set, so it never has to be stored position by position.
+def save_checkpoint(path, identity, cursor, evaluated, results, finished=False):
+    state = {
+        'identity': identity,
+        'cursor': cursor,
+        'evaluated': evaluated,
+        'results': results,
+        'finished': finished,
+    }
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(state, file, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+# Function to load a checkpoint for resuming. Returns None when there is nothing to resume and
+# raises ValueError when the file belongs to a different URL, version, ECC level or search mode.
+def load_checkpoint(path, identity):
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path) as file:
+        state = json.load(file)
+    if state.get('identity') != identity:
+        raise ValueError(f"Checkpoint {path} was written for {state.get('identity')}, not {identity}; "
+                         f"refusing to resume")
+    return state
@@ -0,0 +1,471 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from qr_batch import ERROR_CORRECTION_LEVELS, run_batch
+from qr_benchmark import BENCHMARK_MODES, compare_benchmarks, run_benchmark, write_report
+from qr_cache import ResultCache
+from qr_codeword import find_modified_qr_code_url_codeword
+from qr_decoders import DECODERS
+from qr_exhaustive import STRATEGIES, exhaustive_search, write_jsonl, write_packed
+from qr_engine import find_modified_qr_code_url
+from qr_kflip import ADJACENCY_MODES, find_modified_qr_code_url_k
+from qr_ordering import ORDERINGS
+from qr_parallel import find_modified_qr_code_url_parallel
+from qr_robustness import robustness_check
+from qr_sensitivity import outcome_counts, save_sensitivity_map, sensitivity_map
+from qr_service import serve
+from qr_shard import merge_shards, parse_shard, write_shard_stats
+from qr_stats import SearchStats
+from qr_sweep import MASK_PATTERNS, run_sweep
+from qr_validator import PayloadValidator
+
+
+# Function to run one shard of a first-hit search: the shard's first hit (or nothing) goes to args.output
+# with its ordinal, and its stats beside it, so merge can pick the hit a single-node search would return
+def run_search_shard(args, shard, validator):
+    strategy = 'codeword' if args.codeword else 'single' if args.k == 1 else 'k'
+    stats = SearchStats(args.progress_every)
+    results = exhaustive_search(args.url, strategy=strategy, k=args.k, qr_version=args.version,
+                                adjacency=args.adjacency, evaluator=args.evaluator,
+                                max_characters=args.max_characters, decoder=args.decoder,
+                                confirm_decoder=args.confirm_decoder, order=args.order, stats=stats,
+                                deduplicate=False, shard=shard, time_limit=args.time_limit, validator=validator)
+    record = next(results, None)
+    stats.finish()
+    with open(args.output, 'w') as output:
+        write_jsonl([record] if record is not None else [], output)
+    identity = {'url': args.url, 'strategy': strategy, 'k': args.k, 'version': args.version,
+                'adjacency': args.adjacency, 'evaluator': args.evaluator, 'max_characters': args.max_characters,
+                'decoder': args.decoder, 'confirm_decoder': args.confirm_decoder, 'order': args.order,
+                'deduplicate': False, 'first_hit': True,
+                'validator': validator.settings() if validator is not None else None}
+    write_shard_stats(args.output, identity, shard, stats)
+    if record is None:
+        return None, None, stats
+    positions = tuple(tuple(position) for position in record['positions'])
+    return record['url'], positions[0] if strategy == 'single' else positions, stats
+
+
+# Function to run one flip search from the command line
+def run_search(args):
+    if args.resume and not args.checkpoint:
+        raise SystemExit("--resume needs --checkpoint to know which file to continue from")
+    if args.workers is not None and (args.codeword or args.k != 1 or args.evaluator == 'analytic' or args.checkpoint
+                                     or args.cache):
+        raise SystemExit("--workers runs the single-flip image search; it does not combine with --codeword, --k, "
+                         "--evaluator analytic, --checkpoint or --cache")
+    if args.shard and (not args.output or args.checkpoint or args.cache or args.workers is not None):
+        raise SystemExit("--shard writes the shard's hit to -o FILE for merge; it does not combine with --checkpoint, "
+                         "--cache or --workers")
+
+    cache = ResultCache(args.cache, max_entries=args.cache_size) if args.cache else None
+    validator = build_validator(args, args.url)
+    # A checkpoint written by a different search (URL, version, order, ...) is refused with a ValueError
+    try:
+        if args.shard:
+            modified_url, position, stats = run_search_shard(args, parse_shard(args.shard), validator)
+        elif args.codeword:
+            modified_url, position, stats = find_modified_qr_code_url_codeword(
+                args.url, qr_version=args.version, max_characters=args.max_characters, decoder=args.decoder,
+                progress_every=args.progress_every, time_limit=args.time_limit, validator=validator)
+        elif args.workers is not None:
+            modified_url, position, stats = find_modified_qr_code_url_parallel(
+                args.url, qr_version=args.version, workers=args.workers or None, progress_every=args.progress_every,
+                decoder=args.decoder, confirm_decoder=args.confirm_decoder, order=args.order,
+                time_limit=args.time_limit, validator=validator)
+        elif args.k == 1:
+            modified_url, position, stats = find_modified_qr_code_url(
+                args.url, qr_version=args.version, evaluator=args.evaluator or 'image',
+                checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every, resume=args.resume,
+                cache=cache, progress_every=args.progress_every, decoder=args.decoder,
+                confirm_decoder=args.confirm_decoder, order=args.order, time_limit=args.time_limit, validator=validator)
+        else:
+            modified_url, position, stats = find_modified_qr_code_url_k(
+                args.url, k=args.k, qr_version=args.version, adjacency=args.adjacency,
+                evaluator=args.evaluator or 'analytic',
+                checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every, resume=args.resume,
+                cache=cache, progress_every=args.progress_every, decoder=args.decoder,
+                confirm_decoder=args.confirm_decoder, order=args.order, time_limit=args.time_limit, validator=validator)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    except ImportError as error:
+        raise SystemExit(f"{error}; pick another backend with --decoder")
+
+    if modified_url:
+        print(f"Modified URL: {modified_url}")
+        print(f"Modules flipped at: {position}")
+        if validator is not None:
+            print(f"Similarity to {args.url}: {validator.validate(modified_url)['similarity']:.0%}")
+        if args.robustness:
+            positions = (position,) if args.k == 1 and not args.codeword else position
+            report = robustness_check(args.url, positions, modified_url, qr_version=args.version,
+                                      **robustness_options(args))
+            print(f"Survives {report['survived']} of {report['variants']} degraded scans ({report['survival']:.0%}); "
+                  f"{report['original']} read the original URL, {report['failed']} did not decode")
+    elif stats.timed_out:
+        print(f"No valid modification found within {args.time_limit}s ({coverage_text(stats)} searched).")
+    else:
+        print("No valid modification found.")
+    if args.stats:
+        print(json.dumps(stats.as_dict(), indent=2))
+    if cache is not None:
+        cache.close()
+        print(f"Result cache: {cache.hits} hits, {cache.misses} misses")
+
+
+# Function to stream a URL list (JSONL or one URL per line) through the search, one JSON line out per URL
+def run_batch_command(args):
+    cache = ResultCache(args.cache, max_entries=args.cache_size) if args.cache else None
+    source = open(args.input) if args.input != '-' else sys.stdin
+    output = open(args.output, 'w') if args.output != '-' else sys.stdout
+    try:
+        processed = run_batch(source, output, k=args.k, adjacency=args.adjacency, evaluator=args.evaluator,
+                              cache=cache, decoder=args.decoder, confirm_decoder=args.confirm_decoder, order=args.order,
+                              time_limit=args.time_limit, make_validator=lambda url: build_validator(args, url),
+                              packed=args.packed)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        if cache is not None:
+            cache.close()
+    print(f"Processed {processed} URLs", file=sys.stderr)
+
+
+# Function to stream every distinct variant of one URL to a JSONL file
+def run_exhaustive_command(args):
+    shard = None
+    if args.shard:
+        if args.packed or args.output == '-':
+            raise SystemExit("--shard writes JSONL with a stats file beside it, so it needs -o FILE and no --packed")
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as error:
+            raise SystemExit(str(error))
+    stats = SearchStats(args.progress_every)
+    validator = build_validator(args, args.url, always=True)  # Every record is scored against the original
+    results = exhaustive_search(args.url, strategy=args.strategy, k=args.k, qr_version=args.version,
+                                adjacency=args.adjacency, evaluator=args.evaluator, max_characters=args.max_characters,
+                                decoder=args.decoder, confirm_decoder=args.confirm_decoder, order=args.order,
+                                stats=stats, deduplicate=not args.keep_duplicates, shard=shard,
+                                time_limit=args.time_limit, validator=validator,
+                                robustness=robustness_options(args) if args.robustness else None)
+    if args.packed:
+        write_packed(results, args.packed, args.url, qr_version=args.version)
+    else:
+        output = open(args.output, 'w') if args.output != '-' else sys.stdout
+        try:
+            write_jsonl(results, output)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    if shard is not None:
+        # Everything that decides the results; merge refuses shards whose identities differ
+        identity = {'url': args.url, 'strategy': args.strategy, 'k': args.k, 'version': args.version,
+                    'adjacency': args.adjacency, 'evaluator': args.evaluator, 'max_characters': args.max_characters,
+                    'decoder': args.decoder, 'confirm_decoder': args.confirm_decoder, 'order': args.order,
+                    'deduplicate': not args.keep_duplicates, 'validator': validator.settings(),
+                    'robustness': robustness_options(args) if args.robustness else None}
+        write_shard_stats(args.output, identity, shard, stats)
+    print(f"{stats.results} distinct variants, {stats.duplicate_payloads} duplicate payloads dropped", file=sys.stderr)
+    if stats.timed_out:
+        print(f"Stopped at the {args.time_limit}s time limit with {coverage_text(stats)} searched", file=sys.stderr)
+    if args.stats:
+        print(json.dumps(stats.as_dict(), indent=2), file=sys.stderr)
+
+
+# Function to merge the result files of a sharded exhaustive run or search into one report
+def run_merge_command(args):
+    try:
+        records, report = merge_shards(args.shards)
+    except (OSError, ValueError) as error:
+        raise SystemExit(f"Cannot merge shards: {error}")
+    output = open(args.output, 'w') if args.output != '-' else sys.stdout
+    try:
+        write_jsonl(records, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    print(f"{len(records)} variants from {report['shards']} shards", file=sys.stderr)
+
+
+# Function to search one URL under every ECC level and mask and report which resists flips best
+def run_sweep_command(args):
+    def progress(result):
+        print(f"ECC {result['ecc']} mask {result['mask']} (v{result['version']}): {result['hits']} hits, "
+              f"{result['distinct_payloads']} distinct payloads, {result['seconds']:.2f}s"
+              + (" (timed out)" if result['timed_out'] else ""), file=sys.stderr)
+
+    report = run_sweep(args.url, qr_version=args.version, levels=args.ecc, masks=args.masks, strategy=args.strategy,
+                       on_result=progress, k=args.k, adjacency=args.adjacency, evaluator=args.evaluator,
+                       max_characters=args.max_characters, decoder=args.decoder, confirm_decoder=args.confirm_decoder,
+                       order=args.order, time_limit=args.time_limit, validator=build_validator(args, args.url))
+    for level, summary in report['summary'].items():
+        print(f"ECC {level}: fewest hits with mask {summary['fewest_hits_mask']} ({summary['fewest_hits']}), "
+              f"qrcode would pick mask {summary['library_mask']}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+# Function to map what flipping each module of one symbol does and save it as .npy plus a heatmap
+def run_sensitivity_command(args):
+    cache = ResultCache(args.cache, max_entries=args.cache_size) if args.cache else None
+    outcomes, stats = sensitivity_map(args.url, qr_version=args.version, error_correction=ERROR_CORRECTION_LEVELS[args.ecc],
+                                      evaluator=args.evaluator, decoder=args.decoder, batch_size=args.batch_size,
+                                      cache=cache, progress_every=args.progress_every,
+                                      validator=build_validator(args, args.url))
+    if cache is not None:
+        cache.close()
+    size = outcomes.shape[0]
+    prefix = args.output or f"sensitivity_v{(size - 17) // 4}_{args.ecc}"
+    array_path, image_path = save_sensitivity_map(outcomes, prefix)
+    print(f"{stats.candidates_considered} modules evaluated in {stats.elapsed:.2f}s: {outcome_counts(outcomes)}")
+    print(f"Saved {array_path} and {image_path}")
+    if args.stats:
+        print(json.dumps(stats.as_dict(), indent=2))
+
+
+# Function to build the payload validator the command line asks for. Without any validation option
+# that is None (printable ASCII, the fast path) unless always is set.
+def build_validator(args, url, always=False):
+    if not (always or args.require_url or args.allow_domain or args.deny_domain or args.min_similarity is not None):
+        return None
+    return PayloadValidator(url, require_url=args.require_url, schemes=args.scheme, allow=args.allow_domain,
+                            deny=args.deny_domain, min_similarity=args.min_similarity)
+
+
+# Function to collect the robustness check options given on the command line
+def robustness_options(args):
+    return {'variants': args.robustness, 'decoder': args.robustness_decoder, 'strength': args.robustness_strength,
+            'seed': args.robustness_seed}
+
+
+# Function to describe how much of the search space a stopped search covered
+def coverage_text(stats):
+    coverage = stats.coverage()
+    return f"{stats.covered} candidates" if coverage is None else f"{coverage:.1%} of {stats.total} candidates"
+
+
+# Function to parse a version list such as "1-10,15,40"
+def parse_versions(text):
+    versions = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        versions.extend(range(int(first), int(last or first) + 1))
+    return versions
+
+
+# Function to run the benchmark sweep and write a JSON report
+def run_benchmark_command(args):
+    def progress(result):
+        print(f"v{result['version']:>2} {result['ecc']} {result['mode']:<6} {result['candidates_per_second'] or 0:8.1f} "
+              f"candidates/s  {result['url']}", file=sys.stderr)
+
+    report = run_benchmark(versions=parse_versions(args.versions), levels=args.ecc, modes=args.modes, k=args.k,
+                           samples=args.samples, repeats=args.repeats, progress=progress, decoders=args.decoders)
+    write_report(report, args.output)
+    if args.compare:
+        with open(args.compare) as file:
+            comparison = compare_benchmarks(json.load(file), report)
+        print(f"Median speedup against {args.compare}: {comparison['median_speedup']}", file=sys.stderr)
+
+
+# Function to run the localhost search service until interrupted
+def run_service_command(args):
+    try:
+        asyncio.run(serve(host=args.host, port=args.port, unix_path=args.unix, workers=args.workers,
+                          queue_size=args.queue_size, default_deadline=args.deadline))
+    except KeyboardInterrupt:
+        pass
+
+
+# Function to add the decoder backend, candidate order and time budget options shared by the search commands
+def add_decoder_arguments(parser):
+    parser.add_argument('--order', choices=ORDERINGS, default=None,
+                        help="order candidates are visited in; the first hit is returned "
+                             "(default: row-major, or printable with --time-limit)")
+    parser.add_argument('--time-limit', type=float, default=None, metavar='SECONDS',
+                        help="stop each search after this long and report what it covered")
+    parser.add_argument('--decoder', choices=tuple(DECODERS) + ('auto',), default='pyzbar',
+                        help="backend that reads candidates; auto times them and uses the cheapest")
+    parser.add_argument('--confirm-decoder', choices=tuple(DECODERS), default=None,
+                        help="second backend that must agree before a hit counts")
+
+
+# Function to add the options deciding which decoded payloads count as hits
+def add_validator_arguments(parser):
+    parser.add_argument('--require-url', action='store_true',
+                        help="only count payloads that parse as URLs with a valid host and an allowed scheme")
+    parser.add_argument('--scheme', nargs='+', default=['http', 'https'], help="schemes --require-url accepts")
+    parser.add_argument('--allow-domain', action='append', default=[], metavar='DOMAIN',
+                        help="only count payloads whose host is this domain or below it (repeatable)")
+    parser.add_argument('--deny-domain', action='append', default=[], metavar='DOMAIN',
+                        help="never count payloads whose host is this domain or below it (repeatable)")
+    parser.add_argument('--min-similarity', type=float, default=None, metavar='SCORE',
+                        help="only count payloads at least this similar (0..1, homoglyph-aware) to the original")
+
+
+# Function to add the options of the scan-degradation robustness check run on hits
+def add_robustness_arguments(parser):
+    parser.add_argument('--robustness', type=int, default=0, metavar='N',
+                        help="check each hit against N degraded scans (blur, noise, warp, contrast, downscale)")
+    parser.add_argument('--robustness-decoder', choices=('pyzbar', 'opencv'), default='pyzbar',
+                        help="backend that reads the degraded scans")
+    parser.add_argument('--robustness-strength', type=float, default=1.0,
+                        help="scales every degradation; 1.0 is a handheld phone scan")
+    parser.add_argument('--robustness-seed', type=int, default=0, help="seed for the degraded scans")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Search for QR code module flips that change the decoded URL")
+    parser.add_argument('--log-level', default='WARNING', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="DEBUG logs every candidate, INFO logs progress and summaries (default: WARNING)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help="search one URL")
+    search.add_argument('url')
+    search.add_argument('--version', type=int, default=None, help="minimum QR version (default: smallest that fits)")
+    search.add_argument('--k', type=int, default=1, help="number of modules flipped together (default: 1)")
+    search.add_argument('--adjacency', choices=ADJACENCY_MODES, default='any', help="k-flip shape constraint")
+    search.add_argument('--evaluator', choices=('image', 'analytic'), default=None,
+                        help="default: image for single flips, analytic for k-flip searches")
+    search.add_argument('--checkpoint', default=None, help="file to save the search cursor to")
+    search.add_argument('--checkpoint-every', type=int, default=500, help="candidates between checkpoints")
+    search.add_argument('--resume', action='store_true', help="continue from --checkpoint if it exists")
+    search.add_argument('--cache', default=None, help="SQLite file for the persistent flip result cache")
+    search.add_argument('--cache-size', type=int, default=1_000_000, help="maximum cached flip results (LRU)")
+    search.add_argument('--codeword', action='store_true',
+                        help="search byte substitutions in codeword space instead of flipping modules blindly")
+    search.add_argument('--max-characters', type=int, default=2, help="bytes substituted at once with --codeword")
+    search.add_argument('--workers', type=int, default=None, metavar='N',
+                        help="spread a single-flip search over N processes (0: one per CPU core)")
+    search.add_argument('--shard', default=None, metavar='i/N',
+                        help="search only shard i of N and write its first hit to -o; merge picks the overall first")
+    search.add_argument('-o', '--output', default=None, help="JSONL file for the shard's hit (with --shard)")
+    add_decoder_arguments(search)
+    add_validator_arguments(search)
+    add_robustness_arguments(search)
+    search.add_argument('--progress-every', type=float, default=None, metavar='SECONDS',
+                        help="log a progress line at INFO level this often")
+    search.add_argument('--stats', action='store_true', help="print the search counters and stage timings as JSON")
+    search.set_defaults(handler=run_search)
+
+    batch = commands.add_parser('batch', help="stream many URLs, JSONL in and JSONL out")
+    batch.add_argument('input', nargs='?', default='-', help="URL list or JSONL file (default: stdin)")
+    batch.add_argument('-o', '--output', default='-', help="JSONL results file (default: stdout)")
+    batch.add_argument('--packed', default=None, metavar='DIR',
+                       help="also keep every hit as a bit-packed result collection in DIR/<line number>")
+    batch.add_argument('--k', type=int, default=1, help="number of modules flipped together (default: 1)")
+    batch.add_argument('--adjacency', choices=ADJACENCY_MODES, default='any', help="k-flip shape constraint")
+    batch.add_argument('--evaluator', choices=('image', 'analytic'), default=None,
+                       help="default: image for single flips, analytic for k-flip searches")
+    batch.add_argument('--cache', default=None, help="SQLite file for the persistent flip result cache")
+    batch.add_argument('--cache-size', type=int, default=1_000_000, help="maximum cached flip results (LRU)")
+    add_decoder_arguments(batch)
+    add_validator_arguments(batch)
+    batch.set_defaults(handler=run_batch_command)
+
+    exhaustive = commands.add_parser('exhaustive', help="stream every distinct variant of one URL as JSONL")
+    exhaustive.add_argument('url')
+    exhaustive.add_argument('-o', '--output', default='-', help="JSONL results file (default: stdout)")
+    exhaustive.add_argument('--packed', default=None, metavar='DIR',
+                            help="write a bit-packed, memory-mappable result collection to DIR instead of JSONL")
+    exhaustive.add_argument('--strategy', choices=STRATEGIES, default='single')
+    exhaustive.add_argument('--version', type=int, default=None, help="minimum QR version (default: smallest that fits)")
+    exhaustive.add_argument('--k', type=int, default=2, help="modules flipped together with --strategy k")
+    exhaustive.add_argument('--adjacency', choices=ADJACENCY_MODES, default='any', help="k-flip shape constraint")
+    exhaustive.add_argument('--evaluator', choices=('image', 'analytic'), default=None,
+                            help="default: image for single flips, analytic for k-flip searches")
+    exhaustive.add_argument('--max-characters', type=int, default=2, help="bytes substituted at once with codeword")
+    exhaustive.add_argument('--keep-duplicates', action='store_true', help="report every flip set, not every payload")
+    exhaustive.add_argument('--shard', default=None, metavar='i/N',
+                            help="search only shard i of N (stats go to a .stats.json beside -o); combine with merge")
+    exhaustive.add_argument('--progress-every', type=float, default=None, metavar='SECONDS',
+                            help="log a progress line at INFO level this often")
+    exhaustive.add_argument('--stats', action='store_true', help="print the search counters and stage timings as JSON")
+    add_decoder_arguments(exhaustive)
+    add_validator_arguments(exhaustive)
+    add_robustness_arguments(exhaustive)
+    exhaustive.set_defaults(handler=run_exhaustive_command)
+
+    merge = commands.add_parser('merge', help="combine the outputs of a sharded exhaustive run or search")
+    merge.add_argument('shards', nargs='+', help="shard JSONL files, each with its .stats.json beside it")
+    merge.add_argument('-o', '--output', default='-', help="merged JSONL results file (default: stdout)")
+    merge.add_argument('--report', default=None, help="JSON file for the merged identity and stats")
+    merge.set_defaults(handler=run_merge_command)
+
+    sweep = commands.add_parser('sweep', help="search one URL under every ECC level and mask pattern")
+    sweep.add_argument('url')
+    sweep.add_argument('-o', '--output', default=None, help="JSON report path")
+    sweep.add_argument('--strategy', choices=STRATEGIES, default='single')
+    sweep.add_argument('--version', type=int, default=None, help="minimum QR version (default: smallest that fits)")
+    sweep.add_argument('--ecc', nargs='+', choices=tuple(ERROR_CORRECTION_LEVELS), default=list(ERROR_CORRECTION_LEVELS))
+    sweep.add_argument('--masks', nargs='+', type=int, choices=MASK_PATTERNS, default=list(MASK_PATTERNS))
+    sweep.add_argument('--k', type=int, default=2, help="modules flipped together with --strategy k")
+    sweep.add_argument('--adjacency', choices=ADJACENCY_MODES, default='any', help="k-flip shape constraint")
+    sweep.add_argument('--evaluator', choices=('image', 'analytic'), default=None,
+                       help="default: image for single flips, analytic for k-flip searches")
+    sweep.add_argument('--max-characters', type=int, default=2, help="bytes substituted at once with codeword")
+    add_decoder_arguments(sweep)
+    add_validator_arguments(sweep)
+    sweep.set_defaults(handler=run_sweep_command)
+
+    sensitivity = commands.add_parser('sensitivity', help="map what flipping each module does (.npy and heatmap)")
+    sensitivity.add_argument('url')
+    sensitivity.add_argument('-o', '--output', default=None, metavar='PREFIX',
+                             help="writes PREFIX.npy and PREFIX.png (default: sensitivity_v<version>_<ecc>)")
+    sensitivity.add_argument('--version', type=int, default=None, help="minimum QR version (default: smallest that fits)")
+    sensitivity.add_argument('--ecc', choices=tuple(ERROR_CORRECTION_LEVELS), default='L')
+    sensitivity.add_argument('--evaluator', choices=('image', 'analytic'), default='analytic',
+                             help="analytic decodes on codewords without images and is by far the fastest")
+    sensitivity.add_argument('--decoder', choices=tuple(DECODERS) + ('auto',), default='auto',
+                             help="backend for --evaluator image; auto times them and uses the cheapest")
+    sensitivity.add_argument('--batch-size', type=int, default=1,
+                             help="with --evaluator image, decode this many modules per mosaic (default: 1, no mosaic)")
+    sensitivity.add_argument('--cache', default=None, help="SQLite file for the persistent flip result cache")
+    sensitivity.add_argument('--cache-size', type=int, default=1_000_000, help="maximum cached flip results (LRU)")
+    sensitivity.add_argument('--progress-every', type=float, default=None, metavar='SECONDS',
+                             help="log a progress line at INFO level this often")
+    sensitivity.add_argument('--stats', action='store_true', help="print the counters and stage timings as JSON")
+    add_validator_arguments(sensitivity)
+    sensitivity.set_defaults(handler=run_sensitivity_command)
+
+    bench = commands.add_parser('bench', help="benchmark encode/render/decode/validate across versions and modes")
+    bench.add_argument('-o', '--output', default='benchmark.json', help="JSON report path")
+    bench.add_argument('--versions', default='1-40', help="versions to sweep, e.g. 1-10,15,40")
+    bench.add_argument('--ecc', nargs='+', choices=tuple(ERROR_CORRECTION_LEVELS), default=list(ERROR_CORRECTION_LEVELS))
+    bench.add_argument('--modes', nargs='+', choices=BENCHMARK_MODES, default=list(BENCHMARK_MODES))
+    bench.add_argument('--k', type=int, default=3, help="modules flipped together in the k mode")
+    bench.add_argument('--samples', type=int, default=50, help="flip sets (k mode: search evaluations) timed per configuration")
+    bench.add_argument('--repeats', type=int, default=5, help="encode repetitions (and k-flip search runs) per configuration")
+    bench.add_argument('--decoders', nargs='+', choices=tuple(DECODERS), default=list(DECODERS),
+                       help="decoder backends to measure throughput for")
+    bench.add_argument('--compare', default=None, help="earlier report to compute speedups against")
+    bench.set_defaults(handler=run_benchmark_command)
+
+    service = commands.add_parser('serve', help="run a localhost HTTP search service (POST /search, GET /metrics)")
+    service.add_argument('--host', default='127.0.0.1', help="loopback address to listen on")
+    service.add_argument('--port', type=int, default=8765)
+    service.add_argument('--unix', default=None, help="listen on this Unix socket path instead of TCP")
+    service.add_argument('--workers', type=int, default=2, help="search worker processes")
+    service.add_argument('--queue-size', type=int, default=64, help="queued jobs before requests get 503")
+    service.add_argument('--deadline', type=float, default=60.0, help="default seconds a request waits for its result")
+    service.set_defaults(handler=run_service_command)
+    return parser
+
+
+# Main program
+if __name__ == "__main__":
+    arguments = build_parser().parse_args()
+    logging.basicConfig(level=arguments.log_level, format='%(asctime)s %(levelname)s %(message)s', stream=sys.stderr)
+    arguments.handler(arguments)
@@ -2,25 +2,13 @@ import qrcode
 import cv2
 import numpy as np
 from pyzbar.pyzbar import decode
+import logging
 import os
 import time
-import csv
 
-# Function to record the execution time and QR version number and save it to a CSV file
-def record_execution_time_to_csv(code_name, start_time, end_time, qr_version, csv_filename="execution_times.csv"):
-    execution_time = end_time - start_time
-    file_exists = os.path.isfile(csv_filename)
-
-    with open(csv_filename, mode='a', newline='') as file:
-        writer = csv.writer(file)
-
-        if not file_exists:
-            writer.writerow(["Code Block", "Execution Time (seconds)", "QR Version"])
-
-        writer.writerow([code_name, execution_time, qr_version])
-
-    print(f"Execution time: {execution_time:.2f} seconds, QR Version: {qr_version}")
-    return execution_time
+from qr_engine import fixed_position_mask
+from qr_stats import logger
+from qr_structure import candidate_index, function_pattern_mask, modules_from_pixels
 
 # Function to create a QR code from a URL and save it
 def create_qr_code(url, qr_version=15, filename='qrcode.png'):
@@ -45,11 +33,10 @@ def qr_code_to_binary_array(qr_code_path, border, box_size):
     # Convert the cropped image to binary (0 and 1)
     _, thresh = cv2.threshold(img_cropped, 127, 1, cv2.THRESH_BINARY)
 
-    print(thresh, "\n", thresh.shape)
     return thresh
 
-# Function to convert the binary 2D array back to QR code
-def binary_array_to_qr_code(binary_array, output_path='modified_qr.png', border=4, box_size=10):
+# Function to convert the binary 2D array back to a grayscale QR code image in memory
+def binary_array_to_image(binary_array, border=4, box_size=10):
     reshaped_array = binary_array * 255  # Scale binary values back to 0-255
 
     # Re-add the border
@@ -58,93 +45,88 @@ def binary_array_to_qr_code(binary_array, output_path='modified_qr.png', border=
         dtype=np.uint8) * 255
     border_array[border * box_size: -border * box_size, border * box_size: -border * box_size] = reshaped_array
 
+    return border_array
+
+# Function to convert the binary 2D array back to QR code
+def binary_array_to_qr_code(binary_array, output_path='modified_qr.png', border=4, box_size=10):
+    border_array = binary_array_to_image(binary_array, border=border, box_size=box_size)
+
     # Save the modified QR code image
     cv2.imwrite(output_path, border_array)
 
-# Function to decode a QR code image to get the URL
-def decode_qr_code(qr_code_path):
-    img = cv2.imread(qr_code_path)
+# Function to decode a grayscale QR code image (numpy array) to get the URL
+def decode_qr_image(img):
     decoded_objects = decode(img)
     for obj in decoded_objects:
         return obj.data.decode('utf-8')
     return None
 
-# Function to find a modified URL by flipping bits
-def find_modified_qr_code_url(original_url, fixed_positions, qr_version=4, output_folder='modified_qr_codes', box_size=10):
+# Function to decode a QR code image to get the URL
+def decode_qr_code(qr_code_path):
+    img = cv2.imread(qr_code_path, cv2.IMREAD_GRAYSCALE)
+    return decode_qr_image(img)
+
+# Function to find a modified URL by flipping bits. With a time_limit (seconds) the search stops
+# checking candidates once it is spent and returns (None, None) after reporting how many it got through.
+def find_modified_qr_code_url(original_url, fixed_positions, qr_version=4, output_folder='modified_qr_codes', box_size=10,
+                              save_artifacts=False, time_limit=None):
+    deadline = time.perf_counter() + time_limit if time_limit is not None else None
     border_size = 4  # Border size in boxes
     create_qr_code(original_url, qr_version)
     binary_array = qr_code_to_binary_array('qrcode.png', border_size, box_size)
 
-    # Iterate over the 2D array and modify white squares (10x10 blocks)
-    for row in range(0, binary_array.shape[0], box_size):
-        for col in range(0, binary_array.shape[1], box_size):
-            position = (row // box_size, col // box_size)
-            if position not in fixed_positions and np.all(binary_array[row:row + box_size, col:col + box_size] == 1):
-                modified_array = binary_array.copy()
-                modified_array[row:row + box_size, col:col + box_size] = 0  # Flip the block to black
-                modified_qr_filename = os.path.join(output_folder, f'modified_qr_{row}_{col}.png')
-                binary_array_to_qr_code(modified_array, modified_qr_filename, border=border_size, box_size=box_size)
-                modified_url = decode_qr_code(modified_qr_filename)
-                print(f"Modified URL from QR Code with block at ({row}, {col}) flipped: {modified_url}")
-                if modified_url and modified_url != original_url and is_human_readable(modified_url):
-                    return modified_url, position  # Return the modified URL and the position of the flip
+    # Reduce the 10x10 blocks to one value per module once, then only visit free white modules
+    module_array = modules_from_pixels(binary_array, box_size)
+
+    # One bordered image for the whole search: each candidate blackens its block in place and the
+    # block is whitened again after decoding, so no image is allocated per candidate
+    modified_image = binary_array_to_image(binary_array, border=border_size, box_size=box_size)
+    offset = border_size * box_size
+    # The symbol grows past its version when the URL does not fit, so a mask made for that version is rebuilt for
+    # the grid actually produced; (row, col) position lists from older callers are turned into a mask
+    if isinstance(fixed_positions, np.ndarray) and fixed_positions.shape != module_array.shape:
+        fixed_positions = None
+    candidates = candidate_index(module_array, fixed_position_mask(fixed_positions, module_array.shape[0])).tolist()
+    for checked, position in enumerate(candidates):
+        if deadline is not None and time.perf_counter() >= deadline:
+            print(f"Time limit of {time_limit} seconds reached after checking {checked} of {len(candidates)} "
+                  f"candidates.")
+            return None, None
+        position = tuple(position)
+        row, col = position[0] * box_size, position[1] * box_size
+        block = modified_image[offset + row:offset + row + box_size, offset + col:offset + col + box_size]
+        block[:] = 0  # Flip the block to black
+        if save_artifacts:
+            modified_qr_filename = os.path.join(output_folder, f'modified_qr_{row}_{col}.png')
+            cv2.imwrite(modified_qr_filename, modified_image)
+        modified_url = decode_qr_image(modified_image)  # Decode straight from memory, no PNG round-trip
+        block[:] = 255  # Revert the flip; candidates are always white blocks
+        logger.debug("Modified URL from QR Code with block at (%d, %d) flipped: %s", row, col, modified_url)
+        if modified_url and modified_url != original_url and is_human_readable(modified_url):
+            return modified_url, position  # Return the modified URL and the position of the flip
     return None, None
 
-# Function to check if the URL is human-readable (simplified check)
+# Function to check if the URL is human-readable: printable ASCII only, checked in C rather than per character
 def is_human_readable(url):
-    try:
-        return all(32 <= ord(char) <= 126 for char in url)  # Check if all characters are printable ASCII
-    except Exception:
-        return False
+    return url.isascii() and url.isprintable()
 
 # Main program
 if __name__ == "__main__":
+    # Per-candidate detail is logged at DEBUG; set LOG_LEVEL=DEBUG to see every flip
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper(), format='%(message)s')
     original_url = "https://www.hello.com"
 
-    # Adjusted fixed positions to ignore the border completely
-    fixed_positions = [
-        # Top-left finder pattern
-        (0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (0, 6), (0, 7),
-        (1, 0), (1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (1, 6), (1, 7),
-        (2, 0), (2, 1), (2, 2), (2, 3), (2, 4), (2, 5), (2, 6), (2, 7),
-        (3, 0), (3, 1), (3, 2), (3, 3), (3, 4), (3, 5), (3, 6), (3, 7),
-        (4, 0), (4, 1), (4, 2), (4, 3), (4, 4), (4, 5), (4, 6), (4, 7),
-        (5, 0), (5, 1), (5, 2), (5, 3), (5, 4), (5, 5), (5, 6), (5, 7),
-        (6, 0), (6, 1), (6, 2), (6, 3), (6, 4), (6, 5), (6, 6), (6, 7),
-        (7, 0), (7, 1), (7, 2), (7, 3), (7, 4), (7, 5), (7, 6), (7, 7),
-
-        # Top-right finder pattern
-        (0, 17), (0, 18), (0, 19), (0, 20), (0, 21), (0, 22), (0, 23), (0, 24),
-        (1, 17), (1, 18), (1, 19), (1, 20), (1, 21), (1, 22), (1, 23), (1, 24),
-        (2, 17), (2, 18), (2, 19), (2, 20), (2, 21), (2, 22), (2, 23), (2, 24),
-        (3, 17), (3, 18), (3, 19), (3, 20), (3, 21), (3, 22), (3, 23), (3, 24),
-        (4, 17), (4, 18), (4, 19), (4, 20), (4, 21), (4, 22), (4, 23), (4, 24),
-        (5, 17), (5, 18), (5, 19), (5, 20), (5, 21), (5, 22), (5, 23), (5, 24),
-        (6, 17), (6, 18), (6, 19), (6, 20), (6, 21), (6, 22), (6, 23), (6, 24),
-        (7, 17), (7, 18), (7, 19), (7, 20), (7, 21), (7, 22), (7, 23), (7, 24),
-
-        # Bottom-left finder pattern
-        (17, 0), (17, 1), (17, 2), (17, 3), (17, 4), (17, 5), (17, 6), (17, 7),
-        (18, 0), (18, 1), (18, 2), (18, 3), (18, 4), (18, 5), (18, 6), (18, 7),
-        (19, 0), (19, 1), (19, 2), (19, 3), (19, 4), (19, 5), (19, 6), (19, 7),
-        (20, 0), (20, 1), (20, 2), (20, 3), (20, 4), (20, 5), (20, 6), (20, 7),
-        (21, 0), (21, 1), (21, 2), (21, 3), (21, 4), (21, 5), (21, 6), (21, 7),
-        (22, 0), (22, 1), (22, 2), (22, 3), (22, 4), (22, 5), (22, 6), (22, 7),
-        (23, 0), (23, 1), (23, 2), (23, 3), (23, 4), (23, 5), (23, 6), (23, 7),
-        (24, 0), (24, 1), (24, 2), (24, 3), (24, 4), (24, 5), (24, 6), (24, 7),
-
-        # Timing patterns
-        (6, 7), (7, 7), (8, 7), (9, 7), (10, 7), (11, 7), (12, 7),
-        (13, 7), (14, 7), (15, 7), (16, 7), (17, 7), (18, 7), (19, 7), (20, 7),
-        (7, 6), (7, 8), (7, 9), (7, 10), (7, 11), (7, 12), (7, 13),
-        (7, 14), (7, 15), (7, 16), (7, 17), (7, 18), (7, 19), (7, 20),
-    ]
-
-    start_time = time.time()
-    modified_url, position = find_modified_qr_code_url(original_url, fixed_positions, qr_version=15)
-    end_time = time.time()
-
-    record_execution_time_to_csv("Find Modified QR Code URL", start_time, end_time, qr_version=15)
+    # Reserved modules (finders, timing, alignment, format and version information) for the version in use
+    fixed_positions = function_pattern_mask(15)
+
+    start_time = time.perf_counter()
+    time_limit = 300  # Seconds the search may run before giving up
+    modified_url, position = find_modified_qr_code_url(original_url, fixed_positions, qr_version=15,
+                                                       time_limit=time_limit)
+    end_time = time.perf_counter()
+
+    # One wall-clock number per run; `python qr_cli.py bench` gives per-stage timings with repeats
+    print(f"Execution time: {end_time - start_time:.2f} seconds, QR Version: 15")
 
     if modified_url:
         print(f"Modified URL: {modified_url}")
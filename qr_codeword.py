@@ -0,0 +1,201 @@
+import itertools
+import time
+
+import numpy as np
+import qrcode
+from qrcode import util
+
+from qr_decoders import resolve_decoders
+from qr_engine import GridEvaluator, classify_payload, create_qr_matrix, fixed_position_mask
+from qr_shard import shard_slice
+from qr_stats import SearchStats, logger
+from qr_structure import URL_CHARACTERS, AnalyticEvaluator, gf_scale, rs_unit_remainders, segment_layout
+
+
+# Function to list the non-zero submasks of a bit mask, largest first
+def submasks(mask):
+    subset = mask
+    while subset:
+        yield subset
+        subset = (subset - 1) & mask
+
+
+# Searches in codeword space instead of module space. A white -> black flip toggles one bit of one
+# codeword, so the bytes of the URL a flip set can produce are known before anything is rendered:
+#  1. every payload byte's reachable values are its value XOR a subset of its white, free module bits,
+#     kept only if they are URL characters
+#  2. for a substitution, the block's error correction change is computed from the linearity of RS
+#     (rs_unit_remainders), so nothing is re-encoded; each EC codeword
+#     that must change is either reachable by flips in its own modules or left as a symbol error
+#  3. a substitution survives if the errors left over fit the block's correction capacity, since the
+#     decoder then corrects the flipped symbol to the new codeword instead of back to the old one
+# Only survivors are mapped back to module flips and handed to a decoder.
+class CodewordSearch:
+    def __init__(self, grid, qr, fixed_positions=None, charset=URL_CHARACTERS):
+        self.analytic_evaluator = AnalyticEvaluator(grid, qr.version, qr.error_correction)
+        layout = self.analytic_evaluator.layout
+        self.blocks = layout.blocks
+        self.charset = charset
+        free = (grid == 1) & ~fixed_position_mask(fixed_positions, grid.shape[0])
+
+        # (block, index) -> the 8 modules of that codeword (most significant bit first) and the mask
+        # of bits whose module can still be flipped
+        self.modules = {}
+        self.flippable = {}
+        for stream_position, key in enumerate(layout.stream_layout):
+            modules = [tuple(module) for module in layout.order[stream_position * 8: stream_position * 8 + 8].tolist()]
+            self.modules[key] = modules
+            self.flippable[key] = sum(0x80 >> bit for bit, (row, col) in enumerate(modules) if free[row, col])
+        self.ec_flippable = [np.array([self.flippable[(number, index)]
+                                       for index in range(block.data_count, block.total_count)], dtype=np.uint8)
+                             for number, block in enumerate(self.blocks)]
+
+        # Data codewords in segment order (all data codewords of block 0, then block 1, ...)
+        self.data_keys = [(number, index) for number, block in enumerate(self.blocks)
+                          for index in range(block.data_count)]
+        data_codewords = [codeword for data in self.analytic_evaluator.base_data for codeword in data]
+
+        # Every payload byte carried in a byte-mode segment, as (first data bit, value)
+        self.characters = []
+        for mode, start, count in segment_layout(data_codewords, qr.version) or ():
+            if mode != util.MODE_8BIT_BYTE:
+                continue  # Numeric and alphanumeric characters do not map to whole bytes
+            for offset in range(start, start + 8 * count, 8):
+                value = 0
+                for bit in range(offset, offset + 8):
+                    value = (value << 1) | (data_codewords[bit // 8] >> (7 - bit % 8)) & 1
+                self.characters.append((offset, value))
+
+    # The XOR mask over a character's 8 bits that its free modules can toggle
+    def character_flippable(self, offset):
+        mask = 0
+        for bit in range(offset, offset + 8):
+            key = self.data_keys[bit // 8]
+            if self.flippable[key] & (0x80 >> (bit % 8)):
+                mask |= 0x80 >> (bit - offset)
+        return mask
+
+    # Substitutions for one character: (character number, XOR) for every URL-legal reachable byte
+    def character_options(self, number):
+        offset, value = self.characters[number]
+        options = [(value ^ xor, xor) for xor in submasks(self.character_flippable(offset))
+                   if value ^ xor in self.charset]
+        return [(number, xor) for _, xor in sorted(options)]
+
+    # Every substitution of up to max_characters characters, in payload order
+    def substitutions(self, max_characters=1):
+        options = [self.character_options(number) for number in range(len(self.characters))]
+        for size in range(1, max_characters + 1):
+            for numbers in itertools.combinations(range(len(self.characters)), size):
+                yield from itertools.product(*(options[number] for number in numbers))
+
+    # How many substitutions substitutions(max_characters) generates, without generating them: the sum
+    # over sizes of the elementary symmetric sums of the per-character option counts
+    def substitution_count(self, max_characters=1):
+        sums = [1] + [0] * max_characters
+        for number in range(len(self.characters)):
+            options = len(self.character_options(number))
+            for size in range(max_characters, 0, -1):
+                sums[size] += sums[size - 1] * options
+        return sum(sums[1:])
+
+    # Map a substitution to module flips, or None if some block would be left with more symbol
+    # errors than it can correct. Returns (positions, errors left for the decoder to correct).
+    def flips_for(self, substitution):
+        changes = {}
+        for number, xor in substitution:
+            offset, _ = self.characters[number]
+            for bit in range(8):
+                if xor & (0x80 >> bit):
+                    data_bit = offset + bit
+                    key = self.data_keys[data_bit // 8]
+                    changes[key] = changes.get(key, 0) ^ (0x80 >> (data_bit % 8))
+
+        positions, errors = [], 0
+        for number in sorted({block for block, _ in changes}):
+            block = self.blocks[number]
+            ec_count = block.total_count - block.data_count
+            units = rs_unit_remainders(block.data_count, ec_count)
+            ec_change = np.zeros(ec_count, dtype=np.uint8)
+            for (block_number, index), xor in changes.items():
+                if block_number == number:
+                    ec_change ^= gf_scale(units[index], xor)
+                    positions += self.modules_for((number, index), xor)
+
+            # EC codewords that need a black -> white flip are left for the decoder to correct
+            unreachable = (ec_change & ~self.ec_flippable[number]) != 0
+            block_errors = int(np.count_nonzero(unreachable))
+            if block_errors > ec_count // 2:
+                return None
+            for index in np.flatnonzero((ec_change != 0) & ~unreachable).tolist():
+                positions += self.modules_for((number, block.data_count + index), int(ec_change[index]))
+            errors += block_errors
+        return sorted(positions), errors
+
+    # The modules of a codeword whose bits are set in xor
+    def modules_for(self, key, xor):
+        return [module for bit, module in enumerate(self.modules[key]) if xor & (0x80 >> bit)]
+
+
+# Function to generate every confirmed hit of a CodewordSearch as (substitution ordinal, modified URL,
+# positions). Substitutions of up to max_characters bytes are filtered to what the error correction
+# can absorb, predicted analytically, and only then rendered and confirmed by image_evaluator's
+# decoder. With a shard (see qr_shard) only every count-th substitution is tried. Stops cooperatively
+# once the stats' time budget is spent. validator is a qr_validator.PayloadValidator for the predictions.
+def codeword_hits(search, image_evaluator, original_url, max_characters=1, stats=None, shard=None, validator=None):
+    stats = stats if stats is not None else SearchStats()
+    bounds = shard_slice(shard)
+    if stats.total is None:
+        stats.total = len(range(search.substitution_count(max_characters))[bounds])
+    substitutions = enumerate(search.substitutions(max_characters))
+    for ordinal, substitution in itertools.islice(substitutions, bounds.start, bounds.stop, bounds.step):
+        if stats.out_of_time():
+            return
+        stats.candidates_considered += 1
+        stats.covered += 1
+        start_time = time.perf_counter()
+        mapped = search.flips_for(substitution)
+        start_time = stats.add_time('validate', start_time)
+        if mapped is None:
+            stats.pruned += 1
+            stats.report_progress()
+            continue
+        positions, errors = mapped
+
+        predicted = search.analytic_evaluator.evaluate(positions)
+        start_time = stats.add_time('decode', start_time)
+        logger.debug("Substitution %s: %d flips, %d corrected errors, predicts %s",
+                     substitution, len(positions), errors, predicted)
+        if not classify_payload(stats, predicted, original_url, validator):
+            continue
+
+        stats.decodes_attempted += 1
+        modified_url = image_evaluator.evaluate(positions)
+        stats.add_time('verify', start_time)
+        if modified_url != predicted:
+            stats.unconfirmed_hits += 1
+            continue
+        stats.record_hit()
+        yield ordinal, modified_url, tuple(positions)
+
+
+# Function to find a modified URL by substituting payload bytes in codeword space (see CodewordSearch
+# and codeword_hits); charset limits the bytes substituted in. Returns (url, positions, stats) like
+# find_modified_qr_code_url, including its time_limit and validator behaviour. Substitutions of fewer characters
+# always come first, and they are the likeliest to fit the error correction.
+def find_modified_qr_code_url_codeword(original_url, fixed_positions=None, qr_version=None, max_characters=1,
+                                       charset=URL_CHARACTERS, scale=None, decoder='pyzbar',
+                                       error_correction=qrcode.constants.ERROR_CORRECT_L, progress_every=None,
+                                       time_limit=None, validator=None):
+    stats = SearchStats(progress_every, time_limit=time_limit)
+    start_time = time.perf_counter()
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    search = CodewordSearch(grid, qr, fixed_positions, charset=charset)
+    image_evaluator = GridEvaluator(grid, qr.version, scale=scale)
+    image_evaluator.decoder, _ = resolve_decoders(decoder, None, image_evaluator.render(()))
+    stats.add_time('encode', start_time)
+
+    for _, modified_url, positions in codeword_hits(search, image_evaluator, original_url, max_characters, stats,
+                                                    validator=validator):
+        return modified_url, positions, stats.finish()
+    return None, None, stats.finish()
@@ -0,0 +1,139 @@
+import time
+
+import cv2
+import numpy as np
+
+from qr_structure import decode_grid
+
+
+# Decoder backends. Every backend takes a grayscale uint8 ndarray and offers
+#   decode(img)     -> text of the first symbol, or None
+#   decode_all(img) -> [(text, (left, top, width, height)), ...] for every symbol found
+# `multi` says whether decode_all can find several symbols in one image (needed for decode_mosaic).
+
+
+# pyzbar / zbar: the decoder the scripts have always used
+class PyzbarDecoder:
+    name = 'pyzbar'
+    multi = True
+
+    def __init__(self):
+        from pyzbar.pyzbar import decode  # Needs the zbar shared library, so it is only loaded on use
+        self._decode = decode
+
+    def decode_all(self, img):
+        return [(obj.data.decode('utf-8'), tuple(obj.rect)) for obj in self._decode(img)]
+
+    def decode(self, img):
+        for obj in self._decode(img):
+            return obj.data.decode('utf-8')
+        return None
+
+
+# OpenCV's built-in detector and decoder
+class OpenCVDecoder:
+    name = 'opencv'
+    multi = True
+
+    def __init__(self):
+        self.detector = cv2.QRCodeDetector()
+
+    def decode_all(self, img):
+        found, texts, points, _ = self.detector.detectAndDecodeMulti(img)
+        if not found:
+            return []
+        results = []
+        for text, corners in zip(texts, points):
+            if text:
+                left, top = corners.min(axis=0)
+                right, bottom = corners.max(axis=0)
+                results.append((text, (int(left), int(top), int(right - left), int(bottom - top))))
+        return results
+
+    def decode(self, img):
+        text, _, _ = self.detector.detectAndDecode(img)
+        return text or None
+
+
+# Samples a clean, axis-aligned render (as made by qr_engine.render_grid) straight back to its module
+# grid and decodes it with qr_structure.decode_grid: no finder search, no perspective fit, no binarizer.
+# It reads exactly what was drawn, so it is the cheapest backend but says nothing about camera scans.
+class GridDecoder:
+    name = 'grid'
+    multi = False
+
+    # Recover the module grid (1 = white, 0 = black) from the image, or None if it does not look like a symbol
+    def sample(self, img):
+        dark = img < 128
+        rows = np.flatnonzero(dark.any(axis=1))
+        cols = np.flatnonzero(dark.any(axis=0))
+        if len(rows) == 0:
+            return None
+        top, left, width = rows[0], cols[0], cols[-1] - cols[0] + 1
+
+        # The top-left finder pattern is 7 modules of dark along its top edge
+        edge = dark[top, left:]
+        run = int(np.argmin(edge)) if not edge.all() else len(edge)
+        module = run / 7
+        size = int(round(width / module)) if module else 0
+        if size < 21 or (size - 17) % 4:
+            return None
+        centres = ((np.arange(size) + 0.5) * module).astype(int)
+        samples = dark[np.ix_(top + centres, left + centres)]
+        return np.where(samples, 0, 1).astype(np.uint8)
+
+    def decode(self, img):
+        grid = self.sample(img)
+        return decode_grid(grid) if grid is not None else None
+
+    def decode_all(self, img):
+        text = self.decode(img)
+        return [(text, (0, 0, img.shape[1], img.shape[0]))] if text is not None else []
+
+
+DECODERS = {'pyzbar': PyzbarDecoder, 'opencv': OpenCVDecoder, 'grid': GridDecoder}
+
+
+# Function to build a decoder backend by name
+def get_decoder(name):
+    if name not in DECODERS:
+        raise ValueError(f"Unknown decoder backend: {name}")
+    return DECODERS[name]()
+
+
+# Function to build every backend that can load here (pyzbar needs libzbar installed)
+def available_decoders(names=tuple(DECODERS)):
+    decoders = []
+    for name in names:
+        try:
+            decoders.append(get_decoder(name))
+        except ImportError:
+            continue
+    return decoders
+
+
+# Function to time each decoder on a sample image and return them cheapest first.
+# Backends that cannot read the sample at all go last, whatever their speed.
+def fastest_first(decoders, sample_img, repeats=5):
+    timings = []
+    for decoder in decoders:
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            text = decoder.decode(sample_img)
+        timings.append((text is None, (time.perf_counter() - start_time) / repeats, decoder))
+    timings.sort(key=lambda timing: timing[:2])
+    return [decoder for _, _, decoder in timings]
+
+
+# Function to pick the (primary, confirming) decoders for a search. decoder='auto' times the available
+# backends on sample_img and takes the cheapest as primary and the next one to confirm hits, unless
+# confirm_decoder names one. confirm_decoder=None with a named decoder means hits are not cross-checked.
+def resolve_decoders(decoder='pyzbar', confirm_decoder=None, sample_img=None):
+    if decoder == 'auto':
+        ranked = fastest_first(available_decoders(), sample_img)
+        primary = ranked[0]
+        if confirm_decoder is None:
+            return primary, ranked[1] if len(ranked) > 1 else None
+        return primary, get_decoder(confirm_decoder)
+    primary = get_decoder(decoder)
+    return primary, get_decoder(confirm_decoder) if confirm_decoder else None
@@ -0,0 +1,394 @@
+import qrcode
+import cv2
+import numpy as np
+import math
+import os
+import time
+
+from qr_checkpoint import checkpoint_identity, load_checkpoint, save_checkpoint
+from qr_decoders import get_decoder, resolve_decoders
+from qr_ordering import order_candidates, scheduled_order
+from qr_shard import shard_slice
+from qr_stats import SearchStats, logger
+from qr_structure import AnalyticEvaluator, candidate_index, function_pattern_mask, read_format_info
+
+
+# Smallest pixels-per-module the decoder reliably accepts, as (highest QR version, scale) pairs.
+# Bigger symbols get a little more headroom because the finder patterns are relatively smaller.
+DECODE_SCALES = ((24, 3), (40, 4))
+
+
+# Function to create a QR code from a URL and return its module grid (1 = white, 0 = black, no border)
+def create_qr_matrix(url, qr_version=None, error_correction=qrcode.constants.ERROR_CORRECT_L):
+    qr = qrcode.QRCode(
+        version=qr_version,  # Controls the size of the QR Code matrix
+        error_correction=error_correction,  # About 7% or less error can be corrected at ERROR_CORRECT_L
+        border=0,  # The border is added back only when rendering for the decoder
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    # One cell per module, using the same 1 = white / 0 = black convention as qr_code_to_binary_array
+    grid = np.where(np.array(qr.modules, dtype=bool), 0, 1).astype(np.uint8)
+    return grid, qr
+
+
+# Function to pick the smallest rendering scale (pixels per module) the decoder accepts for a version
+def decode_scale(qr_version):
+    for max_version, scale in DECODE_SCALES:
+        if qr_version <= max_version:
+            return scale
+    return DECODE_SCALES[-1][1]
+
+
+# Function to upscale a module grid to a grayscale image with a white quiet zone for decoding
+def render_grid(grid, scale, border=4):
+    size = grid.shape[0]
+    img = np.full(((size + 2 * border) * scale, (size + 2 * border) * scale), 255, dtype=np.uint8)
+    img[border * scale: (border + size) * scale, border * scale: (border + size) * scale] = \
+        np.repeat(np.repeat(grid, scale, axis=0), scale, axis=1) * 255
+    return img
+
+
+# The pyzbar backend used wherever no decoder is given. It is built on first use, so importing this
+# module (and everything that imports it) works without the zbar shared library.
+_pyzbar_decoder = None
+
+
+# Function to get the shared pyzbar backend, loading it on the first call
+def default_decoder():
+    global _pyzbar_decoder
+    if _pyzbar_decoder is None:
+        _pyzbar_decoder = get_decoder('pyzbar')
+    return _pyzbar_decoder
+
+
+# Function to decode a grayscale QR code image (numpy array) to get the URL
+def decode_qr_image(img):
+    return default_decoder().decode(img)
+
+
+# Function to decode many same-sized QR images with one decoder call by tiling them into a mosaic.
+# Each image already carries its own quiet zone, so neighbouring tiles never touch. decoder is a
+# qr_decoders backend that can find several symbols per image; None means pyzbar as before.
+def decode_mosaic(images, fallback=True, decoder=None):
+    decoder = decoder if decoder is not None else default_decoder()
+    tile_height, tile_width = images[0].shape
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+
+    mosaic = np.full((rows * tile_height, columns * tile_width), 255, dtype=np.uint8)
+    for index, img in enumerate(images):
+        top, left = (index // columns) * tile_height, (index % columns) * tile_width
+        mosaic[top:top + tile_height, left:left + tile_width] = img
+
+    # Map every symbol back to its tile through the centre of its bounding rect
+    symbols = decoder.decode_all(mosaic)
+    results = [None] * len(images)
+    for text, (left, top, width, height) in symbols:
+        center_x = left + width // 2
+        center_y = top + height // 2
+        index = (center_y // tile_height) * columns + center_x // tile_width
+        if index < len(images) and results[index] is None:
+            results[index] = text
+
+    # Tiles that came back unreadable get a second chance on their own
+    if fallback:
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = decoder.decode(images[index])
+    return results
+
+
+# Function to check if the URL is human-readable: printable ASCII only, checked in C rather than per character
+def is_human_readable(url):
+    return url.isascii() and url.isprintable()
+
+
+# Function to sort a decoded payload into the stats counters; True only for a new, readable URL.
+# With a qr_validator.PayloadValidator the payload must also pass its checks; printable payloads it
+# turns down count as rejected_payloads. An empty payload counts as a decode failure, as it always did.
+def classify_payload(stats, modified_url, original_url, validator=None):
+    if not modified_url:
+        stats.decode_failures += 1
+        return False
+    if modified_url == original_url:
+        stats.unchanged_payloads += 1
+        return False
+    if validator is None:
+        if not is_human_readable(modified_url):
+            stats.unreadable_payloads += 1
+            return False
+        return True
+    verdict = validator.validate(modified_url)
+    if not verdict['printable']:
+        stats.unreadable_payloads += 1
+    elif not verdict['accepted']:
+        stats.rejected_payloads += 1
+    return verdict['accepted']
+
+
+# One bordered image of a module grid, rendered once and reused for every candidate: flip() blackens
+# the pixel blocks of the given modules in place and revert() whitens exactly those blocks again,
+# so evaluating a candidate allocates no full-size image. Only white modules are touched.
+class RenderBuffer:
+    def __init__(self, grid, scale, border=4):
+        self.grid = grid
+        self.scale = scale
+        self.offset = border * scale
+        self.image = render_grid(grid, scale, border)
+        self.touched = []
+
+    # Flip the given modules to black in place and return the shared image (valid until revert)
+    def flip(self, positions):
+        scale, offset = self.scale, self.offset
+        for row, col in positions:
+            if self.grid[row, col]:
+                top, left = offset + row * scale, offset + col * scale
+                self.image[top:top + scale, left:left + scale] = 0
+                self.touched.append((top, left))
+        return self.image
+
+    # Whiten the blocks changed by the last flip()
+    def revert(self):
+        scale = self.scale
+        for top, left in self.touched:
+            self.image[top:top + scale, left:left + scale] = 255
+        self.touched.clear()
+
+
+# Evaluates flips on a module grid, upscaling only when the image is handed to the decoder.
+# decoder is a qr_decoders backend; None keeps pyzbar through decode_qr_image.
+class GridEvaluator:
+    def __init__(self, grid, qr_version, scale=None, border=4, decoder=None):
+        self.grid = grid
+        self.qr_version = qr_version
+        self.scale = scale or decode_scale(qr_version)
+        self.border = border
+        self.decoder = decoder
+        self.buffer = RenderBuffer(grid, self.scale, border)
+
+    # Render the base grid with the given module positions flipped to black, as a new image
+    # (for images that must outlive the call: mosaics, saved artifacts)
+    def render(self, positions):
+        img = self.buffer.flip(positions).copy()
+        self.buffer.revert()
+        return img
+
+    # Decode an image with this evaluator's backend
+    def decode(self, img):
+        return self.decoder.decode(img) if self.decoder is not None else decode_qr_image(img)
+
+    # Decode the grid with the given module positions flipped to black, in the shared render buffer
+    def evaluate(self, positions):
+        img = self.buffer.flip(positions)
+        try:
+            return self.decode(img)
+        finally:
+            self.buffer.revert()
+
+
+# Function to turn fixed positions into a boolean mask for array lookups. Accepts a boolean mask,
+# any iterable of (row, col) tuples, or None for the version's cached function-pattern mask.
+def fixed_position_mask(fixed_positions, size):
+    if fixed_positions is None:
+        return function_pattern_mask((size - 17) // 4)
+    if isinstance(fixed_positions, np.ndarray):
+        return fixed_positions.astype(bool)
+    mask = np.zeros((size, size), dtype=bool)
+    for row, col in fixed_positions:
+        if 0 <= row < size and 0 <= col < size:
+            mask[row, col] = True
+    return mask
+
+
+# Function to list the white, non-fixed modules (as an (N, 2) array) in the row-major order the search visits them
+def single_flip_candidates(grid, fixed_positions=None):
+    return candidate_index(grid, fixed_position_mask(fixed_positions, grid.shape[0]))
+
+
+# Scans single white-module flips in candidate order. Set up once per symbol; hits() streams every
+# confirmed hit so both the first-hit search and the exhaustive mode run the same loop.
+# With evaluator='analytic' the payloads are predicted from the codewords and only hits are rendered
+# and confirmed. decoder names the qr_decoders backend that reads candidates ('auto' times them and
+# takes the cheapest); hits are confirmed by confirm_decoder, by the runner-up under 'auto', and always
+# for analytic predictions. A qr_cache.ResultCache passed as cache is consulted before anything is
+# rendered or decoded. order is one of qr_ordering.ORDERINGS; None lets qr_ordering.scheduled_order pick.
+# validator is a qr_validator.PayloadValidator deciding which payloads are hits (None: printable ASCII);
+# each batch's payloads go through it together.
+class SingleFlipSearch:
+    def __init__(self, grid, qr, original_url, fixed_positions=None, evaluator='image', scale=None, cache=None,
+                 decoder='pyzbar', confirm_decoder=None, order=None, stats=None, output_folder=None,
+                 shard=None, validator=None):
+        self.original_url = original_url
+        self.validator = validator
+        self.stats = stats if stats is not None else SearchStats()
+        self.image_evaluator = GridEvaluator(grid, qr.version, scale=scale)
+        self.decoder, confirmer = resolve_decoders(decoder, confirm_decoder, self.image_evaluator.render(()))
+        self.image_evaluator.decoder = self.decoder
+        self.analytic_evaluator = (AnalyticEvaluator(grid, qr.version, qr.error_correction)
+                                   if evaluator == 'analytic' else None)
+        if confirmer is not None:
+            self.confirm_evaluator = GridEvaluator(grid, qr.version, scale=scale, decoder=confirmer)
+        else:
+            self.confirm_evaluator = self.image_evaluator if self.analytic_evaluator is not None else None
+        if evaluator != 'analytic' and self.decoder.name != 'pyzbar':
+            evaluator = f'{evaluator}/{self.decoder.name}'  # Keeps cache entries and checkpoints apart per backend
+        self.evaluator = evaluator
+        self.output_folder = output_folder  # Where to save every candidate image, if anywhere
+
+        # With a shard (see qr_shard) only every count-th candidate of the full order is kept;
+        # ordinals[i] is candidate i's place in the full order
+        fixed_mask = fixed_position_mask(fixed_positions, grid.shape[0])
+        self.order = scheduled_order(order, self.stats.time_limit)
+        ordered = order_candidates(candidate_index(grid, fixed_mask), grid, self.order)
+        self.ordinals = range(len(ordered))[shard_slice(shard)]
+        self.candidates = [tuple(position) for position in ordered[shard_slice(shard)].tolist()]
+        self.stats.total = len(self.candidates)
+        self.stats.skipped_by_mask = int(np.count_nonzero((grid == 1) & fixed_mask))
+        self.cache = cache
+        if cache is not None:
+            self.symbol = cache.symbol_key(original_url, qr.version, qr.error_correction, read_format_info(grid)[1],
+                                           evaluator, None if self.analytic_evaluator else self.image_evaluator.scale)
+
+    # Decode a batch of single flips, from the cache where possible
+    def decode_batch(self, batch, batch_size):
+        stats = self.stats
+        start_time = time.perf_counter()
+        cache = self.cache
+        cached = [cache.get(self.symbol, (position,)) if cache is not None else (False, None) for position in batch]
+        misses = [position for position, (found, _) in zip(batch, cached) if not found]
+        stats.cache_hits += len(batch) - len(misses)
+        stats.decodes_attempted += len(misses)
+        start_time = stats.add_time('cache', start_time)
+        if self.analytic_evaluator is not None:
+            decoded = [self.analytic_evaluator.evaluate((position,)) for position in misses]
+        elif batch_size > 1 and misses and self.decoder.multi:
+            images = [self.image_evaluator.render((position,)) for position in misses]
+            start_time = stats.add_time('render', start_time)
+            decoded = decode_mosaic(images, decoder=self.decoder)
+        else:
+            # Flip in the shared buffer, decode, revert: no image is allocated per candidate
+            buffer = self.image_evaluator.buffer
+            decoded = []
+            for position in misses:
+                img = buffer.flip((position,))
+                start_time = stats.add_time('render', start_time)
+                decoded.append(self.decoder.decode(img))
+                start_time = stats.add_time('decode', start_time)
+                buffer.revert()
+        start_time = stats.add_time('decode', start_time)
+        if cache is not None:
+            for position, modified_url in zip(misses, decoded):
+                cache.put(self.symbol, (position,), modified_url)
+            stats.add_time('cache', start_time)
+        fresh = iter(decoded)
+        return [result if found else next(fresh) for found, result in cached]
+
+    # Generate (candidate index, modified URL, position) for every confirmed hit from candidate `start` on,
+    # batch_size candidates per decode. on_batch(cursor) is called after each fully scanned batch.
+    # Stops early, between batches, once the stats' time budget is spent.
+    def hits(self, start=0, batch_size=1, on_batch=None):
+        stats = self.stats
+        for first in range(start, len(self.candidates), batch_size):
+            if stats.out_of_time():
+                return
+            batch = self.candidates[first:first + batch_size]
+            modified_urls = self.decode_batch(batch, batch_size)
+            if self.validator is not None:
+                start_time = time.perf_counter()
+                self.validator.validate_batch(modified_urls)  # Judged together here, then read from its cache
+                stats.add_time('validate', start_time)
+
+            for offset, (position, modified_url) in enumerate(zip(batch, modified_urls)):
+                row, col = position
+                stats.candidates_considered += 1
+                stats.covered += 1
+                if self.output_folder is not None:
+                    cv2.imwrite(os.path.join(self.output_folder, f'modified_qr_{row}_{col}.png'),
+                                self.image_evaluator.render((position,)))
+                logger.debug("Modified URL from QR Code with module %s flipped: %s", position, modified_url)
+                start_time = time.perf_counter()
+                is_hit = classify_payload(stats, modified_url, self.original_url, self.validator)
+                start_time = stats.add_time('validate', start_time)
+                if not is_hit:
+                    continue
+                # A hit only counts once a second decoder (or, for predictions, a real one) reads the same payload
+                if self.confirm_evaluator is not None:
+                    confirmed = self.confirm_evaluator.evaluate((position,)) == modified_url
+                    stats.add_time('verify', start_time)
+                    if not confirmed:
+                        stats.unconfirmed_hits += 1
+                        continue
+                stats.record_hit()
+                yield first + offset, modified_url, position
+
+            stats.report_progress()
+            if on_batch is not None:
+                on_batch(first + len(batch))
+
+
+# Function to find a modified URL by flipping single white modules of the module grid.
+# With batch_size > 1 the candidates are decoded batch_size at a time through decode_mosaic.
+# evaluator, decoder, confirm_decoder, cache and order are described at SingleFlipSearch.
+# With checkpoint_path the cursor is saved every checkpoint_every candidates, and resume=True
+# continues from the saved cursor. Returns (url, position, stats) where stats is a qr_stats.SearchStats;
+# progress_every logs a progress line at INFO every that many seconds. With time_limit (seconds) the
+# search stops cooperatively once it is spent and returns what it has: (None, None, stats) with
+# stats.timed_out set and stats.coverage() telling how much of the space was searched. A checkpoint
+# left by a timed-out search resumes where it stopped. validator is a qr_validator.PayloadValidator.
+def find_modified_qr_code_url(original_url, fixed_positions=None, qr_version=None, output_folder='modified_qr_codes',
+                              save_artifacts=False, scale=None, batch_size=1, evaluator='image', checkpoint_path=None,
+                              checkpoint_every=500, resume=False, cache=None,
+                              error_correction=qrcode.constants.ERROR_CORRECT_L, progress_every=None,
+                              decoder='pyzbar', confirm_decoder=None, order=None, time_limit=None, validator=None):
+    stats = SearchStats(progress_every, time_limit=time_limit)
+    start_time = time.perf_counter()
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    search = SingleFlipSearch(grid, qr, original_url, fixed_positions, evaluator=evaluator, scale=scale, cache=cache,
+                              decoder=decoder, confirm_decoder=confirm_decoder, order=order, stats=stats,
+                              output_folder=output_folder if save_artifacts else None, validator=validator)
+    stats.add_time('encode', start_time)
+
+    mode = f'single/{search.evaluator}' if search.order == 'row-major' else f'single/{search.evaluator}/{search.order}'
+    if validator is not None:
+        mode = f'{mode}/{validator.key()}'
+    identity = checkpoint_identity(original_url, qr.version, qr.error_correction, mode)
+    cursor = 0
+    if resume:
+        state = load_checkpoint(checkpoint_path, identity)
+        if state is not None and state['finished']:
+            if state['results']:
+                stats.record_hit()
+                return state['results'][0]['url'], tuple(state['results'][0]['position']), stats.finish()
+            return None, None, stats.finish()
+        if state is not None:
+            cursor = state['cursor']
+            stats.covered = cursor
+            logger.info("Resuming from candidate %d of %d", cursor, len(search.candidates))
+
+    last_checkpoint = [cursor]
+
+    def checkpoint(cursor):
+        if checkpoint_path and cursor - last_checkpoint[0] >= checkpoint_every:
+            start_time = time.perf_counter()
+            save_checkpoint(checkpoint_path, identity, cursor, cursor, [])
+            stats.add_time('checkpoint', start_time)
+            last_checkpoint[0] = cursor
+
+    # Flip white modules one cell per module, keeping the serial order inside each batch
+    for index, modified_url, position in search.hits(cursor, batch_size, on_batch=checkpoint):
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, identity, index + 1, index + 1,
+                            [{'url': modified_url, 'position': list(position)}], finished=True)
+        return modified_url, position, stats.finish()  # The modified URL, the flip position and the stats
+
+    if stats.timed_out:
+        logger.info("Time limit of %ss reached with %.1f%% of the candidates searched", time_limit,
+                    100 * stats.coverage())
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, identity, stats.covered, stats.covered, [])
+        return None, None, stats.finish()
+    if checkpoint_path:
+        save_checkpoint(checkpoint_path, identity, len(search.candidates), len(search.candidates), [], finished=True)
+    return None, None, stats.finish()
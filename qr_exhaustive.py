@@ -0,0 +1,135 @@
+import hashlib
+import json
+import time
+
+import qrcode
+
+from qr_codeword import CodewordSearch, codeword_hits
+from qr_decoders import resolve_decoders
+from qr_engine import GridEvaluator, SingleFlipSearch, create_qr_matrix
+from qr_kflip import KFlipSearch
+from qr_packed import PackedResultWriter
+from qr_robustness import RobustnessCheck
+from qr_stats import SearchStats
+
+
+# Searches the exhaustive mode can run to completion
+STRATEGIES = ('single', 'k', 'codeword')
+
+
+# Remembers which decoded payloads were already reported. Only an 8-byte digest is kept per distinct
+# payload, so memory follows the number of different URLs found, never the number of flip sets.
+class PayloadSet:
+    def __init__(self):
+        self.digests = set()
+
+    # Add a payload; False if it was already there
+    def add(self, payload):
+        digest = hashlib.blake2b(payload.encode('utf-8'), digest_size=8).digest()
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        return True
+
+
+# Function to set up one strategy's search on an encoded symbol and return an iterator over its
+# confirmed hits as (top-level ordinal, modified URL, positions). The searches are built before this
+# returns, so their setup time falls outside the iteration.
+def strategy_hits(grid, qr, original_url, strategy='single', k=2, fixed_positions=None, adjacency='any',
+                  evaluator=None, max_characters=2, scale=None, decoder='pyzbar', confirm_decoder=None,
+                  order=None, stats=None, shard=None, validator=None):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown exhaustive strategy: {strategy}")
+    stats = stats if stats is not None else SearchStats()
+    if strategy == 'single':
+        search = SingleFlipSearch(grid, qr, original_url, fixed_positions, evaluator=evaluator or 'image', scale=scale,
+                                  decoder=decoder, confirm_decoder=confirm_decoder, order=order, stats=stats,
+                                  shard=shard, validator=validator)
+        return ((search.ordinals[index], modified_url, (position,)) for index, modified_url, position in search.hits())
+    if strategy == 'k':
+        primary, confirmer = resolve_decoders(decoder, confirm_decoder, GridEvaluator(grid, qr.version, scale).render(()))
+        search = KFlipSearch(grid, qr, k, fixed_positions, adjacency=adjacency, evaluator=evaluator or 'analytic',
+                             scale=scale, original_url=original_url, stats=stats, decoder=primary,
+                             confirm_decoder=confirmer, order=order, shard=shard, validator=validator)
+        # Flip sets grow in candidate order, so the first flip is the set's top-level candidate
+        return ((search.index_of[positions[0]], modified_url, positions)
+                for modified_url, positions in search.hits(original_url))
+    search = CodewordSearch(grid, qr, fixed_positions)
+    image_evaluator = GridEvaluator(grid, qr.version, scale=scale)
+    image_evaluator.decoder, _ = resolve_decoders(decoder, None, image_evaluator.render(()))
+    return codeword_hits(search, image_evaluator, original_url, max_characters, stats, shard=shard,
+                         validator=validator)
+
+
+# Function to stream every reachable variant of a URL instead of stopping at the first. Yields one
+# {'url', 'positions'} record per distinct decoded payload (per flip set with deduplicate=False) as
+# soon as it is confirmed; nothing is collected. Pass a qr_stats.SearchStats as stats to read the
+# counters afterwards: results counts the records yielded, duplicate_payloads the hits dropped.
+# With shard=(index, count) only that shard's part of the space is searched (see qr_shard) and each
+# record also carries its 'ordinal', which qr_shard.merge_shards orders the shards' records by.
+# With time_limit (seconds, counted from when stats was created) the search stops cooperatively once
+# it is spent; the records yielded so far are the partial result and stats.coverage() says how much
+# of the space they cover. With robustness (a dict of qr_robustness.RobustnessCheck options, e.g.
+# {'variants': 100}) every record also carries a 'robustness' report: how many degraded scans of
+# it still decode to its URL. With a qr_validator.PayloadValidator only the payloads it accepts are
+# hits, and every record carries its 'similarity' to the original URL and its 'host', for ranking
+# the look-alikes.
+def exhaustive_search(original_url, strategy='single', k=2, fixed_positions=None, qr_version=None, adjacency='any',
+                      evaluator=None, max_characters=2, scale=None, decoder='pyzbar', confirm_decoder=None,
+                      order=None, error_correction=qrcode.constants.ERROR_CORRECT_L, stats=None,
+                      deduplicate=True, shard=None, time_limit=None, robustness=None, validator=None):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown exhaustive strategy: {strategy}")
+    stats = stats if stats is not None else SearchStats()
+    if time_limit is not None:
+        stats.time_limit = time_limit
+    start_time = time.perf_counter()
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    hits = strategy_hits(grid, qr, original_url, strategy, k=k, fixed_positions=fixed_positions, adjacency=adjacency,
+                         evaluator=evaluator, max_characters=max_characters, scale=scale, decoder=decoder,
+                         confirm_decoder=confirm_decoder, order=order, stats=stats, shard=shard, validator=validator)
+    checker = RobustnessCheck(grid, qr.version, **robustness) if robustness is not None else None
+    stats.add_time('encode', start_time)
+
+    seen = PayloadSet()
+    last_ordinal, below = None, 0
+    for ordinal, modified_url, positions in hits:
+        # Hits below one top-level ordinal (k-flip subtrees) are numbered in the order they were found
+        below = below + 1 if ordinal == last_ordinal else 0
+        last_ordinal = ordinal
+        if deduplicate and not seen.add(modified_url):
+            stats.duplicate_payloads += 1
+            continue
+        stats.results += 1
+        record = {'url': modified_url, 'positions': [list(position) for position in positions]}
+        if validator is not None:
+            verdict = validator.validate(modified_url)
+            record.update(similarity=verdict['similarity'], host=verdict['host'])
+        if checker is not None:
+            start_time = time.perf_counter()
+            record['robustness'] = checker.check(positions, modified_url, original_url)
+            stats.add_time('robustness', start_time)
+        if shard is not None:
+            record['ordinal'] = [ordinal, below]
+        yield record
+    stats.finish()
+
+
+# Function to write results one JSON line at a time, flushing each so a reader can follow the file
+def write_jsonl(results, output):
+    count = 0
+    for record in results:
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+        count += 1
+    return count
+
+
+# Function to write results into a packed, memory-mappable result collection (see qr_packed) instead
+# of JSONL. The base grid is re-encoded from the same arguments the search was given.
+def write_packed(results, path, original_url, qr_version=None, error_correction=qrcode.constants.ERROR_CORRECT_L):
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    with PackedResultWriter(path, grid, original_url, qr.version, error_correction) as writer:
+        for record in results:
+            writer.add(record)
+    return writer.meta['count']
@@ -0,0 +1,268 @@
+import collections
+import time
+
+import numpy as np
+import qrcode
+
+from qr_checkpoint import checkpoint_identity, load_checkpoint, save_checkpoint
+from qr_decoders import resolve_decoders
+from qr_engine import GridEvaluator, candidate_index, classify_payload, create_qr_matrix, fixed_position_mask
+from qr_ordering import order_candidates, scheduled_order
+from qr_shard import shard_slice
+from qr_stats import SearchStats, logger
+from qr_structure import AnalyticEvaluator
+
+
+# How the modules of one flip set may relate to each other. Sets are grown in scan order, so
+# 'neighbour' keeps sets whose every prefix is 8-connected.
+ADJACENCY_MODES = ('any', 'horizontal', 'vertical', 'neighbour', 'codeword')
+
+
+# Enumerates k-module flip sets depth-first in scan order with two prunings:
+#  - a partial set that already fails to decode is not extended (it broke decoding beyond ECC capacity)
+#  - a set whose touched codewords cannot exceed any block's correction capacity, even with the
+#    remaining flips, is skipped, since a decoder corrects it back to the original payload
+# Flip sets with the same per-codeword effect share one evaluation (the max_memo most recent effects
+# are remembered). Counters and timers go to self.stats.
+# decoder and confirm_decoder are qr_decoders backends for reading and confirming (None means pyzbar).
+# order (one of qr_ordering.ORDERINGS, or None for qr_ordering.scheduled_order) decides which candidates
+# flip sets start from and grow with first.
+# shard (see qr_shard) limits the first flip to every count-th candidate; sets grow with any candidate.
+# The search stops cooperatively, at the next flip set, once the stats' time budget is spent.
+# validator is a qr_validator.PayloadValidator deciding which payloads are hits (None: printable ASCII).
+class KFlipSearch:
+    def __init__(self, grid, qr, k, fixed_positions=None, adjacency='any', evaluator='analytic', scale=None,
+                 prune_within_capacity=True, cache=None, original_url=None, stats=None, decoder=None,
+                 confirm_decoder=None, order=None, max_memo=100_000, shard=None, validator=None):
+        if adjacency not in ADJACENCY_MODES:
+            raise ValueError(f"Unknown adjacency mode: {adjacency}")
+        self.k = k
+        self.validator = validator
+        self.adjacency = adjacency
+        self.shard = shard
+        self.prune_within_capacity = prune_within_capacity
+        self.analytic_evaluator = AnalyticEvaluator(grid, qr.version, qr.error_correction)
+        self.image_evaluator = GridEvaluator(grid, qr.version, scale=scale, decoder=decoder)
+        self.evaluator = self.analytic_evaluator if evaluator == 'analytic' else self.image_evaluator
+        if confirm_decoder is not None:
+            self.confirm_evaluator = GridEvaluator(grid, qr.version, scale=scale, decoder=confirm_decoder)
+        else:
+            self.confirm_evaluator = self.image_evaluator if self.evaluator is self.analytic_evaluator else None
+        self.cache = cache
+        if cache is not None:
+            scale = None if self.evaluator is self.analytic_evaluator else self.image_evaluator.scale
+            self.symbol = cache.symbol_key(original_url, qr.version, qr.error_correction,
+                                           self.analytic_evaluator.layout.mask_pattern, evaluator, scale)
+
+        self.stats = stats if stats is not None else SearchStats()
+        fixed_mask = fixed_position_mask(fixed_positions, grid.shape[0])
+        self.order = scheduled_order(order, self.stats.time_limit)
+        self.candidates = [tuple(position) for position in
+                           order_candidates(candidate_index(grid, fixed_mask), grid, self.order).tolist()]
+        self.stats.total = len(range(len(self.candidates))[shard_slice(shard)])  # Top-level candidates to cover
+        self.stats.skipped_by_mask = int(np.count_nonzero((grid == 1) & fixed_mask))
+        self.index_of = {position: index for index, position in enumerate(self.candidates)}
+        self.capacity = [(block.total_count - block.data_count) // 2 for block in self.analytic_evaluator.layout.blocks]
+
+        # Candidates grouped by the (block, codeword) they land in, for the 'codeword' mode
+        self.codeword_of = {}
+        self.codeword_groups = {}
+        layout = self.analytic_evaluator.layout
+        for index, (row, col) in enumerate(self.candidates):
+            bit = int(layout.bit_index[row, col])
+            codeword = layout.stream_layout[bit // 8] if 0 <= bit < layout.codeword_count * 8 else None
+            self.codeword_of[index] = codeword
+            self.codeword_groups.setdefault(codeword, []).append(index)
+
+        self.results = collections.OrderedDict()  # Per-codeword effect -> decoded payload, least recent first
+        self.max_memo = max_memo
+
+    # Candidate indices that may follow a partial set, in increasing order
+    def extensions(self, chosen):
+        if not chosen:
+            return range(len(self.candidates))[shard_slice(self.shard)]
+        last = chosen[-1]
+        row, col = self.candidates[last]
+        if self.adjacency == 'any':
+            return range(last + 1, len(self.candidates))
+        if self.adjacency == 'horizontal':
+            following = self.index_of.get((row, col + 1))
+            return [following] if following is not None else []
+        if self.adjacency == 'vertical':
+            following = self.index_of.get((row + 1, col))
+            return [following] if following is not None else []
+        if self.adjacency == 'codeword':
+            codeword = self.codeword_of[chosen[0]]
+            if codeword is None:
+                return []
+            return [index for index in self.codeword_groups[codeword] if index > last]
+
+        # 'neighbour': any later candidate touching one of the chosen modules
+        neighbours = set()
+        for index in chosen:
+            row, col = self.candidates[index]
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    neighbour = self.index_of.get((row + d_row, col + d_col))
+                    if neighbour is not None and neighbour > last:
+                        neighbours.add(neighbour)
+        return sorted(neighbours)
+
+    # True if the flips so far plus `remaining` more can never push a block past its capacity
+    def within_capacity(self, changes, remaining):
+        for number, capacity in enumerate(self.capacity):
+            if len(changes.get(number, ())) + remaining > capacity:
+                return False
+        return True
+
+    # Evaluate a flip set once per distinct per-codeword effect
+    def evaluate(self, positions, changes):
+        # Block numbers, codeword indices and XORs all fit a byte, so the key packs to 3 bytes per codeword
+        key = bytes(value for change in sorted((number, index, xor) for number, block in changes.items()
+                                               for index, xor in block.items()) for value in change)
+        if key not in self.results:
+            start_time = time.perf_counter()
+            found, modified_url = self.cache.get(self.symbol, positions) if self.cache is not None else (False, None)
+            start_time = self.stats.add_time('cache', start_time)
+            if found:
+                self.stats.cache_hits += 1
+            else:
+                modified_url = self.evaluator.evaluate(positions)
+                self.stats.decodes_attempted += 1
+                start_time = self.stats.add_time('decode', start_time)
+                if self.cache is not None:
+                    self.cache.put(self.symbol, positions, modified_url)
+                    self.stats.add_time('cache', start_time)
+            self.results[key] = modified_url
+            if len(self.results) > self.max_memo:
+                self.results.popitem(last=False)  # Bounded, so long exhaustive runs keep flat memory
+        else:
+            self.results.move_to_end(key)
+        return self.results[key]
+
+    # Depth-first search for the first flip set (in scan order) that decodes to a new readable URL
+    def search(self, original_url, chosen=(), max_evaluations=None):
+        return next(self.hits(original_url, chosen, max_evaluations), None)
+
+    # Generate every hit below a partial set as (modified URL, positions), depth-first in scan order
+    def hits(self, original_url, chosen=(), max_evaluations=None):
+        for index in self.extensions(list(chosen)):
+            if max_evaluations is not None and self.stats.decodes_attempted >= max_evaluations:
+                return
+            if self.stats.out_of_time():
+                return
+            yield from self.visit_hits(original_url, chosen + (index,), max_evaluations)
+            cut_short = max_evaluations is not None and self.stats.decodes_attempted >= max_evaluations
+            if not chosen and not self.stats.timed_out and not cut_short:
+                self.stats.covered += 1  # The whole subtree below this top-level candidate is done
+
+    # Check one flip set and return its first hit (or the first hit below it while it is partial)
+    def visit(self, original_url, flips, max_evaluations=None):
+        return next(self.visit_hits(original_url, flips, max_evaluations), None)
+
+    # Check one flip set: prune it, evaluate it, and descend into its extensions while it is partial
+    def visit_hits(self, original_url, flips, max_evaluations=None):
+        positions = tuple(self.candidates[i] for i in flips)
+        changes = self.analytic_evaluator.codeword_changes(positions)
+        if self.prune_within_capacity and self.within_capacity(changes, self.k - len(flips)):
+            self.stats.pruned += 1
+            return
+
+        modified_url = self.evaluate(positions, changes)
+        if len(flips) < self.k:
+            if modified_url is None:
+                self.stats.pruned += 1  # Decoding already broke; no superset is worth trying
+                return
+            yield from self.hits(original_url, flips, max_evaluations)
+            return
+
+        self.stats.candidates_considered += 1
+        logger.debug("Modified URL from QR Code with modules %s flipped: %s", positions, modified_url)
+        start_time = time.perf_counter()
+        is_hit = classify_payload(self.stats, modified_url, original_url, self.validator)
+        start_time = self.stats.add_time('validate', start_time)
+        if is_hit:
+            # A hit only counts once a second decoder (or, for predictions, a real one) reads the same payload
+            if self.confirm_evaluator is not None:
+                confirmed = self.confirm_evaluator.evaluate(positions) == modified_url
+                self.stats.add_time('verify', start_time)
+                if not confirmed:
+                    self.stats.unconfirmed_hits += 1
+                    return
+            self.stats.record_hit()
+            yield modified_url, positions
+
+
+# Function to find a modified URL by flipping k white modules at once. With checkpoint_path the
+# cursor (top-level candidates whose whole subtree is done) is saved every checkpoint_every of them,
+# and resume=True continues from the saved cursor. Returns (url, positions, stats) like
+# find_modified_qr_code_url; progress_every logs a progress line at INFO every that many seconds.
+# decoder, confirm_decoder, order, time_limit and validator work as in find_modified_qr_code_url;
+# coverage counts top-level candidates whose whole subtree was searched.
+def find_modified_qr_code_url_k(original_url, k=2, fixed_positions=None, qr_version=None, adjacency='any',
+                                evaluator='analytic', max_evaluations=None, scale=None, prune_within_capacity=True,
+                                checkpoint_path=None, checkpoint_every=50, resume=False, cache=None,
+                                error_correction=qrcode.constants.ERROR_CORRECT_L, progress_every=None,
+                                decoder='pyzbar', confirm_decoder=None, order=None, time_limit=None,
+                                validator=None):
+    stats = SearchStats(progress_every, time_limit=time_limit)
+    start_time = time.perf_counter()
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    primary, confirmer = resolve_decoders(decoder, confirm_decoder, GridEvaluator(grid, qr.version, scale).render(()))
+    if evaluator != 'analytic' and primary.name != 'pyzbar':
+        evaluator = f'{evaluator}/{primary.name}'  # Keeps cache entries and checkpoints apart per backend
+    search = KFlipSearch(grid, qr, k, fixed_positions, adjacency=adjacency, evaluator=evaluator, scale=scale,
+                         prune_within_capacity=prune_within_capacity, cache=cache, original_url=original_url,
+                         stats=stats, decoder=primary, confirm_decoder=confirmer, order=order, validator=validator)
+    stats.add_time('encode', start_time)
+
+    mode = f'k={k}/{adjacency}/{evaluator}/prune={prune_within_capacity}'
+    if validator is not None:
+        mode = f'{mode}/{validator.key()}'
+    identity = checkpoint_identity(original_url, qr.version, qr.error_correction,
+                                   mode if search.order == 'row-major' else f'{mode}/{search.order}')
+    cursor, previous_evaluations = 0, 0
+    if resume:
+        state = load_checkpoint(checkpoint_path, identity)
+        if state is not None and state['finished']:
+            if state['results']:
+                stats.record_hit()
+                result = state['results'][0]
+                return result['url'], tuple(tuple(position) for position in result['positions']), stats.finish()
+            return None, None, stats.finish()
+        if state is not None:
+            cursor, previous_evaluations = state['cursor'], state['evaluated']
+            stats.covered = cursor
+            logger.info("Resuming from top-level candidate %d of %d", cursor, len(search.candidates))
+
+    hit = None
+    last_checkpoint = cursor
+    for index in range(cursor, len(search.candidates)):
+        if max_evaluations is not None and stats.decodes_attempted >= max_evaluations:
+            break
+        if stats.out_of_time():
+            break
+        hit = search.visit(original_url, (index,), max_evaluations)
+        if hit or stats.timed_out:
+            break  # A timed-out subtree is incomplete, so the cursor stays before it
+        cursor = index + 1
+        stats.covered += 1
+        stats.report_progress()
+        if checkpoint_path and cursor - last_checkpoint >= checkpoint_every:
+            start_time = time.perf_counter()
+            save_checkpoint(checkpoint_path, identity, cursor, previous_evaluations + stats.decodes_attempted, [])
+            stats.add_time('checkpoint', start_time)
+            last_checkpoint = cursor
+
+    logger.info("%d-flip search: %d evaluations, %d branches pruned", k, stats.decodes_attempted, stats.pruned)
+    if stats.timed_out and hit is None:
+        logger.info("Time limit of %ss reached with %d of %d top-level candidates searched", time_limit, cursor,
+                    len(search.candidates))
+    if checkpoint_path:
+        finished = hit is not None or cursor == len(search.candidates)
+        results = [{'url': hit[0], 'positions': [list(position) for position in hit[1]]}] if hit else []
+        save_checkpoint(checkpoint_path, identity, cursor, previous_evaluations + stats.decodes_attempted, results,
+                        finished=finished)
+    if hit is None:
+        return None, None, stats.finish()
+    return hit[0], hit[1], stats.finish()
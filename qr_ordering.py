@@ -0,0 +1,90 @@
+import numpy as np
+from qrcode import util
+
+from qr_structure import URL_CHARACTERS, read_format_info, segment_layout, symbol_layout
+
+
+# Orders the search can visit candidates in. Every order is a permutation of the same candidates,
+# so the search space is unchanged; only how soon the hits come up differs.
+#  row-major   top-left to bottom-right, the original scan
+#  data-first  modules of payload codewords, then padding codewords, then error correction, then remainder bits
+#  codeword    data codewords in payload order, then error correction in stream order, then remainder bits
+#  printable   payload bits whose flip turns their byte into another URL character, then as data-first
+ORDERINGS = ('row-major', 'data-first', 'codeword', 'printable')
+
+# Regions a module can carry, in data-first order
+PAYLOAD, PADDING, ERROR_CORRECTION, REMAINDER = range(4)
+
+
+# Function to describe each candidate module as (region, stream key, byte after flipping it or -1).
+# The stream key orders modules along the data codewords (data bits) or the interleaved stream (the rest).
+def module_roles(grid, candidates):
+    size = grid.shape[0]
+    qr_version = (size - 17) // 4
+    layout = symbol_layout(qr_version, *read_format_info(grid))
+    blocks = layout.split_blocks(layout.read_codewords(grid))
+    data_start = np.cumsum([0] + [block.data_count for block in layout.blocks]).tolist()
+    data_codewords = [codeword for block, codewords in zip(layout.blocks, blocks)
+                      for codeword in codewords[:block.data_count]]
+
+    # Where the segments end, and the first bit and value of every byte-mode character
+    payload_end = 0
+    characters = {}
+    for mode, start, count in segment_layout(data_codewords, qr_version) or ():
+        if mode == util.MODE_8BIT_BYTE:
+            for offset in range(start, start + 8 * count, 8):
+                value = 0
+                for bit in range(offset, offset + 8):
+                    value = (value << 1) | (data_codewords[bit // 8] >> (7 - bit % 8)) & 1
+                characters[offset] = value
+            payload_end = start + 8 * count
+        elif mode == util.MODE_ALPHA_NUM:
+            payload_end = start + 11 * (count // 2) + 6 * (count % 2)
+        else:
+            payload_end = start + 10 * (count // 3) + (util.NUMBER_LENGTH[count % 3] if count % 3 else 0)
+
+    roles = []
+    for row, col in candidates.tolist():
+        bit = int(layout.bit_index[row, col])
+        if bit < 0 or bit >= layout.codeword_count * 8:
+            roles.append((REMAINDER, bit, -1))
+            continue
+        number, index = layout.stream_layout[bit // 8]
+        if index >= layout.blocks[number].data_count:
+            roles.append((ERROR_CORRECTION, bit, -1))
+            continue
+        data_bit = (data_start[number] + index) * 8 + bit % 8
+        if data_bit >= payload_end:
+            roles.append((PADDING, data_bit, -1))
+            continue
+        flipped = -1
+        for start in (data_bit - shift for shift in range(8)):
+            if start in characters:
+                flipped = characters[start] ^ (0x80 >> (data_bit - start))
+                break
+        roles.append((PAYLOAD, data_bit, flipped))
+    return roles
+
+
+# Function to pick the order when none was given: the original scan, or with a time budget the
+# printable order, which visits the flips most likely to yield a readable URL first
+def scheduled_order(order=None, time_limit=None):
+    if order is not None:
+        return order
+    return 'printable' if time_limit is not None else 'row-major'
+
+
+# Function to put candidates (an (N, 2) array) into one of the ORDERINGS
+def order_candidates(candidates, grid, order='row-major'):
+    if order not in ORDERINGS:
+        raise ValueError(f"Unknown candidate order: {order}")
+    if order == 'row-major' or len(candidates) == 0:
+        return candidates
+    roles = module_roles(grid, candidates)
+    if order == 'data-first':
+        keys = [(region, index) for index, (region, _, _) in enumerate(roles)]
+    elif order == 'codeword':
+        keys = [(region == REMAINDER, region == ERROR_CORRECTION, stream_key) for region, stream_key, _ in roles]
+    else:
+        keys = [(flipped not in URL_CHARACTERS, region, index) for index, (region, _, flipped) in enumerate(roles)]
+    return candidates[sorted(range(len(candidates)), key=keys.__getitem__)]
@@ -0,0 +1,147 @@
+import json
+import os
+
+import numpy as np
+
+
+# Compact storage for module grids and flip sets.
+#  - a module grid (1 = white, 0 = black) is packed 8 modules to a byte: a v40 symbol is 3.9 KB
+#    instead of 31 KB as a uint8 grid or ~340 KB as a box_size=10 pixel array
+#  - a flip set is the row * size + col index of each flipped module as uint16 (177 * 177 < 2 ** 16),
+#    2 bytes per module instead of a tuple of Python ints
+# A result collection is a directory of flat binary files that PackedResults memory-maps, so a tool
+# can read record i of millions without loading the rest:
+#   meta.json          symbol description and record count
+#   grid.bin           the packed base grid
+#   flips.bin          every record's flip indices, concatenated (uint16)
+#   flip_ends.bin      end offset of each record's flips in flips.bin (int64)
+#   urls.bin           every record's decoded URL, UTF-8, concatenated
+#   url_ends.bin       end offset of each record's URL in urls.bin (int64)
+PACKED_FORMAT = 1
+FLIP_DTYPE = np.uint16
+OFFSET_DTYPE = np.int64
+
+
+# Function to pack a module grid to one bit per module
+def pack_grid(grid):
+    return np.packbits(np.asarray(grid, dtype=np.uint8).ravel())
+
+
+# Function to unpack a grid packed by pack_grid back to a size x size uint8 grid
+def unpack_grid(packed, size):
+    return np.unpackbits(np.asarray(packed, dtype=np.uint8), count=size * size).reshape(size, size)
+
+
+# Function to turn (row, col) positions into a flip index array
+def flip_indices(positions, size):
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+    return (positions[:, 0] * size + positions[:, 1]).astype(FLIP_DTYPE)
+
+
+# Function to turn a flip index array back into (row, col) tuples
+def flip_positions(indices, size):
+    return [divmod(int(index), size) for index in indices]
+
+
+# Function to apply a flip index array to a copy of a grid (flipped modules become black)
+def apply_flips(grid, indices):
+    modified_grid = grid.copy()
+    modified_grid.ravel()[np.asarray(indices, dtype=np.int64)] = 0
+    return modified_grid
+
+
+# Streams records ({'url', 'positions'}, as qr_exhaustive yields them) into a packed result
+# directory. Records are appended to the files as they arrive; meta.json is written on close(),
+# so a collection without one was not finished.
+class PackedResultWriter:
+    def __init__(self, path, grid, url=None, qr_version=None, error_correction=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.size = grid.shape[0]
+        self.meta = {'format': PACKED_FORMAT, 'url': url, 'version': qr_version, 'error_correction': error_correction,
+                     'size': self.size, 'count': 0}
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)  # Overwriting: the old collection is no longer complete
+        pack_grid(grid).tofile(os.path.join(path, 'grid.bin'))
+        self.files = {name: open(os.path.join(path, name + '.bin'), 'wb')
+                      for name in ('flips', 'flip_ends', 'urls', 'url_ends')}
+        self.flip_end = 0
+        self.url_end = 0
+
+    def add(self, record):
+        indices = flip_indices(record['positions'], self.size)
+        url = record['url'].encode('utf-8')
+        self.flip_end += len(indices)
+        self.url_end += len(url)
+        self.files['flips'].write(indices.tobytes())
+        self.files['flip_ends'].write(OFFSET_DTYPE(self.flip_end).tobytes())
+        self.files['urls'].write(url)
+        self.files['url_ends'].write(OFFSET_DTYPE(self.url_end).tobytes())
+        self.meta['count'] += 1
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        with open(os.path.join(self.path, 'meta.json'), 'w') as file:
+            json.dump(self.meta, file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Read-only view of a packed result directory. The record files are memory-mapped, so opening a
+# collection costs the same however many records it holds; only the records indexed are read.
+class PackedResults:
+    def __init__(self, path):
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.isfile(meta_path):
+            raise ValueError(f"{path} is not a finished packed result collection (no meta.json)")
+        with open(meta_path) as file:
+            self.meta = json.load(file)
+        if self.meta.get('format') != PACKED_FORMAT:
+            raise ValueError(f"Unsupported packed result format: {self.meta.get('format')}")
+        self.size = self.meta['size']
+        self.count = self.meta['count']
+        self.grid = unpack_grid(np.fromfile(os.path.join(path, 'grid.bin'), dtype=np.uint8), self.size)
+        self.flips = self._map(path, 'flips', FLIP_DTYPE)
+        self.flip_ends = self._map(path, 'flip_ends', OFFSET_DTYPE)
+        self.urls = self._map(path, 'urls', np.uint8)
+        self.url_ends = self._map(path, 'url_ends', OFFSET_DTYPE)
+
+    @staticmethod
+    def _map(path, name, dtype):
+        file_path = os.path.join(path, name + '.bin')
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=dtype)  # np.memmap cannot map an empty file
+        return np.memmap(file_path, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return self.count
+
+    # The flip index array of record i (a view into the mapped file)
+    def flip_indices(self, i):
+        start = int(self.flip_ends[i - 1]) if i else 0
+        return self.flips[start:int(self.flip_ends[i])]
+
+    def url(self, i):
+        start = int(self.url_ends[i - 1]) if i else 0
+        return self.urls[start:int(self.url_ends[i])].tobytes().decode('utf-8')
+
+    # The module grid of record i: the base grid with its flips applied
+    def modified_grid(self, i):
+        return apply_flips(self.grid, self.flip_indices(i))
+
+    def __getitem__(self, i):
+        if not -self.count <= i < self.count:
+            raise IndexError(i)
+        i %= self.count
+        return {'url': self.url(i), 'positions': [list(position) for position in
+                                                  flip_positions(self.flip_indices(i), self.size)]}
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
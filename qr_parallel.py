@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import qrcode
+
+from qr_decoders import get_decoder, resolve_decoders
+from qr_engine import GridEvaluator, candidate_index, classify_payload, create_qr_matrix, fixed_position_mask
+from qr_ordering import order_candidates, scheduled_order
+from qr_stats import SearchStats, logger
+
+
+# Per-process search state, set once by the pool initializer so tasks only carry index ranges
+_worker_state = {}
+
+
+# Function to give each worker its own evaluator over the shared base grid and candidate list. decoder and
+# confirmer are qr_decoders backend names, already resolved (not 'auto'), so every worker reads and
+# confirms with the same backends; confirmer is None when hits are not confirmed.
+# expires is the search's deadline as a time.time() reading (None for no deadline), since
+# perf_counter readings do not carry across processes. Each worker gets its own copy of the validator.
+def _init_worker(grid, qr_version, scale, candidates, original_url, best_index, decoder, expires=None,
+                 validator=None, confirmer=None):
+    _worker_state['evaluator'] = GridEvaluator(grid, qr_version, scale=scale, decoder=get_decoder(decoder))
+    _worker_state['confirm_evaluator'] = GridEvaluator(grid, qr_version, scale=scale, decoder=get_decoder(confirmer)) \
+        if confirmer is not None else None
+    _worker_state['candidates'] = candidates
+    _worker_state['original_url'] = original_url
+    _worker_state['best_index'] = best_index
+    _worker_state['expires'] = expires
+    _worker_state['validator'] = validator
+
+
+# Function to scan candidates[start:stop] in serial order, stopping once an earlier hit is known or
+# the deadline has passed. Returns (hit or None, the chunk's SearchStats).
+def _search_chunk(start, stop):
+    evaluator = _worker_state['evaluator']
+    candidates = _worker_state['candidates']
+    original_url = _worker_state['original_url']
+    best_index = _worker_state['best_index']
+    expires = _worker_state['expires']
+    validator = _worker_state['validator']
+    confirm_evaluator = _worker_state['confirm_evaluator']
+    stats = SearchStats()
+
+    for index in range(start, stop):
+        # Any hit at or before this index wins over whatever this chunk could still find
+        if index >= best_index.value:
+            return None, stats
+        if expires is not None and time.time() >= expires:
+            stats.timed_out = True
+            return None, stats
+        position = (int(candidates[index, 0]), int(candidates[index, 1]))
+        stats.candidates_considered += 1
+        stats.covered += 1
+        stats.decodes_attempted += 1
+        start_time = time.perf_counter()
+        img = evaluator.buffer.flip((position,))
+        start_time = stats.add_time('render', start_time)
+        modified_url = evaluator.decoder.decode(img)
+        evaluator.buffer.revert()
+        start_time = stats.add_time('decode', start_time)
+        logger.debug("Modified URL from QR Code with module %s flipped: %s", position, modified_url)
+        is_hit = classify_payload(stats, modified_url, original_url, validator)
+        start_time = stats.add_time('validate', start_time)
+        # As in the serial search, a hit only counts once the confirming decoder reads the same payload
+        if is_hit and confirm_evaluator is not None:
+            is_hit = confirm_evaluator.evaluate((position,)) == modified_url
+            stats.add_time('verify', start_time)
+            if not is_hit:
+                stats.unconfirmed_hits += 1
+        if is_hit:
+            with best_index.get_lock():
+                if index < best_index.value:
+                    best_index.value = index
+            return (index, modified_url, position), stats
+    return None, stats
+
+
+# Function to find a modified URL by flipping single white modules across a pool of worker processes.
+# The hit returned is the one the serial find_modified_qr_code_url would return first. Returns
+# (url, position, stats); the stats sum every finished chunk, so they include work done past the hit.
+# decoder names the qr_decoders backend the workers read candidates with ('auto' is timed once here,
+# on the clean symbol, and the cheapest handed to every worker); hits are confirmed by confirm_decoder,
+# or by the runner-up under 'auto', as in the serial search. order is a qr_ordering order.
+# With time_limit (seconds) every worker stops at the deadline; the lowest-index hit found by then is
+# returned (it may not be the serial search's first hit) and stats.timed_out is set. validator is a
+# qr_validator.PayloadValidator.
+def find_modified_qr_code_url_parallel(original_url, fixed_positions=None, qr_version=None, workers=None, chunk_size=32,
+                                       scale=None, progress_every=None, decoder='pyzbar', order=None, time_limit=None,
+                                       validator=None, error_correction=qrcode.constants.ERROR_CORRECT_L,
+                                       confirm_decoder=None):
+    stats = SearchStats(progress_every, time_limit=time_limit)
+    expires = time.time() + time_limit if time_limit is not None else None
+    start_time = time.perf_counter()
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    fixed_mask = fixed_position_mask(fixed_positions, grid.shape[0])
+    candidates = order_candidates(candidate_index(grid, fixed_mask), grid, scheduled_order(order, time_limit))
+    stats.total = len(candidates)
+    stats.skipped_by_mask = int(np.count_nonzero((grid == 1) & fixed_mask))
+    start_time = stats.add_time('encode', start_time)
+    if len(candidates) == 0:
+        return None, None, stats.finish()
+    primary, confirmer = resolve_decoders(decoder, confirm_decoder,
+                                          GridEvaluator(grid, qr.version, scale=scale).render(()))
+    confirmer_name = confirmer.name if confirmer is not None else None
+    stats.add_time('decode', start_time)
+
+    context = multiprocessing.get_context()
+    best_index = context.Value('q', len(candidates))  # Lowest hit index found so far, shared by all workers
+    best = None
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context, initializer=_init_worker,
+                             initargs=(grid, qr.version, scale, candidates, original_url, best_index, primary.name,
+                                       expires, validator, confirmer_name)) as executor:
+        chunks = {executor.submit(_search_chunk, start, min(start + chunk_size, len(candidates))): start
+                  for start in range(0, len(candidates), chunk_size)}
+
+        for future in as_completed(chunks):
+            if future.cancelled():
+                continue
+            hit, chunk_stats = future.result()
+            stats.merge(chunk_stats)
+            stats.report_progress()
+            if hit and (best is None or hit[0] < best[0]):
+                if best is None:
+                    stats.record_hit()  # Later hits at lower indices replace it but are the same search's answer
+                best = hit
+                # Chunks that start after the hit can no longer change the answer
+                for pending, start in chunks.items():
+                    if start > best[0]:
+                        pending.cancel()
+
+    if best is None:
+        return None, None, stats.finish()
+    _, modified_url, position = best
+    return modified_url, position, stats.finish()
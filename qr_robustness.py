@@ -0,0 +1,145 @@
+import time
+
+import cv2
+import numpy as np
+import qrcode
+
+from qr_decoders import resolve_decoders
+from qr_engine import GridEvaluator, create_qr_matrix, decode_mosaic
+
+
+# A hit found on a perfect render may not survive a phone camera. The robustness check renders the
+# flipped symbol once and derives many degraded copies of it, as a camera would see them:
+#   warp       perspective tilt, each corner of the symbol moved by up to this many modules
+#   downscale  capture resolution, down to this fraction of the render's pixels per module
+#   blur       Gaussian defocus, sigma up to this many modules
+#   contrast   contrast left after washing out towards grey, down to this fraction
+#   noise      Gaussian sensor noise, sigma up to this many grey levels
+# Every copy draws its own amount of each (uniformly between none and the limit, times strength).
+DEGRADATION_LIMITS = {'warp': 1.5, 'downscale': 0.4, 'blur': 0.35, 'contrast': 0.35, 'noise': 20.0}
+
+# Pixels per module of the clean render the copies are degraded from
+ROBUSTNESS_SCALE = 6
+
+# Degraded copies tiled into one mosaic per decoder call, per backend. OpenCV's multi-symbol detector
+# drops most degraded tiles of a mosaic and is no faster for it, so backends not listed read each copy
+# on its own.
+MOSAIC_TILES = {'pyzbar': 16}
+
+# Blur sigmas are rounded to this many pixels so copies with the same sigma are blurred in one call
+BLUR_STEP = 0.25
+
+
+# Function to draw the degradation amounts of `count` copies: a dict of arrays, one value per copy
+def degradation_amounts(count, rng, strength=1.0):
+    draw = {name: rng.uniform(0, 1, count) * strength for name in DEGRADATION_LIMITS}
+    return {'warp': draw['warp'] * DEGRADATION_LIMITS['warp'],
+            'downscale': 1 - np.clip(draw['downscale'], 0, 1) * (1 - DEGRADATION_LIMITS['downscale']),
+            'blur': draw['blur'] * DEGRADATION_LIMITS['blur'],
+            'contrast': 1 - np.clip(draw['contrast'], 0, 1) * (1 - DEGRADATION_LIMITS['contrast']),
+            'noise': draw['noise'] * DEGRADATION_LIMITS['noise']}
+
+
+# Function to make `count` degraded copies of a rendered symbol as one (count, height, width) uint8
+# stack. img has a quiet zone of `border` modules at `scale` pixels per module. Warp and downscale are
+# one warpPerspective into the lower capture resolution plus one resize back per copy (so every copy
+# keeps the tile size decode_mosaic needs); blur runs once per distinct sigma on the copies stacked
+# end to end, which only ever bleeds quiet zone into quiet zone; contrast and noise are whole-stack
+# NumPy arithmetic.
+def degrade_batch(img, count, scale, border=4, rng=None, strength=1.0):
+    rng = rng if rng is not None else np.random.default_rng()
+    amounts = degradation_amounts(count, rng, strength)
+    height, width = img.shape
+    inner = border * scale
+    corners = np.float32([[inner, inner], [width - inner, inner], [width - inner, height - inner],
+                          [inner, height - inner]])
+
+    stack = np.empty((count, height, width), dtype=np.uint8)
+    shifts = rng.uniform(-1, 1, (count, 4, 2)) * (amounts['warp'] * scale)[:, None, None]
+    for index in range(count):
+        factor = amounts['downscale'][index]
+        capture = (max(int(width * factor), 1), max(int(height * factor), 1))
+        matrix = cv2.getPerspectiveTransform(corners, ((corners + shifts[index]) * factor).astype(np.float32))
+        captured = cv2.warpPerspective(img, matrix, capture, flags=cv2.INTER_LINEAR, borderValue=255)
+        stack[index] = cv2.resize(captured, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    sigmas = np.round(amounts['blur'] * scale / BLUR_STEP) * BLUR_STEP
+    for sigma in np.unique(sigmas[sigmas > 0]):
+        chosen = np.flatnonzero(sigmas == sigma)
+        tall = stack[chosen].reshape(-1, width)
+        stack[chosen] = cv2.GaussianBlur(tall, (0, 0), float(sigma)).reshape(len(chosen), height, width)
+
+    degraded = stack.astype(np.float32)
+    degraded -= 128
+    degraded *= amounts['contrast'][:, None, None]
+    degraded += 128
+    degraded += rng.standard_normal(degraded.shape, dtype=np.float32) * \
+        amounts['noise'].astype(np.float32)[:, None, None]
+    return np.clip(degraded, 0, 255).astype(np.uint8)
+
+
+# Checks how often hits on one symbol still decode after scan degradation. Set up once per symbol
+# (render buffer and decoder); check() then costs one render, one degrade_batch and, with pyzbar,
+# variants / tiles_per_mosaic decoder calls per hit. decoder is a qr_decoders name; the grid backend
+# only reads clean renders, so it is refused. tiles_per_mosaic=None takes MOSAIC_TILES for the
+# backend. Tiles a mosaic misses are not retried one by one, so the survival fraction is a lower
+# bound. Each check() seeds its copies from seed and the hit's positions, so a hit's report does not
+# depend on which hits were checked before it (a sharded search reports what a single run does).
+class RobustnessCheck:
+    def __init__(self, grid, qr_version, variants=100, scale=ROBUSTNESS_SCALE, border=4, decoder='pyzbar',
+                 strength=1.0, tiles_per_mosaic=None, seed=0):
+        self.evaluator = GridEvaluator(grid, qr_version, scale=scale, border=border)
+        self.decoder, _ = resolve_decoders(decoder, None, self.evaluator.render(()))
+        if self.decoder.name == 'grid':
+            raise ValueError("The grid decoder only reads clean renders; pick a camera decoder for robustness checks")
+        self.variants = variants
+        self.scale = scale
+        self.border = border
+        self.strength = strength
+        if tiles_per_mosaic is None:
+            tiles_per_mosaic = MOSAIC_TILES.get(self.decoder.name, 1)
+        self.tiles_per_mosaic = tiles_per_mosaic if self.decoder.multi else 1
+        self.seed = seed
+
+    # Decode a stack of degraded copies, tiles_per_mosaic to a decoder call
+    def decode_stack(self, stack):
+        if self.tiles_per_mosaic <= 1:
+            return [self.decoder.decode(img) for img in stack]
+        decoded = []
+        for first in range(0, len(stack), self.tiles_per_mosaic):
+            decoded.extend(decode_mosaic(list(stack[first:first + self.tiles_per_mosaic]), fallback=False,
+                                         decoder=self.decoder))
+        return decoded
+
+    # Degrade the symbol with `positions` flipped and count how the copies decode: survival is the
+    # fraction that still reads expected_url (the hit's payload); original counts the copies that read
+    # original_url instead, i.e. where the scan undid the flip
+    def check(self, positions, expected_url, original_url=None):
+        start_time = time.perf_counter()
+        rng = np.random.default_rng([self.seed, *(value for position in sorted(map(tuple, positions))
+                                                  for value in position)])
+        stack = degrade_batch(self.evaluator.render(positions), self.variants, self.scale, self.border, rng,
+                              self.strength)
+        degrade_seconds = time.perf_counter() - start_time
+        decoded = self.decode_stack(stack)
+        counts = {'survived': 0, 'original': 0, 'other': 0, 'failed': 0}
+        for text in decoded:
+            if text == expected_url:
+                counts['survived'] += 1
+            elif text is None:
+                counts['failed'] += 1
+            elif text == original_url:
+                counts['original'] += 1
+            else:
+                counts['other'] += 1
+        return dict(counts, variants=len(decoded), survival=round(counts['survived'] / len(decoded), 4),
+                    decoder_calls=-(-len(decoded) // self.tiles_per_mosaic), degrade_seconds=round(degrade_seconds, 4),
+                    seconds=round(time.perf_counter() - start_time, 4))
+
+
+# Function to check one hit of a search: re-encodes the URL, flips `positions` and degrades the result.
+# Returns the RobustnessCheck.check report. check_options go to RobustnessCheck (variants, decoder, ...).
+def robustness_check(original_url, positions, modified_url, qr_version=None,
+                     error_correction=qrcode.constants.ERROR_CORRECT_L, **check_options):
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    return RobustnessCheck(grid, qr.version, **check_options).check(positions, modified_url, original_url)
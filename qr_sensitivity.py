@@ -0,0 +1,110 @@
+import time
+
+import cv2
+import numpy as np
+import qrcode
+
+from qr_engine import SingleFlipSearch, classify_payload, create_qr_matrix
+from qr_stats import SearchStats, logger
+
+
+# What flipping a module does, as stored in the map (uint8 codes)
+FIXED, BLACK, UNCHANGED, READABLE, UNREADABLE, FAILURE = range(6)
+OUTCOMES = ('fixed', 'black', 'unchanged', 'readable', 'unreadable', 'failure')
+
+# Heatmap colours (BGR) per outcome code
+OUTCOME_COLOURS = np.array([
+    (160, 160, 160),  # fixed: function patterns, never flipped
+    (40, 40, 40),  # black: already black, nothing to flip
+    (120, 200, 120),  # unchanged: the decoder corrects the flip
+    (40, 40, 220),  # readable: a new printable payload
+    (40, 160, 240),  # unreadable: a new payload with unprintable bytes
+    (200, 120, 40),  # failure: the symbol no longer decodes
+], dtype=np.uint8)
+
+
+# Function to mark which single flips error correction is certain to absorb, in one pass over the
+# layout arrays: a flip on a remainder bit changes no codeword, and a flip anywhere else is one symbol
+# error in one block, absorbed whenever the block corrects at least one (KFlipSearch prunes the same way)
+def within_capacity(layout, candidates):
+    bits = layout.bit_index[candidates[:, 0], candidates[:, 1]]
+    in_stream = (bits >= 0) & (bits < layout.codeword_count * 8)
+    stream_block = np.array([number for number, _ in layout.stream_layout])
+    capacity = np.array([(block.total_count - block.data_count) // 2 for block in layout.blocks])
+    return ~in_stream | (capacity[stream_block[np.where(in_stream, bits, 0) // 8]] >= 1)
+
+
+# Function to evaluate every free white module's flip once and return the outcome map: a size x size
+# uint8 array of outcome codes, plus the search stats. The flips go through SingleFlipSearch's batch
+# decoding, so the evaluator, decoder backends, mosaics and result cache behave as in a search. With
+# the analytic evaluator (the default) the flips error correction absorbs are settled in one vectorized
+# pass (within_capacity) and only the rest are decoded, on codewords with no image at all. Unlike a
+# search, every candidate is evaluated, hits are not confirmed, and nothing stops at the first hit.
+# With a qr_validator.PayloadValidator, readable means accepted by it and unreadable covers the rest.
+def sensitivity_map(original_url, qr_version=None, error_correction=qrcode.constants.ERROR_CORRECT_L,
+                    evaluator='analytic', decoder='auto', batch_size=1, scale=None, cache=None, progress_every=None,
+                    validator=None):
+    stats = SearchStats(progress_every)
+    start_time = time.perf_counter()
+    grid, qr = create_qr_matrix(original_url, qr_version, error_correction)
+    # Analytic maps decode no image and confirm nothing, so only the image evaluator resolves (and under
+    # 'auto' times) the backend; the cheap grid backend fills the unused slot otherwise
+    search = SingleFlipSearch(grid, qr, original_url, evaluator=evaluator, scale=scale, cache=cache,
+                              decoder=decoder if evaluator == 'image' else 'grid', stats=stats, validator=validator)
+    stats.add_time('encode', start_time)
+
+    candidates = np.array(search.candidates, dtype=np.intp).reshape(-1, 2)
+    codes = np.full(len(candidates), UNCHANGED, dtype=np.uint8)
+    if search.analytic_evaluator is not None:
+        absorbed = within_capacity(search.analytic_evaluator.layout, candidates)
+        stats.pruned += int(np.count_nonzero(absorbed))
+        stats.candidates_considered += int(np.count_nonzero(absorbed))
+        remaining = np.flatnonzero(~absorbed)
+    else:
+        remaining = np.arange(len(candidates))
+
+    for first in range(0, len(remaining), batch_size):
+        indices = remaining[first:first + batch_size]
+        batch = [search.candidates[index] for index in indices]
+        decoded = search.decode_batch(batch, batch_size)
+        stats.candidates_considered += len(batch)
+        start_time = time.perf_counter()
+        if validator is not None:
+            validator.validate_batch(decoded)
+        for index, modified_url in zip(indices, decoded):
+            if classify_payload(stats, modified_url, original_url, validator):
+                codes[index] = READABLE
+            elif not modified_url:
+                codes[index] = FAILURE
+            elif modified_url != original_url:
+                codes[index] = UNREADABLE
+        stats.add_time('validate', start_time)
+        stats.report_progress()
+
+    # Everything not evaluated is either a reserved module or already black
+    outcomes = np.where(grid == 0, BLACK, FIXED).astype(np.uint8)
+    outcomes[candidates[:, 0], candidates[:, 1]] = codes
+    stats.hits = int(np.count_nonzero(codes == READABLE))
+    logger.info("Sensitivity map v%d: %s", qr.version, outcome_counts(outcomes))
+    return outcomes, stats.finish()
+
+
+# Function to count each outcome in a map
+def outcome_counts(outcomes):
+    return {name: int(np.count_nonzero(outcomes == code)) for code, name in enumerate(OUTCOMES)}
+
+
+# Function to render an outcome map as a colour image, scale pixels per module with a light border
+def render_heatmap(outcomes, scale=8, border=2):
+    size = outcomes.shape[0]
+    img = np.full(((size + 2 * border) * scale, (size + 2 * border) * scale, 3), 255, dtype=np.uint8)
+    img[border * scale: (border + size) * scale, border * scale: (border + size) * scale] = \
+        np.repeat(np.repeat(OUTCOME_COLOURS[outcomes], scale, axis=0), scale, axis=1)
+    return img
+
+
+# Function to save a map as <prefix>.npy and its heatmap as <prefix>.png; returns both paths
+def save_sensitivity_map(outcomes, prefix, scale=8):
+    np.save(prefix + '.npy', outcomes)
+    cv2.imwrite(prefix + '.png', render_heatmap(outcomes, scale))
+    return prefix + '.npy', prefix + '.png'
@@ -0,0 +1,227 @@
+import asyncio
+import functools
+import ipaddress
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from qr_batch import ERROR_CORRECTION_LEVELS, run_job
+from qr_engine import create_qr_matrix
+from qr_kflip import ADJACENCY_MODES
+
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+# Largest request body accepted; a job is a URL and a few options
+MAX_BODY_BYTES = 64 * 1024
+
+# Seconds kept back from a job's deadline so its partial result gets back before the waiters give up
+DEADLINE_MARGIN = 0.5
+
+
+# Function to load the heavy modules and build the cached layout tables once per worker process
+def _warm_worker():
+    create_qr_matrix('https://example.com')
+
+
+# Function to validate a request body into a job and its coalescing key; a bad value raises ValueError
+# (answered with a 400), as qr_batch.parse_job does for batch lines
+def parse_request(body, default_deadline):
+    request = json.loads(body or b'{}')
+    if not isinstance(request, dict) or not isinstance(request.get('url'), str):
+        raise ValueError("Request body must be a JSON object with a 'url' string")
+    job = {'url': request['url'], 'version': request.get('version'), 'ecc': str(request.get('ecc', 'L')).upper()}
+    version = job['version']
+    if version is not None and (isinstance(version, bool) or not isinstance(version, int) or not 1 <= version <= 40):
+        raise ValueError(f"Version must be an integer from 1 to 40, got {version!r}")
+    if job['ecc'] not in ERROR_CORRECTION_LEVELS:
+        raise ValueError(f"Unknown ECC level: {job['ecc']}")
+    options = {'k': request.get('k', 1), 'adjacency': request.get('adjacency', 'any'),
+               'evaluator': request.get('evaluator')}
+    if isinstance(options['k'], bool) or not isinstance(options['k'], int) or options['k'] < 1:
+        raise ValueError(f"k must be an integer of at least 1, got {options['k']!r}")
+    if options['adjacency'] not in ADJACENCY_MODES:
+        raise ValueError(f"Adjacency must be one of {', '.join(ADJACENCY_MODES)}, got {options['adjacency']!r}")
+    if options['evaluator'] not in (None, 'image', 'analytic'):
+        raise ValueError(f"Evaluator must be 'image' or 'analytic', got {options['evaluator']!r}")
+    deadline = float(request.get('deadline', default_deadline))
+    key = (job['url'], job['version'], job['ecc'], options['k'], options['adjacency'], options['evaluator'])
+    return job, options, deadline, key
+
+
+# Flip searches behind an asyncio front end: a bounded queue in front of a process pool, with
+# identical jobs coalesced onto one search and every request answered by its own deadline.
+class SearchService:
+    def __init__(self, workers=2, queue_size=64, default_deadline=60.0):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.default_deadline = default_deadline
+        self.executor = None
+        self.queue = None
+        self.pending = {}  # Coalescing key -> [future shared by every waiter, latest waiter deadline]
+        self.metrics = {'accepted': 0, 'coalesced': 0, 'rejected': 0, 'expired': 0, 'timed_out': 0, 'completed': 0,
+                        'failed': 0, 'running': 0, 'timed_out_searches': 0}
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for consumer in self.consumers:
+            consumer.cancel()
+        await asyncio.gather(*self.consumers, return_exceptions=True)
+        self.executor.shutdown(cancel_futures=True)
+
+    # Take jobs off the queue one at a time and run them on the pool; one consumer per worker process
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, job, options = await self.queue.get()
+            future, deadline = self.pending[key]
+            try:
+                if loop.time() >= deadline:
+                    # Every waiter has already given up; do not spend a worker on it. Nobody awaits the
+                    # future any more, so it is cancelled: an exception left on it would never be retrieved.
+                    self.metrics['expired'] += 1
+                    future.cancel()
+                    continue
+                # The search gets the time the latest waiter has left, so a worker is never held past it;
+                # a search that runs out of time answers with its partial stats instead of a 504
+                time_limit = max(deadline - loop.time() - DEADLINE_MARGIN, 0.0)
+                self.metrics['running'] += 1
+                try:
+                    record = await loop.run_in_executor(
+                        self.executor, functools.partial(run_job, job, options['k'], options['adjacency'],
+                                                         options['evaluator'], time_limit=time_limit))
+                finally:
+                    self.metrics['running'] -= 1
+                if record.get('stats', {}).get('timed_out'):
+                    self.metrics['timed_out_searches'] += 1
+                self.metrics['failed' if 'error' in record else 'completed'] += 1
+                future.set_result(record)
+            except Exception as error:
+                self.metrics['failed'] += 1
+                if not future.done():
+                    if loop.time() >= self.pending[key][1]:
+                        future.cancel()  # The waiters are gone, as above
+                    else:
+                        future.set_exception(error)
+            finally:
+                del self.pending[key]
+                self.queue.task_done()
+
+    # Submit a job, or join an identical one already queued or running. Returns the job record;
+    # raises asyncio.QueueFull when the queue is full and asyncio.TimeoutError past the deadline.
+    async def submit(self, job, options, deadline, key):
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + deadline
+        if key in self.pending:
+            self.metrics['coalesced'] += 1
+            entry = self.pending[key]
+            entry[1] = max(entry[1], expires)
+        else:
+            future = loop.create_future()
+            try:
+                self.queue.put_nowait((key, job, options))  # Raises QueueFull before anything is registered
+            except asyncio.QueueFull:
+                self.metrics['rejected'] += 1
+                raise
+            self.pending[key] = [future, expires]
+            self.metrics['accepted'] += 1
+            entry = self.pending[key]
+        try:
+            # Shielded so one waiter timing out does not cancel the search for the others
+            return await asyncio.wait_for(asyncio.shield(entry[0]), deadline)
+        except asyncio.TimeoutError:
+            self.metrics['timed_out'] += 1
+            raise
+
+    def snapshot(self):
+        return dict(self.metrics, queue_depth=self.queue.qsize(), queue_size=self.queue_size, workers=self.workers,
+                    pending_jobs=len(self.pending))
+
+
+# Function to answer one HTTP/1.1 request on a connection (the connection is closed afterwards)
+async def handle_connection(service, reader, writer):
+    status, payload = 200, None
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) < 2:
+            status, payload = 400, {'error': 'Malformed request line'}
+        else:
+            method, path = request_line[0], request_line[1]
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                status, payload = 400, {'error': 'Request body too large'}
+            elif path == '/metrics':
+                payload = service.snapshot()
+            elif path == '/search':
+                if method != 'POST':
+                    status, payload = 405, {'error': 'Use POST'}
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await answer_search(service, body)
+            else:
+                status, payload = 404, {'error': f'No such endpoint: {path}'}
+    except (ConnectionError, asyncio.IncompleteReadError):
+        writer.close()
+        return
+    except ValueError as error:
+        status, payload = 400, {'error': str(error)}
+
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+# Function to run a /search request through the service and pick the HTTP status for the outcome
+async def answer_search(service, body):
+    try:
+        job, options, deadline, key = parse_request(body, service.default_deadline)
+    except (ValueError, TypeError) as error:
+        return 400, {'error': str(error)}
+    start_time = time.perf_counter()
+    try:
+        record = await service.submit(job, options, deadline, key)
+    except asyncio.QueueFull:
+        return 503, {'error': 'Search queue is full', 'queue_depth': service.queue.qsize()}
+    except asyncio.TimeoutError:
+        return 504, {'error': f'No result within {deadline} seconds'}
+    return 200, dict(record, waited_seconds=round(time.perf_counter() - start_time, 4))
+
+
+# Function to run the service on a loopback TCP port or a Unix socket until interrupted. Only
+# loopback addresses are accepted so the service never listens beyond this machine.
+async def serve(host='127.0.0.1', port=8765, unix_path=None, workers=2, queue_size=64, default_deadline=60.0):
+    service = SearchService(workers=workers, queue_size=queue_size, default_deadline=default_deadline)
+    await service.start()
+
+    def handler(reader, writer):
+        return handle_connection(service, reader, writer)
+
+    if unix_path:
+        server = await asyncio.start_unix_server(handler, path=unix_path)
+        print(f"Search service listening on {unix_path}", flush=True)
+    else:
+        if host != 'localhost' and not ipaddress.ip_address(host).is_loopback:
+            raise ValueError(f"Refusing to listen on non-loopback address {host}")
+        server = await asyncio.start_server(handler, host=host, port=port)
+        print(f"Search service listening on http://{host}:{port}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
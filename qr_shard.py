@@ -0,0 +1,96 @@
+import json
+import os
+
+from qr_stats import SearchStats
+
+
+# Sharding splits one search across machines with no coordinator. A shard is (index, count) and
+# owns every top-level ordinal o with o % count == index: single-flip candidates, the first flip of
+# a k-flip set (its whole subtree goes with it), or codeword substitutions. Striding rather than
+# cutting the ordinals into ranges keeps shards balanced when the work per ordinal drifts, e.g.
+# k-flip subtrees shrinking towards the end of the scan or pruning clustering in one region.
+# Every result carries its ordinal [top-level ordinal, hit number below it], so merging the shards
+# in ordinal order reproduces a single-node run exactly. A sharded first-hit search writes each
+# shard's first hit; the lowest ordinal among them is the hit the single-node search would return.
+
+
+# Function to parse "i/N" into (i, N)
+def parse_shard(text):
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got {text!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in 0..N-1, got {text!r}")
+    return index, count
+
+
+# Function to get the slice of the top-level ordinals a shard owns (None means the whole space)
+def shard_slice(shard):
+    if shard is None:
+        return slice(None)
+    index, count = shard
+    return slice(index, None, count)
+
+
+# Function to name a shard's stats file after its result file
+def stats_path(output):
+    return os.path.splitext(output)[0] + '.stats.json'
+
+
+# Function to write a shard's stats file: what was searched, which shard, and the search counters
+def write_shard_stats(output, identity, shard, stats):
+    with open(stats_path(output), 'w') as file:
+        json.dump({'identity': identity, 'shard': list(shard), 'stats': stats.as_dict()}, file, indent=2)
+
+
+# Function to merge shard result files (JSONL written with a shard) into the records a single-node
+# run would have produced, in the same order (for a first-hit search, only that hit), plus the combined
+# stats. Raises ValueError unless the shards come from the same search and cover every index of one
+# split exactly once.
+def merge_shards(paths):
+    shards = []
+    for path in paths:
+        with open(stats_path(path)) as file:
+            shards.append(json.load(file))
+    identity = shards[0]['identity']
+    count = shards[0]['shard'][1]
+    for path, shard in zip(paths, shards):
+        if shard['identity'] != identity:
+            raise ValueError(f"{path} is from a different search: {shard['identity']} vs {identity}")
+    indices = sorted(shard['shard'][0] for shard in shards)
+    if any(shard['shard'][1] != count for shard in shards) or indices != list(range(count)):
+        raise ValueError(f"Shards {[shard['shard'] for shard in shards]} do not cover a {count}-way split exactly once")
+
+    records = []
+    for path in paths:
+        with open(path) as file:
+            records.extend(json.loads(line) for line in file if line.strip())
+    records.sort(key=lambda record: record['ordinal'])
+
+    # A shard only drops payloads it has already seen itself, so the global first occurrence always survives
+    seen = set()
+    merged = []
+    for record in records:
+        if identity.get('deduplicate', True):
+            if record['url'] in seen:
+                continue
+            seen.add(record['url'])
+        merged.append({key: value for key, value in record.items() if key != 'ordinal'})
+
+    stats = SearchStats()
+    for shard in shards:
+        stats.merge(SearchStats.from_dict(shard['stats']))
+    stats.duplicate_payloads += stats.results - len(merged)
+    if identity.get('first_hit'):
+        merged = merged[:1]
+    stats.results = len(merged)
+    stats.elapsed = max(shard['stats']['elapsed_seconds'] for shard in shards)  # The shards ran side by side
+    totals = [shard['stats'].get('total') for shard in shards]
+    stats.total = sum(totals) if None not in totals else None
+    first = [shard['stats'] for shard in shards if shard['stats']['first_hit_seconds'] is not None]
+    if first:
+        earliest = min(first, key=lambda shard_stats: shard_stats['first_hit_seconds'])
+        stats.first_hit_seconds = earliest['first_hit_seconds']
+        stats.first_hit_candidates = earliest['first_hit_candidates']
+    return merged, {'identity': identity, 'shards': count, 'stats': stats.as_dict()}
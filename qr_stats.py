@@ -0,0 +1,115 @@
+import logging
+import time
+
+
+# Shared by every search module; per-candidate detail is logged at DEBUG, progress and summaries at INFO
+logger = logging.getLogger('qr_search')
+
+# Stages timed inside the search loops
+STAGES = ('encode', 'cache', 'render', 'decode', 'validate', 'verify', 'checkpoint', 'robustness')
+
+
+# Counters and stage timers for one search. Updating them is a few integer and float additions per
+# candidate, so they stay on in every run. Timers are fed with time.perf_counter() readings:
+#     start_time = time.perf_counter(); ...; start_time = stats.add_time('decode', start_time)
+# The stats also carry the search's time budget: search loops call out_of_time() in their hot loop and
+# stop cooperatively once it is spent. covered counts the units of total (candidates, or top-level
+# candidates for k-flip searches) fully evaluated, so coverage says how much of the space was searched.
+class SearchStats:
+    COUNTERS = ('candidates_considered', 'skipped_by_mask', 'decodes_attempted', 'decode_failures',
+                'unchanged_payloads', 'unreadable_payloads', 'unconfirmed_hits', 'cache_hits', 'pruned', 'hits',
+                'results', 'duplicate_payloads', 'covered', 'rejected_payloads')
+
+    def __init__(self, progress_every=None, total=None, time_limit=None):
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.total = total  # Candidates the search expects to consider, for progress reports
+        self.progress_every = progress_every  # Seconds between progress reports; None disables them
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.elapsed = 0.0
+        self.first_hit_seconds = None  # Time to first hit, measured from the start of the search
+        self.first_hit_candidates = None  # Candidates considered up to and including the first hit
+        self.time_limit = time_limit  # Seconds the search may run, from when the stats were created; None is unlimited
+        self.timed_out = False
+
+    # Add the time since start_time to a stage and return the current reading for the next stage
+    def add_time(self, stage, start_time):
+        now = time.perf_counter()
+        self.stage_seconds[stage] += now - start_time
+        return now
+
+    # Log a progress line if progress_every seconds have passed since the last one
+    def report_progress(self):
+        if self.progress_every is None:
+            return
+        now = time.perf_counter()
+        if now - self.last_report >= self.progress_every:
+            self.last_report = now
+            rate = self.candidates_considered / (now - self.started)
+            done = f"{self.candidates_considered}/{self.total}" if self.total else f"{self.candidates_considered}"
+            logger.info("%s candidates, %d decodes, %d failures, %.1f candidates/s",
+                        done, self.decodes_attempted, self.decode_failures, rate)
+
+    # True once the time budget is spent (and from then on); cheap enough to call for every candidate
+    def out_of_time(self):
+        if not self.timed_out and self.time_limit is not None:
+            self.timed_out = time.perf_counter() - self.started >= self.time_limit
+        return self.timed_out
+
+    # Fraction of the search space fully evaluated, or None if its size is unknown
+    def coverage(self):
+        return min(self.covered / self.total, 1.0) if self.total else None
+
+    # Count a confirmed hit, remembering how long the first one took
+    def record_hit(self):
+        self.hits += 1
+        if self.first_hit_seconds is None:
+            self.first_hit_seconds = time.perf_counter() - self.started
+            self.first_hit_candidates = self.candidates_considered
+
+    # Fold in the counters and timers of another search, e.g. one worker's chunk
+    def merge(self, other):
+        for counter in self.COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        for stage, seconds in other.stage_seconds.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        self.timed_out = self.timed_out or other.timed_out
+        return self
+
+    # Rebuild stats from as_dict() output, e.g. a shard's stats file
+    @classmethod
+    def from_dict(cls, stats_dict):
+        stats = cls()
+        for counter in cls.COUNTERS:
+            setattr(stats, counter, stats_dict.get(counter, 0))
+        stats.stage_seconds.update(stats_dict.get('stage_seconds', {}))
+        stats.elapsed = stats_dict.get('elapsed_seconds', 0.0)
+        stats.first_hit_seconds = stats_dict.get('first_hit_seconds')
+        stats.first_hit_candidates = stats_dict.get('first_hit_candidates')
+        stats.total = stats_dict.get('total')
+        stats.time_limit = stats_dict.get('time_limit')
+        stats.timed_out = stats_dict.get('timed_out', False)
+        return stats
+
+    # Stop the wall clock; called once when the search returns
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def as_dict(self):
+        stats = {counter: getattr(self, counter) for counter in self.COUNTERS}
+        stats['stage_seconds'] = {stage: round(seconds, 6) for stage, seconds in self.stage_seconds.items()}
+        stats['elapsed_seconds'] = round(self.elapsed, 6)
+        stats['first_hit_seconds'] = round(self.first_hit_seconds, 6) if self.first_hit_seconds is not None else None
+        stats['first_hit_candidates'] = self.first_hit_candidates
+        stats['candidates_per_second'] = round(self.candidates_considered / self.elapsed, 3) if self.elapsed else None
+        stats['total'] = self.total
+        stats['coverage'] = round(self.coverage(), 6) if self.total else None
+        stats['time_limit'] = self.time_limit
+        stats['timed_out'] = self.timed_out
+        return stats
+
+    def __repr__(self):
+        return f"SearchStats({', '.join(f'{counter}={getattr(self, counter)}' for counter in self.COUNTERS)})"
@@ -0,0 +1,532 @@
+import functools
+import string
+
+import numpy as np
+from qrcode import base, util
+
+
+# Bytes a URL may contain: RFC 3986 unreserved and reserved characters plus '%'
+URL_CHARACTERS = frozenset((string.ascii_letters + string.digits + "-._~:/?#[]@!$&'()*+,;=%").encode('ascii'))
+
+# GF(256) tables for the QR Reed-Solomon code (primitive polynomial x^8 + x^4 + x^3 + x^2 + 1)
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+_value = 1
+for _power in range(255):
+    GF_EXP[_power] = _value
+    GF_LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _power in range(255, 512):
+    GF_EXP[_power] = GF_EXP[_power - 255]
+GF_EXP_ARRAY = np.array(GF_EXP, dtype=np.uint8)
+GF_LOG_ARRAY = np.array(GF_LOG, dtype=np.int32)
+
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+
+def gf_div(a, b):
+    if a == 0:
+        return 0
+    return GF_EXP[(GF_LOG[a] + 255 - GF_LOG[b]) % 255]
+
+
+# Function to evaluate a polynomial given lowest-degree coefficient first
+def gf_poly_eval(poly, x):
+    result = 0
+    for coefficient in reversed(poly):
+        result = gf_mul(result, x) ^ coefficient
+    return result
+
+
+# Function to build the RS generator polynomial (x - a^0)(x - a^1)...(x - a^(ec_count-1)),
+# highest-degree coefficient first, once per error correction length
+@functools.lru_cache(maxsize=None)
+def rs_generator(ec_count):
+    generator = [1]
+    for power in range(ec_count):
+        product = generator + [0]
+        for i, coefficient in enumerate(generator):
+            product[i + 1] ^= gf_mul(coefficient, GF_EXP[power])
+        generator = product
+    return tuple(generator)
+
+
+# Function to compute the error correction codewords of a block's data codewords
+def rs_encode(data_codewords, ec_count):
+    generator = rs_generator(ec_count)
+    remainder = list(data_codewords) + [0] * ec_count
+    for i in range(len(data_codewords)):
+        factor = remainder[i]
+        if factor:
+            for j in range(1, len(generator)):
+                remainder[i + j] ^= gf_mul(generator[j], factor)
+    return remainder[len(data_codewords):]
+
+
+# Function to tabulate the EC codewords of every unit data block: row i holds the EC codewords of data
+# that is 1 at index i and 0 elsewhere. RS is linear, so the EC change caused by XORing d into data
+# codeword i is row i scaled by d (see gf_scale); no block has to be re-encoded. Built once per shape.
+@functools.lru_cache(maxsize=None)
+def rs_unit_remainders(data_count, ec_count):
+    generator = np.array(rs_generator(ec_count)[1:], dtype=np.uint8)
+    rows = np.zeros((data_count, ec_count), dtype=np.uint8)
+    remainder = generator.copy()  # x^ec_count mod g(x), the unit in the last data position
+    for index in range(data_count - 1, -1, -1):
+        rows[index] = remainder
+        lead = int(remainder[0])
+        remainder = np.append(remainder[1:], np.uint8(0))
+        if lead:
+            remainder ^= gf_scale(generator, lead)
+    rows.setflags(write=False)
+    return rows
+
+
+# Function to multiply every element of a uint8 array by one GF(256) factor
+def gf_scale(values, factor):
+    if factor == 0:
+        return np.zeros_like(values)
+    scaled = GF_EXP_ARRAY[GF_LOG_ARRAY[values] + GF_LOG[factor]]
+    return np.where(values == 0, 0, scaled).astype(np.uint8)
+
+
+# Function to compute the RS syndromes of a received block (first codeword is the highest power of x)
+def rs_syndromes(codewords, ec_count):
+    syndromes = []
+    for power in range(ec_count):
+        x = GF_EXP[power]
+        value = 0
+        for codeword in codewords:
+            value = gf_mul(value, x) ^ codeword
+        syndromes.append(value)
+    return syndromes
+
+
+# Function to correct a received RS block in place of a copy. Returns the corrected codewords,
+# or None when the errors are beyond what the block can correct (Berlekamp-Massey, Chien, Forney).
+def rs_correct(codewords, ec_count):
+    syndromes = rs_syndromes(codewords, ec_count)
+    if not any(syndromes):
+        return list(codewords)
+
+    # Berlekamp-Massey: error locator polynomial, lowest-degree coefficient first
+    locator, previous = [1], [1]
+    errors, shift, previous_discrepancy = 0, 1, 1
+    for step in range(ec_count):
+        discrepancy = syndromes[step]
+        for i in range(1, errors + 1):
+            if i < len(locator):
+                discrepancy ^= gf_mul(locator[i], syndromes[step - i])
+        if discrepancy == 0:
+            shift += 1
+            continue
+        coefficient = gf_div(discrepancy, previous_discrepancy)
+        updated = locator + [0] * max(0, len(previous) + shift - len(locator))
+        for i, value in enumerate(previous):
+            updated[i + shift] ^= gf_mul(coefficient, value)
+        if 2 * errors <= step:
+            previous, previous_discrepancy = locator, discrepancy
+            errors = step + 1 - errors
+            shift = 1
+        else:
+            shift += 1
+        locator = updated
+
+    if 2 * errors > ec_count:
+        return None
+
+    # Chien search over the positions that exist in this (shortened) block
+    size = len(codewords)
+    positions = []
+    for index in range(size):
+        if gf_poly_eval(locator, GF_EXP[(255 - (size - 1 - index)) % 255]) == 0:
+            positions.append(index)
+    if len(positions) != errors:
+        return None
+
+    # Forney: error evaluator = S(x) * locator(x) mod x^ec_count
+    evaluator = [0] * ec_count
+    for i, syndrome in enumerate(syndromes):
+        for j, value in enumerate(locator):
+            if i + j < ec_count:
+                evaluator[i + j] ^= gf_mul(syndrome, value)
+    derivative = [locator[i] if i % 2 else 0 for i in range(1, len(locator))]
+
+    corrected = list(codewords)
+    for index in positions:
+        locator_value = GF_EXP[size - 1 - index]
+        inverse = GF_EXP[(255 - (size - 1 - index)) % 255]
+        denominator = gf_poly_eval(derivative, inverse)
+        if denominator == 0:
+            return None
+        corrected[index] ^= gf_div(gf_mul(locator_value, gf_poly_eval(evaluator, inverse)), denominator)
+
+    if any(rs_syndromes(corrected, ec_count)):
+        return None
+    return corrected
+
+
+# Function to mark every reserved module of a version (finders with separators, timing, alignment,
+# format information with the dark module, and version information from v7 up). Built with array
+# slicing once per version and cached; treat the returned array as read-only.
+@functools.lru_cache(maxsize=None)
+def function_pattern_mask(qr_version):
+    util.check_version(qr_version)
+    size = qr_version * 4 + 17
+    mask = np.zeros((size, size), dtype=bool)
+
+    # Finder patterns with separators, plus the format information next to them
+    mask[:9, :9] = True
+    mask[:9, size - 8:] = True
+    mask[size - 8:, :9] = True  # Also covers the dark module at (size - 8, 8)
+
+    # Alignment patterns, except where they would land on a finder pattern
+    for row in util.pattern_position(qr_version):
+        for col in util.pattern_position(qr_version):
+            if not mask[row, col]:
+                mask[row - 2:row + 3, col - 2:col + 3] = True
+
+    # Timing patterns
+    mask[6, :] = True
+    mask[:, 6] = True
+
+    # Version information blocks
+    if qr_version >= 7:
+        mask[:6, size - 11:size - 8] = True
+        mask[size - 11:size - 8, :6] = True
+
+    mask.setflags(write=False)
+    return mask
+
+
+# Function to reduce a thresholded box_size pixel array (1 = white) to one value per module.
+# A module counts as white only if its whole block is white, like the old per-block np.all check.
+def modules_from_pixels(binary_array, box_size):
+    rows, cols = binary_array.shape[0] // box_size, binary_array.shape[1] // box_size
+    blocks = binary_array[:rows * box_size, :cols * box_size].reshape(rows, box_size, cols, box_size)
+    return blocks.min(axis=(1, 3))
+
+
+# Function to list the free (not reserved), currently white modules of a grid in row-major order
+def candidate_index(grid, reserved):
+    return np.argwhere((grid == 1) & ~reserved).astype(np.int16)
+
+
+# Function to list the data-region modules in zigzag placement order (bit i of the codeword stream
+# lands on placement_order[i]; anything past the last codeword is a remainder bit)
+def placement_order(qr_version, reserved):
+    size = qr_version * 4 + 17
+    order = []
+    row, step = size - 1, -1
+    for col in range(size - 1, 0, -2):
+        if col <= 6:
+            col -= 1
+        while True:
+            for c in (col, col - 1):
+                if not reserved[row, c]:
+                    order.append((row, c))
+            row += step
+            if row < 0 or row >= size:
+                row -= step
+                step = -step
+                break
+    return np.array(order, dtype=np.int16)
+
+
+# Function to get the placement order and the module -> stream bit index (-1 for function patterns)
+# of a version. Neither depends on the error correction level or the mask, so they are built once
+# per version and shared by every layout of it; treat the returned arrays as read-only.
+@functools.lru_cache(maxsize=None)
+def data_placement(qr_version):
+    size = qr_version * 4 + 17
+    order = placement_order(qr_version, function_pattern_mask(qr_version))
+    bit_index = np.full((size, size), -1, dtype=np.int32)
+    bit_index[order[:, 0], order[:, 1]] = np.arange(len(order))
+    order.setflags(write=False)
+    bit_index.setflags(write=False)
+    return order, bit_index
+
+
+# Function to compute the boolean mask pattern (True = invert) over a whole symbol
+def mask_grid(mask_pattern, size):
+    i, j = np.indices((size, size))
+    if mask_pattern == 0:
+        return (i + j) % 2 == 0
+    if mask_pattern == 1:
+        return i % 2 == 0
+    if mask_pattern == 2:
+        return j % 3 == 0
+    if mask_pattern == 3:
+        return (i + j) % 3 == 0
+    if mask_pattern == 4:
+        return (i // 2 + j // 3) % 2 == 0
+    if mask_pattern == 5:
+        return (i * j) % 2 + (i * j) % 3 == 0
+    if mask_pattern == 6:
+        return ((i * j) % 2 + (i * j) % 3) % 2 == 0
+    if mask_pattern == 7:
+        return ((i * j) % 3 + (i + j) % 2) % 2 == 0
+    raise ValueError(f"Bad mask pattern: {mask_pattern}")
+
+
+# Function to read (error_correction, mask_pattern) from the format information of a module grid
+# (1 = white, 0 = black), picking the nearest valid BCH format word from either copy
+def read_format_info(grid):
+    size = grid.shape[0]
+    dark = 1 - grid
+    vertical, horizontal = 0, 0
+    for i in range(15):
+        row = i if i < 6 else (i + 1 if i < 8 else size - 15 + i)
+        vertical |= int(dark[row, 8]) << i
+        col = size - i - 1 if i < 8 else (15 - i if i < 9 else 15 - i - 1)
+        horizontal |= int(dark[8, col]) << i
+
+    best, best_distance = None, 16
+    for data in range(32):
+        bits = util.BCH_type_info(data)
+        distance = min(bin(bits ^ vertical).count('1'), bin(bits ^ horizontal).count('1'))
+        if distance < best_distance:
+            best, best_distance = data, distance
+    if best_distance > 3:
+        return None
+    return best >> 3, best & 7
+
+
+# Function to write both copies of the format information for (error_correction, mask_pattern) into
+# a module grid in place, at the positions read_format_info reads them from
+def write_format_info(grid, error_correction, mask_pattern):
+    size = grid.shape[0]
+    bits = util.BCH_type_info((error_correction << 3) | mask_pattern)
+    for i in range(15):
+        white = 1 - ((bits >> i) & 1)
+        row = i if i < 6 else (i + 1 if i < 8 else size - 15 + i)
+        grid[row, 8] = white
+        col = size - i - 1 if i < 8 else (15 - i if i < 9 else 15 - i - 1)
+        grid[8, col] = white
+
+
+# Function to derive the same symbol under another mask pattern without re-encoding it: every
+# data-region module (remainder bits included) is unmasked with the grid's own mask and masked with
+# the new one, and the format information is rewritten. Function patterns do not depend on the mask.
+def remask_grid(grid, mask_pattern):
+    size = grid.shape[0]
+    error_correction, current = read_format_info(grid)
+    toggle = (mask_grid(current, size) ^ mask_grid(mask_pattern, size)) & ~function_pattern_mask((size - 17) // 4)
+    remasked = np.where(toggle, 1 - grid, grid).astype(np.uint8)
+    write_format_info(remasked, error_correction, mask_pattern)
+    return remasked
+
+
+# Function to parse the segments of a data codeword stream into the decoded text (None if malformed)
+def parse_payload(data_codewords, qr_version):
+    bits = ''.join(format(codeword, '08b') for codeword in data_codewords)
+    position = 0
+    payload = bytearray()
+
+    def read(count):
+        nonlocal position
+        if position + count > len(bits):
+            raise ValueError("Segment runs past the end of the data codewords")
+        value = int(bits[position:position + count], 2) if count else 0
+        position += count
+        return value
+
+    try:
+        while len(bits) - position >= 4:
+            mode = read(4)
+            if mode == 0:  # Terminator
+                break
+            if mode == 7:  # ECI designator, the payload bytes are passed through unchanged
+                first = read(8)
+                if first & 0x80:
+                    read(8 if first & 0x40 == 0 else 16)
+                continue
+            if mode not in (util.MODE_NUMBER, util.MODE_ALPHA_NUM, util.MODE_8BIT_BYTE):
+                return None  # Kanji and structured append are outside what the search produces
+            count = read(util.length_in_bits(mode, qr_version))
+            if mode == util.MODE_NUMBER:
+                for start in range(0, count, 3):
+                    digits = min(3, count - start)
+                    value = read(util.NUMBER_LENGTH[digits])
+                    if value >= 10 ** digits:
+                        return None
+                    payload += str(value).zfill(digits).encode()
+            elif mode == util.MODE_ALPHA_NUM:
+                for start in range(0, count, 2):
+                    if count - start > 1:
+                        value = read(11)
+                        if value >= 45 * 45:
+                            return None
+                        payload += bytes((util.ALPHA_NUM[value // 45], util.ALPHA_NUM[value % 45]))
+                    else:
+                        value = read(6)
+                        if value >= 45:
+                            return None
+                        payload += bytes((util.ALPHA_NUM[value],))
+            else:
+                for _ in range(count):
+                    payload.append(read(8))
+    except ValueError:
+        return None
+
+    # The decoder hands back UTF-8; bytes that are not valid UTF-8 are taken as ISO-8859-1 like zbar does
+    try:
+        return payload.decode('utf-8')
+    except UnicodeDecodeError:
+        return payload.decode('latin-1')
+
+
+# Function to locate the segments of a data codeword stream as (mode, first content bit, character
+# count) tuples, following the same rules as parse_payload. Returns None if the stream is malformed.
+def segment_layout(data_codewords, qr_version):
+    total = len(data_codewords) * 8
+    position = 0
+    segments = []
+    bits = ''.join(format(codeword, '08b') for codeword in data_codewords)
+    while total - position >= 4:
+        mode = int(bits[position:position + 4], 2)
+        position += 4
+        if mode == 0:
+            break
+        if mode == 7:
+            first = int(bits[position:position + 8], 2)
+            position += 8 + (0 if not first & 0x80 else 8 if first & 0x40 == 0 else 16)
+            continue
+        if mode not in (util.MODE_NUMBER, util.MODE_ALPHA_NUM, util.MODE_8BIT_BYTE):
+            return None
+        length = util.length_in_bits(mode, qr_version)
+        if position + length > total:
+            return None
+        count = int(bits[position:position + length], 2)
+        position += length
+        segments.append((mode, position, count))
+        if mode == util.MODE_NUMBER:
+            position += 10 * (count // 3) + (util.NUMBER_LENGTH[count % 3] if count % 3 else 0)
+        elif mode == util.MODE_ALPHA_NUM:
+            position += 11 * (count // 2) + 6 * (count % 2)
+        else:
+            position += 8 * count
+        if position > total:
+            return None
+    return segments
+
+
+# Everything needed to decode a symbol of one (version, error correction, mask) without images
+class SymbolLayout:
+    def __init__(self, qr_version, error_correction, mask_pattern):
+        self.qr_version = qr_version
+        self.error_correction = error_correction
+        self.mask_pattern = mask_pattern
+        self.size = qr_version * 4 + 17
+        self.reserved = function_pattern_mask(qr_version)
+        self.order, self.bit_index = data_placement(qr_version)  # Module -> stream bit index (-1 for function patterns)
+        self.mask = mask_grid(mask_pattern, self.size)
+        self.blocks = base.rs_blocks(qr_version, error_correction)
+        self.codeword_count = sum(block.total_count for block in self.blocks)
+
+        # Stream position -> (block, index inside the block), following the qrcode interleaving
+        self.stream_layout = []
+        for i in range(max(block.data_count for block in self.blocks)):
+            for number, block in enumerate(self.blocks):
+                if i < block.data_count:
+                    self.stream_layout.append((number, i))
+        for i in range(max(block.total_count - block.data_count for block in self.blocks)):
+            for number, block in enumerate(self.blocks):
+                if i < block.total_count - block.data_count:
+                    self.stream_layout.append((number, block.data_count + i))
+
+    # Read the unmasked codeword stream of a module grid (1 = white, 0 = black)
+    def read_codewords(self, grid):
+        dark = (grid[self.order[:, 0], self.order[:, 1]] == 0) ^ self.mask[self.order[:, 0], self.order[:, 1]]
+        stream_bits = dark[:self.codeword_count * 8].astype(np.uint8)
+        return np.packbits(stream_bits).tolist()
+
+    # Split a codeword stream into per-block codeword lists (data first, then error correction)
+    def split_blocks(self, codewords):
+        blocks = [[0] * block.total_count for block in self.blocks]
+        for stream_position, (number, index) in enumerate(self.stream_layout):
+            blocks[number][index] = codewords[stream_position]
+        return blocks
+
+    # Decode per-block codewords to the payload text, or None on decode failure
+    def decode_blocks(self, blocks):
+        data_codewords = []
+        for block, codewords in zip(self.blocks, blocks):
+            corrected = rs_correct(codewords, block.total_count - block.data_count)
+            if corrected is None:
+                return None
+            data_codewords += corrected[:block.data_count]
+        return parse_payload(data_codewords, self.qr_version)
+
+
+# Function to get the layout of a (version, error correction, mask) symbol, built once per process
+@functools.lru_cache(maxsize=None)
+def symbol_layout(qr_version, error_correction, mask_pattern):
+    return SymbolLayout(qr_version, error_correction, mask_pattern)
+
+
+# Function to decode a module grid (1 = white, 0 = black, no border) without any image processing
+def decode_grid(grid):
+    size = grid.shape[0]
+    if (size - 17) % 4 or not 1 <= (size - 17) // 4 <= 40:
+        return None
+    format_info = read_format_info(grid)
+    if format_info is None:
+        return None
+    layout = symbol_layout((size - 17) // 4, *format_info)
+    return layout.decode_blocks(layout.split_blocks(layout.read_codewords(grid)))
+
+
+# Predicts what a decoder reads after white -> black flips by working on codewords directly:
+# a flip toggles one bit of one codeword, and only the RS blocks it touches are re-decoded.
+# Flips on function patterns are treated as absorbed by the decoder (format info is BCH protected
+# and finder/timing detection tolerates single modules), so they leave the payload unchanged.
+class AnalyticEvaluator:
+    def __init__(self, grid, qr_version, error_correction=None, mask_pattern=None):
+        if error_correction is None or mask_pattern is None:
+            error_correction, mask_pattern = read_format_info(grid)
+        self.grid = grid
+        self.layout = symbol_layout(qr_version, error_correction, mask_pattern)
+        self.codewords = self.layout.read_codewords(grid)
+        self.blocks = self.layout.split_blocks(self.codewords)
+        self.base_data = [codewords[:block.data_count] for block, codewords in zip(self.layout.blocks, self.blocks)]
+        self.base_payload = self.layout.decode_blocks(self.blocks)
+
+    # Map module flips to {block: {index: xor mask}} (remainder bits and function patterns drop out)
+    def codeword_changes(self, positions):
+        changes = {}
+        for row, col in positions:
+            if self.grid[row, col] == 0:
+                continue  # Already black, nothing changes
+            bit = int(self.layout.bit_index[row, col])
+            if bit < 0 or bit >= self.layout.codeword_count * 8:
+                continue
+            number, index = self.layout.stream_layout[bit // 8]
+            block_changes = changes.setdefault(number, {})
+            block_changes[index] = block_changes.get(index, 0) ^ (0x80 >> (bit % 8))
+        return changes
+
+    # Predict the decoded payload with the given module positions flipped to black
+    def evaluate(self, positions):
+        changes = self.codeword_changes(positions)
+        if not changes:
+            return self.base_payload
+
+        data_codewords = []
+        for number, (block, codewords) in enumerate(zip(self.layout.blocks, self.blocks)):
+            if number not in changes:
+                data_codewords += self.base_data[number]
+                continue
+            received = list(codewords)
+            for index, xor in changes[number].items():
+                received[index] ^= xor
+            corrected = rs_correct(received, block.total_count - block.data_count)
+            if corrected is None:
+                return None
+            data_codewords += corrected[:block.data_count]
+        return parse_payload(data_codewords, self.layout.qr_version)
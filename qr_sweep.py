@@ -0,0 +1,111 @@
+import time
+
+import numpy as np
+import qrcode
+from qrcode import util
+
+from qr_batch import ERROR_CORRECTION_LEVELS
+from qr_exhaustive import PayloadSet, strategy_hits
+from qr_stats import SearchStats, logger
+from qr_structure import remask_grid
+
+
+MASK_PATTERNS = tuple(range(8))
+
+
+# Function to score a grid with qrcode's mask penalty (lower wins). qrcode scores its candidates
+# with the format and version information left light, so those modules are cleared first.
+def mask_penalty(grid):
+    size = grid.shape[0]
+    scored = grid.copy()
+    scored[[0, 1, 2, 3, 4, 5, 7, 8], 8] = 1
+    scored[size - 8:, 8] = 1  # Includes the dark module
+    scored[8, [0, 1, 2, 3, 4, 5, 7]] = 1
+    scored[8, size - 8:] = 1
+    if size >= 45:  # Version information from v7 up
+        scored[:6, size - 11:size - 8] = 1
+        scored[size - 11:size - 8, :6] = 1
+    return util.lost_point((scored == 0).tolist())
+
+
+# Function to encode a URL once per ECC level and derive every requested mask from that encoding.
+# Yields (level, mask, grid, qr, seconds): the data codewords (qr.data_cache) and the mask-0 symbol
+# are built once per level, the other masks by qr_structure.remask_grid, which only XORs the data
+# region and rewrites the format information. qr is shared by the masks of a level (the searches
+# only read its version and error correction). seconds is the time spent producing that grid; the
+# shared encoding is counted against the level's first mask. Levels the URL does not fit are skipped.
+def sweep_variants(url, qr_version=None, levels=tuple(ERROR_CORRECTION_LEVELS), masks=MASK_PATTERNS):
+    for level in levels:
+        start_time = time.perf_counter()
+        qr = qrcode.QRCode(version=qr_version, error_correction=ERROR_CORRECTION_LEVELS[level], border=0)
+        qr.add_data(url)
+        try:
+            qr.best_fit(start=qr_version)
+        except (ValueError, qrcode.exceptions.DataOverflowError):
+            logger.warning("%s does not fit a QR code at ECC %s; skipping the level", url, level)
+            continue
+        qr.makeImpl(False, 0)  # The one full build per level; qrcode's make() would do this for all 8 masks
+        base = np.where(np.array(qr.modules, dtype=bool), 0, 1).astype(np.uint8)
+        for mask in masks:
+            grid = base if mask == 0 else remask_grid(base, mask)
+            now = time.perf_counter()
+            yield level, mask, grid, qr, now - start_time
+            start_time = time.perf_counter()
+
+
+# Function to search one URL under every (ECC level, mask) pair and report, per pair, how many flip
+# sets and distinct payloads the strategy reaches and how long it took, as a JSON-ready dict.
+# Fewer hits means a symbol that is harder to tamper with. library_mask is the mask qrcode would
+# have picked by its own penalty score, for comparison. search_options go to
+# qr_exhaustive.strategy_hits (k, adjacency, evaluator, max_characters, decoder, order, validator, ...).
+# time_limit (seconds) budgets each (ECC, mask) search separately; a result that ran out of time has
+# timed_out set and its hit counts only cover stats['coverage'] of that symbol's space.
+def run_sweep(url, qr_version=None, levels=tuple(ERROR_CORRECTION_LEVELS), masks=MASK_PATTERNS, strategy='single',
+              on_result=None, time_limit=None, **search_options):
+    results = []
+    penalties = {}
+    for level, mask, grid, qr, encode_seconds in sweep_variants(url, qr_version, levels, masks):
+        stats = SearchStats(time_limit=time_limit)
+        start_time = time.perf_counter()
+        hits = strategy_hits(grid, qr, url, strategy, stats=stats, **search_options)
+        stats.stage_seconds['encode'] += encode_seconds
+        stats.add_time('encode', start_time)
+
+        seen = PayloadSet()
+        first_hit = None
+        for _, modified_url, positions in hits:
+            if first_hit is None:
+                first_hit = {'url': modified_url, 'positions': [list(position) for position in positions]}
+            if seen.add(modified_url):
+                stats.results += 1
+            else:
+                stats.duplicate_payloads += 1
+        stats.finish()
+
+        penalties.setdefault(level, {})[mask] = mask_penalty(grid)
+        result = {'ecc': level, 'mask': mask, 'version': qr.version, 'hits': stats.hits,
+                  'distinct_payloads': stats.results, 'first_hit': first_hit, 'timed_out': stats.timed_out,
+                  'seconds': round(stats.elapsed + encode_seconds, 6), 'stats': stats.as_dict()}
+        logger.info("ECC %s mask %d (v%d): %d hits, %d distinct payloads in %.2fs", level, mask, qr.version,
+                    stats.hits, stats.results, result['seconds'])
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    # qrcode picks the mask with the lowest penalty; only meaningful when all 8 were swept
+    summary = {}
+    for level in penalties:
+        level_results = [result for result in results if result['ecc'] == level]
+        library_mask = min(penalties[level], key=penalties[level].get) if len(penalties[level]) == 8 else None
+        for result in level_results:
+            result['penalty'] = penalties[level][result['mask']]
+            result['library_default'] = result['mask'] == library_mask
+        fewest = min(level_results, key=lambda result: (result['hits'], result['mask']))
+        summary[level] = {'fewest_hits_mask': fewest['mask'], 'fewest_hits': fewest['hits'],
+                          'library_mask': library_mask}
+    settings = dict(search_options)
+    if settings.get('validator') is not None:
+        settings['validator'] = settings['validator'].settings()
+    return {'url': url, 'strategy': strategy, 'version': qr_version, 'levels': list(levels), 'masks': list(masks),
+            'time_limit': time_limit, 'settings': settings, 'results': results, 'summary': summary,
+            'skipped_levels': [level for level in levels if level not in penalties]}
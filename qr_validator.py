@@ -0,0 +1,190 @@
+import ipaddress
+import json
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Byte table for the printable check: True for printable ASCII (32..126). A payload is printable
+# when none of its UTF-8 bytes misses the table, so anything non-ASCII is unprintable as before.
+PRINTABLE_BYTES = np.zeros(256, dtype=bool)
+PRINTABLE_BYTES[32:127] = True
+
+# scheme://[userinfo@]host[:port][/path][?query][#fragment], the parts a browser needs to navigate
+URL_PATTERN = re.compile(r'(?P<scheme>[A-Za-z][A-Za-z0-9+.-]*)://(?:[^/?#@]*@)?'
+                         r'(?P<host>\[[0-9A-Fa-f:.]+\]|[^/?#:\[\]]*)(?::(?P<port>[0-9]*))?(?P<rest>[/?#].*)?',
+                         re.DOTALL)
+HOST_LABEL = re.compile(r'(?!-)[A-Za-z0-9-]{1,63}(?<!-)')
+
+# Characters and pairs that read alike in a URL bar, folded onto one form before the similarity is
+# scored, so "examp1e.corn" scores as close to "example.com" as it looks
+HOMOGLYPH_PAIRS = (('rn', 'm'), ('vv', 'w'), ('cl', 'd'))
+HOMOGLYPHS = str.maketrans({'0': 'o', '1': 'l', 'i': 'l', '|': 'l', '!': 'l', '5': 's', '$': 's', '3': 'e',
+                            '4': 'a', '@': 'a', '7': 't', '9': 'g', '6': 'b', '8': 'b', '2': 'z'})
+
+# Why a printable payload was turned down, as stored in a verdict's 'reason'
+REJECTIONS = ('unprintable', 'not_url', 'scheme', 'host', 'denied', 'not_allowed', 'dissimilar')
+
+
+# Function to check many payloads for printable ASCII in one pass: the payloads' UTF-8 bytes are
+# joined into one array, looked up in PRINTABLE_BYTES, and the misses counted per payload from a
+# running sum over the offsets
+def printable_mask(payloads):
+    encoded = [payload.encode('utf-8') for payload in payloads]
+    ends = np.cumsum([len(data) for data in encoded])
+    starts = ends - [len(data) for data in encoded]
+    misses = np.concatenate(([0], np.cumsum(~PRINTABLE_BYTES[np.frombuffer(b''.join(encoded), dtype=np.uint8)])))
+    return misses[ends] == misses[starts]
+
+
+# Function to fold a string onto its homoglyph skeleton: lower case, look-alike pairs and characters merged
+def skeleton(text):
+    text = text.lower()
+    for pair, replacement in HOMOGLYPH_PAIRS:
+        text = text.replace(pair, replacement)
+    return text.translate(HOMOGLYPHS)
+
+
+# Function to compute the Levenshtein distance from one reference string to many others at once. The
+# others are padded into one (count, longest) code array and the dynamic programme runs one reference
+# character at a time over all of them together; a column only depends on the columns before it, so
+# each string's distance is read off at its own length whatever the padding holds.
+def edit_distances(reference, others):
+    if not others:
+        return np.zeros(0, dtype=np.int64)
+    lengths = np.array([len(other) for other in others])
+    codes = np.zeros((len(others), max(lengths.max(), 1)), dtype=np.int64)
+    for row, other in enumerate(others):
+        codes[row, :len(other)] = [ord(char) for char in other]
+    steps = np.arange(codes.shape[1] + 1)
+    previous = np.broadcast_to(steps, (len(others), len(steps))).copy()
+    current = np.empty_like(previous)
+    for index, char in enumerate(reference, 1):
+        current[:, 0] = index
+        np.minimum(previous[:, 1:] + 1, previous[:, :-1] + (codes != ord(char)), out=current[:, 1:])
+        # Insertions chain along the row: current[j] = min over k <= j of current[k] + (j - k)
+        current = np.minimum.accumulate(current - steps, axis=1) + steps
+        previous, current = current, previous
+    return previous[np.arange(len(others)), lengths]
+
+
+# Function to split a URL into (scheme, host, port) with the precompiled grammar, or None if it is not one
+def parse_url(payload):
+    match = URL_PATTERN.fullmatch(payload)
+    if match is None:
+        return None
+    return match['scheme'].lower(), match['host'].lower(), match['port']
+
+
+# Function to check a host name: an IP address, or dot-separated labels of letters, digits and inner
+# hyphens with a top-level label that is not all digits (253 characters at most)
+def valid_host(host):
+    if host.startswith('['):
+        try:
+            return ipaddress.ip_address(host[1:-1]).version == 6
+        except ValueError:
+            return False
+    labels = host.rstrip('.').split('.')
+    if not host or len(host) > 253 or not all(HOST_LABEL.fullmatch(label) for label in labels):
+        return False
+    if labels[-1].isdigit():
+        try:
+            ipaddress.IPv4Address(host)
+        except ValueError:
+            return False
+    return True
+
+
+# Function to check whether a host is one of the domains or a subdomain of one
+def in_domains(host, domains):
+    host = host.rstrip('.')
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+# Decides which decoded payloads count as hits and scores how much each looks like the original URL.
+# A verdict is a dict: printable, url (parses as scheme://host...), scheme, host, edits (Levenshtein
+# distance to the original on homoglyph skeletons), similarity (1 - edits / longer length), accepted
+# and reason (None, or one of REJECTIONS). A payload is accepted when it is printable ASCII and, with
+#   require_url    it parses as a URL with a scheme from schemes and a valid host
+#   allow          its host is one of these domains or below one (a non-URL has no host and fails)
+#   deny           its host is none of these domains nor below one
+#   min_similarity it scores at least this similar to the original
+# With none of those set it accepts exactly what is_human_readable did. Verdicts are cached per
+# distinct payload (least recently used out past max_entries), since many flips decode to the same
+# string; validate_batch works out the uncached ones together.
+class PayloadValidator:
+    def __init__(self, original_url, require_url=False, schemes=('http', 'https'), allow=None, deny=None,
+                 min_similarity=None, max_entries=100_000):
+        self.original_url = original_url
+        self.original_skeleton = skeleton(original_url)
+        self.require_url = require_url
+        self.schemes = tuple(scheme.lower() for scheme in schemes)
+        self.allow = tuple(domain.lower().rstrip('.') for domain in allow or ())
+        self.deny = tuple(domain.lower().rstrip('.') for domain in deny or ())
+        self.min_similarity = min_similarity
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Settings that change verdicts, for reports and shard identities
+    def settings(self):
+        return {'require_url': self.require_url, 'schemes': list(self.schemes), 'allow': list(self.allow),
+                'deny': list(self.deny), 'min_similarity': self.min_similarity}
+
+    # The settings as one string, for checkpoint modes
+    def key(self):
+        return json.dumps(self.settings(), sort_keys=True, separators=(',', ':'))
+
+    # Work out the verdicts of payloads not seen before, all in one pass
+    def _judge(self, payloads):
+        printable = printable_mask(payloads)
+        skeletons = [skeleton(payload) for payload in payloads]
+        edits = edit_distances(self.original_skeleton, skeletons)
+        verdicts = []
+        for payload, is_printable, distance, folded in zip(payloads, printable.tolist(), edits.tolist(), skeletons):
+            parts = parse_url(payload)
+            scheme, host, port = parts if parts is not None else (None, None, None)
+            longer = max(len(folded), len(self.original_skeleton)) or 1
+            verdict = {'printable': is_printable, 'url': parts is not None, 'scheme': scheme, 'host': host,
+                       'edits': distance, 'similarity': round(1 - distance / longer, 4), 'reason': None}
+            if not is_printable:
+                verdict['reason'] = 'unprintable'
+            elif self.require_url and parts is None:
+                verdict['reason'] = 'not_url'
+            elif self.require_url and scheme not in self.schemes:
+                verdict['reason'] = 'scheme'
+            elif self.require_url and (not valid_host(host) or (port and int(port) > 65535)):
+                verdict['reason'] = 'host'
+            elif self.deny and host is not None and in_domains(host, self.deny):
+                verdict['reason'] = 'denied'
+            elif self.allow and (host is None or not in_domains(host, self.allow)):
+                verdict['reason'] = 'not_allowed'
+            elif self.min_similarity is not None and verdict['similarity'] < self.min_similarity:
+                verdict['reason'] = 'dissimilar'
+            verdict['accepted'] = verdict['reason'] is None
+            verdicts.append(verdict)
+        return verdicts
+
+    # Verdicts for many payloads (None entries get None), judging the distinct uncached ones together
+    def validate_batch(self, payloads):
+        cache = self.cache
+        fresh = list(dict.fromkeys(payload for payload in payloads if payload is not None and payload not in cache))
+        self.misses += len(fresh)
+        for payload, verdict in zip(fresh, self._judge(fresh) if fresh else ()):
+            cache[payload] = verdict
+        verdicts = []
+        for payload in payloads:
+            if payload is None:
+                verdicts.append(None)
+                continue
+            cache.move_to_end(payload)
+            verdicts.append(cache[payload])
+        self.hits += sum(payload is not None for payload in payloads) - len(fresh)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return verdicts
+
+    def validate(self, payload):
+        return self.validate_batch([payload])[0]
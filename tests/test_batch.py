@@ -0,0 +1,49 @@
+import io
+import json
+
+from qr_batch import run_batch
+
+LINES = [
+    'http://a.co/x\n',
+    '{"url": "http://a.co/y", "version": 3, "ecc": "m"}\n',
+    '{"url": "http://a.co/z"\n',  # Truncated JSON
+    '{"url": 42}\n',
+    '{"url": "http://a.co/x", "version": 41}\n',
+    '{"url": "http://a.co/x", "ecc": "Z"}\n',
+    '  http://a.co/w  \n',
+]
+
+
+# Every non-blank input line gives exactly one JSONL record, in input order, whether it ran or was refused
+def test_one_record_per_line():
+    output = io.StringIO()
+    assert run_batch(LINES, output, decoder='grid') == len(LINES)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(records) == len(LINES)
+
+    ran, refused = [0, 1, 6], [2, 3, 4, 5]
+    assert [records[index]['url'] for index in ran] == ['http://a.co/x', 'http://a.co/y', 'http://a.co/w']
+    assert (records[1]['version'], records[1]['ecc']) == (3, 'M')
+    for index in ran:
+        assert 'error' not in records[index]
+        assert records[index]['stats']['covered'] == records[index]['stats']['total']
+    for index in refused:
+        assert records[index]['input'] == LINES[index].rstrip('\n')
+        assert records[index]['error'].split(':')[0] in ('ValueError', 'JSONDecodeError')
+
+
+def test_blank_lines_and_comments_are_skipped():
+    output = io.StringIO()
+    assert run_batch(['\n', '# a comment\n', 'http://a.co/x\n', '   \n'], output, decoder='grid') == 1
+    assert [json.loads(line)['url'] for line in output.getvalue().splitlines()] == ['http://a.co/x']
+
+
+# A job that fails inside the search is reported on its own line without ending the batch
+def test_failing_job_does_not_end_the_batch():
+    output = io.StringIO()
+    too_long = 'http://a.co/' + 'x' * 3000  # Past what a version 40 symbol holds
+    run_batch([too_long + '\n', 'http://a.co/x\n'], output, decoder='grid')
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(records) == 2
+    assert records[0]['url'] == too_long and records[0]['error'].startswith('ValueError')
+    assert records[1]['url'] == 'http://a.co/x' and 'error' not in records[1]
@@ -0,0 +1,48 @@
+from qr_cache import ResultCache
+
+SYMBOL = ResultCache.symbol_key('https://www.hello.com', 1, 1, 0, 'image/grid', scale=4)
+
+
+def test_hits_and_misses_are_counted(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'))
+    assert cache.get(SYMBOL, [(9, 9)]) == (False, None)
+    cache.put(SYMBOL, [(9, 9)], 'https://www.hel1o.com')
+    assert cache.get(SYMBOL, [(9, 9)]) == (True, 'https://www.hel1o.com')  # From the write buffer
+    cache.flush()
+    assert cache.get(SYMBOL, [(9, 9)]) == (True, 'https://www.hel1o.com')  # From the file
+    assert cache.get(SYMBOL, [(9, 10)]) == (False, None)
+    assert cache.stats() == {'hits': 2, 'misses': 2}
+    cache.close()
+
+
+# A flip set that did not decode is a result too: found, with None as the payload
+def test_decode_failures_are_stored_as_results(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(path)
+    cache.put(SYMBOL, [(9, 9), (10, 12)], None)
+    assert cache.get(SYMBOL, [(10, 12), (9, 9)]) == (True, None)  # Flip sets match in any order
+    cache.close()
+
+    cache = ResultCache(path)
+    assert cache.get(SYMBOL, [(9, 9), (10, 12)]) == (True, None)
+    assert cache.get(ResultCache.symbol_key('https://www.hello.com', 1, 1, 0, 'image/grid', scale=8),
+                     [(9, 9), (10, 12)]) == (False, None)  # Another render size is another symbol
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(path, max_entries=3, flush_every=1)
+    for col in (1, 2, 3):
+        cache.put(SYMBOL, [(9, col)], f'payload {col}')
+    assert cache.get(SYMBOL, [(9, 1)]) == (True, 'payload 1')  # Now the most recently used
+    cache.put(SYMBOL, [(9, 4)], 'payload 4')  # Past max_entries: (9, 2) is the oldest
+    assert [cache.get(SYMBOL, [(9, col)])[0] for col in (1, 2, 3, 4)] == [True, False, True, True]
+    cache.close()
+
+    # Recency is kept in the file, so eviction continues where the last session left off
+    cache = ResultCache(path, max_entries=3, flush_every=1)
+    cache.put(SYMBOL, [(9, 5)], 'payload 5')
+    assert [cache.get(SYMBOL, [(9, col)])[0] for col in (1, 3, 4, 5)] == [False, True, True, True]
+    cache.close()
@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+import qrcode
+
+import qr_checkpoint
+from qr_checkpoint import checkpoint_identity, load_checkpoint, save_checkpoint
+from qr_engine import find_modified_qr_code_url
+
+# No single flip of this URL reads as another printable payload, so every search runs to the end
+URL = 'http://a.co/x'
+
+
+# Function to run the single-flip search with the grid backend, checkpointing into path
+def run_search(path, resume=False, **options):
+    return find_modified_qr_code_url(URL, decoder='grid', checkpoint_path=str(path), checkpoint_every=50,
+                                     resume=resume, **options)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'search.ckpt')
+    identity = checkpoint_identity(URL, 2, qrcode.constants.ERROR_CORRECT_L, 'single/image')
+    assert load_checkpoint(path, identity) is None
+    save_checkpoint(path, identity, 7, 7, [{'url': 'x', 'position': [9, 9]}])
+    state = load_checkpoint(path, identity)
+    assert (state['cursor'], state['results'], state['finished']) == (7, [{'url': 'x', 'position': [9, 9]}], False)
+    assert os.listdir(tmp_path) == ['search.ckpt']  # The temp file was renamed over it
+
+
+# A write that fails half way leaves the previous checkpoint as it was
+def test_failed_write_keeps_the_previous_checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / 'search.ckpt')
+    identity = checkpoint_identity(URL, 2, qrcode.constants.ERROR_CORRECT_L, 'single/image')
+    save_checkpoint(path, identity, 7, 7, [])
+
+    def broken_dump(state, file, **options):
+        file.write('{"identity":')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(qr_checkpoint.json, 'dump', broken_dump)
+    with pytest.raises(OSError):
+        save_checkpoint(path, identity, 9, 9, [])
+    monkeypatch.undo()
+    assert load_checkpoint(path, identity)['cursor'] == 7
+
+
+@pytest.mark.parametrize('options', ({'error_correction': qrcode.constants.ERROR_CORRECT_M}, {'order': 'printable'},
+                                     {'qr_version': 5}))
+def test_resume_refuses_a_different_search(tmp_path, options):
+    path = tmp_path / 'search.ckpt'
+    run_search(path)
+    with pytest.raises(ValueError, match='refusing to resume'):
+        run_search(path, resume=True, **options)
+
+
+def test_resume_continues_from_the_cursor(tmp_path):
+    path = tmp_path / 'search.ckpt'
+    _, _, full = run_search(path)
+    with open(path) as file:
+        state = json.load(file)
+    assert state['finished'] and state['cursor'] == full.total
+
+    save_checkpoint(str(path), state['identity'], 40, 40, [])
+    modified_url, position, stats = run_search(path, resume=True)
+    assert (modified_url, position) == (None, None)
+    assert stats.candidates_considered == full.total - 40
+    assert stats.covered == full.total
+    assert load_checkpoint(str(path), state['identity'])['finished']
+
+
+# A finished checkpoint answers from its stored hit without searching again
+def test_resume_of_a_finished_search_returns_its_hit(tmp_path):
+    path = tmp_path / 'search.ckpt'
+    run_search(path)
+    with open(path) as file:
+        identity = json.load(file)['identity']
+    save_checkpoint(str(path), identity, 3, 3, [{'url': 'http://a.co/y', 'position': [9, 10]}], finished=True)
+    modified_url, position, stats = run_search(path, resume=True)
+    assert (modified_url, position) == ('http://a.co/y', (9, 10))
+    assert stats.candidates_considered == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from qr_engine import create_qr_matrix
+from qr_packed import (PackedResultWriter, PackedResults, apply_flips, flip_indices, flip_positions, pack_grid,
+                       unpack_grid)
+
+
+@pytest.mark.parametrize('qr_version', (1, 2, 7, 40))
+def test_grid_round_trip(qr_version):
+    size = qr_version * 4 + 17
+    grid = np.random.default_rng(qr_version).integers(0, 2, (size, size), dtype=np.uint8)
+    packed = pack_grid(grid)
+    assert packed.nbytes == -(-size * size // 8)
+    assert np.array_equal(unpack_grid(packed, size), grid)
+
+
+def test_flip_indices_round_trip():
+    positions = [(0, 0), (176, 176), (5, 170), (170, 5)]
+    indices = flip_indices(positions, 177)
+    assert indices.dtype == np.uint16
+    assert flip_positions(indices, 177) == positions
+    assert flip_positions(flip_indices([], 177), 177) == []
+
+
+def test_apply_flips_blackens_the_flipped_modules():
+    grid, _ = create_qr_matrix('https://www.hello.com')
+    positions = [tuple(position) for position in np.argwhere(grid == 1)[:5].tolist()]
+    expected = grid.copy()
+    for row, col in positions:
+        expected[row, col] = 0
+    assert np.array_equal(apply_flips(grid, flip_indices(positions, grid.shape[0])), expected)
+    assert grid[positions[0]] == 1  # The base grid is left alone
+
+
+def test_result_collection_round_trip(tmp_path):
+    grid, qr = create_qr_matrix('https://www.hello.com', 40)
+    records = [{'url': 'https://www.hel1o.com', 'positions': [[9, 10]]},
+               {'url': 'https://www.héllo.com', 'positions': [[9, 10], [176, 0], [100, 120]]},
+               {'url': '', 'positions': []}]
+    with PackedResultWriter(str(tmp_path), grid, 'https://www.hello.com', qr.version, qr.error_correction) as writer:
+        for record in records:
+            writer.add(record)
+
+    results = PackedResults(str(tmp_path))
+    assert len(results) == len(records)
+    assert list(results) == records
+    assert results[-1] == records[-1]
+    assert np.array_equal(results.grid, grid)
+    assert results.meta['version'] == 40
+    assert np.array_equal(results.modified_grid(1), apply_flips(grid, flip_indices(records[1]['positions'], 177)))
+    with pytest.raises(IndexError):
+        results[3]
+
+
+def test_empty_and_unfinished_collections(tmp_path):
+    grid, qr = create_qr_matrix('https://www.hello.com')
+    PackedResultWriter(str(tmp_path / 'empty'), grid).close()
+    assert list(PackedResults(str(tmp_path / 'empty'))) == []
+
+    writer = PackedResultWriter(str(tmp_path / 'open'), grid)
+    writer.add({'url': 'x', 'positions': [[9, 9]]})
+    with pytest.raises(ValueError):
+        PackedResults(str(tmp_path / 'open'))  # No meta.json until close()
+    writer.close()
+    assert len(PackedResults(str(tmp_path / 'open'))) == 1
@@ -0,0 +1,79 @@
+import pytest
+
+from qr_exhaustive import exhaustive_search, write_jsonl
+from qr_shard import merge_shards, parse_shard, write_shard_stats
+from qr_stats import SearchStats
+
+# A URL whose codeword search finds dozens of variants in well under a second with the grid backend
+URL = 'http://a.co/x'
+IDENTITY = {'url': URL, 'strategy': 'codeword', 'decoder': 'grid'}
+
+
+# Function to run one shard of the codeword search into path, as the exhaustive command does (keep=1:
+# only the shard's first hit, as search --shard does)
+def run_shard(path, shard, keep=None, deduplicate=True):
+    stats = SearchStats()
+    records = exhaustive_search(URL, strategy='codeword', decoder='grid', stats=stats, deduplicate=deduplicate,
+                                shard=shard)
+    with open(path, 'w') as output:
+        write_jsonl(list(records)[:keep], output)
+    write_shard_stats(str(path), dict(IDENTITY, deduplicate=deduplicate, first_hit=keep == 1), shard, stats)
+
+
+@pytest.mark.parametrize('count', (1, 3, 4))
+@pytest.mark.parametrize('deduplicate', (True, False))
+def test_merged_shards_equal_a_full_run(tmp_path, count, deduplicate):
+    full = list(exhaustive_search(URL, strategy='codeword', decoder='grid', deduplicate=deduplicate))
+    assert len(full) > 1
+    paths = [tmp_path / f'shard{index}.jsonl' for index in range(count)]
+    for index, path in enumerate(paths):
+        run_shard(path, (index, count), deduplicate=deduplicate)
+    merged, report = merge_shards([str(path) for path in reversed(paths)])
+    assert merged == full
+    assert report['stats']['results'] == len(full)
+
+
+# Each shard of a first-hit search keeps only its own first hit; the merge must pick the overall first
+def test_merged_first_hits_equal_the_first_hit(tmp_path):
+    first = next(exhaustive_search(URL, strategy='codeword', decoder='grid', deduplicate=False))
+    paths = [tmp_path / f'shard{index}.jsonl' for index in range(3)]
+    for index, path in enumerate(paths):
+        run_shard(path, (index, 3), keep=1, deduplicate=False)
+    merged, _ = merge_shards([str(path) for path in paths])
+    assert merged == [first]
+
+
+def test_merge_refuses_incomplete_or_mixed_shards(tmp_path):
+    paths = [tmp_path / f'shard{index}.jsonl' for index in range(3)]
+    for index, path in enumerate(paths):
+        run_shard(path, (index, 3))
+    with pytest.raises(ValueError):
+        merge_shards([str(path) for path in paths[:2]])
+    write_shard_stats(str(paths[2]), dict(IDENTITY, url='http://b.co/x'), (2, 3), SearchStats())
+    with pytest.raises(ValueError):
+        merge_shards([str(path) for path in paths])
+
+
+@pytest.mark.parametrize('text', ('3/3', '1', 'a/b', '-1/2', '0/0'))
+def test_parse_shard_rejects_bad_shards(text):
+    with pytest.raises(ValueError):
+        parse_shard(text)
+
+
+# Each hit's degraded scans are seeded from the hit, so robustness reports survive sharding too
+def test_merged_robustness_reports_equal_a_full_run(tmp_path):
+    robustness = {'variants': 4, 'decoder': 'opencv'}
+    full = list(exhaustive_search(URL, strategy='codeword', decoder='grid', robustness=robustness))
+    paths = [tmp_path / f'shard{index}.jsonl' for index in range(3)]
+    for index, path in enumerate(paths):
+        stats = SearchStats()
+        records = exhaustive_search(URL, strategy='codeword', decoder='grid', stats=stats, shard=(index, 3),
+                                    robustness=robustness)
+        with open(path, 'w') as output:
+            write_jsonl(records, output)
+        write_shard_stats(str(path), dict(IDENTITY, deduplicate=True, first_hit=False), (index, 3), stats)
+    merged, _ = merge_shards([str(path) for path in paths])
+    timing = ('seconds', 'degrade_seconds')
+    assert [{key: value for key, value in record.pop('robustness').items() if key not in timing} for record in merged] \
+        == [{key: value for key, value in record.pop('robustness').items() if key not in timing} for record in full]
+    assert merged == full
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import qrcode
+from qrcode import util
+
+from qr_engine import create_qr_matrix
+from qr_structure import (AnalyticEvaluator, decode_grid, function_pattern_mask, read_format_info, remask_grid,
+                          rs_encode, symbol_layout)
+
+URL = 'https://example.com/login?next=/account'
+LEVELS = (qrcode.constants.ERROR_CORRECT_L, qrcode.constants.ERROR_CORRECT_M, qrcode.constants.ERROR_CORRECT_Q,
+          qrcode.constants.ERROR_CORRECT_H)
+
+
+# Function to encode URL with qrcode at a fixed version, level and mask as a module grid (1 = white)
+def reference_symbol(qr_version, error_correction, mask_pattern, url=URL):
+    qr = qrcode.QRCode(version=qr_version, error_correction=error_correction, mask_pattern=mask_pattern, border=0)
+    qr.add_data(url)
+    qr.make(fit=False)
+    return np.where(np.array(qr.modules, dtype=bool), 0, 1).astype(np.uint8), qr
+
+
+# Function to get the modules qrcode reserves for a version: whatever is already set when it maps the data
+def reference_reserved(qr_version):
+    qr = qrcode.QRCode(version=qr_version, border=0)
+    qr.add_data('a')
+    reserved = {}
+
+    def capture(data, mask_pattern):
+        reserved['mask'] = np.array([[module is not None for module in row] for row in qr.modules])
+
+    qr.map_data = capture
+    qr.makeImpl(False, 0)
+    return reserved['mask']
+
+
+@pytest.mark.parametrize('qr_version', range(1, 41))
+def test_function_pattern_mask_matches_qrcode(qr_version):
+    assert np.array_equal(function_pattern_mask(qr_version), reference_reserved(qr_version))
+
+
+@pytest.mark.parametrize('qr_version', (5, 7, 10, 25, 40))
+@pytest.mark.parametrize('error_correction', LEVELS)
+@pytest.mark.parametrize('mask_pattern', (0, 5))
+def test_codeword_stream_matches_qrcode(qr_version, error_correction, mask_pattern):
+    grid, qr = reference_symbol(qr_version, error_correction, mask_pattern)
+    layout = symbol_layout(qr_version, error_correction, mask_pattern)
+    assert layout.read_codewords(grid) == list(util.create_data(qr_version, error_correction, qr.data_list))
+
+
+@pytest.mark.parametrize('qr_version', (5, 10, 40))
+@pytest.mark.parametrize('error_correction', LEVELS)
+def test_rs_encode_matches_qrcode_blocks(qr_version, error_correction):
+    grid, qr = reference_symbol(qr_version, error_correction, 0)
+    layout = symbol_layout(qr_version, error_correction, 0)
+    blocks = layout.split_blocks(list(util.create_data(qr_version, error_correction, qr.data_list)))
+    for block, codewords in zip(layout.blocks, blocks):
+        data, ec = codewords[:block.data_count], codewords[block.data_count:]
+        assert list(rs_encode(data, block.total_count - block.data_count)) == ec
+
+
+@pytest.mark.parametrize('error_correction', LEVELS)
+@pytest.mark.parametrize('mask_pattern', range(8))
+def test_format_info_and_decode_match_qrcode(error_correction, mask_pattern):
+    grid, _ = reference_symbol(7, error_correction, mask_pattern)
+    assert read_format_info(grid) == (error_correction, mask_pattern)
+    assert decode_grid(grid) == URL
+
+
+@pytest.mark.parametrize('mask_pattern', range(1, 8))
+def test_remask_grid_matches_qrcode(mask_pattern):
+    grid, _ = reference_symbol(5, qrcode.constants.ERROR_CORRECT_M, 0)
+    expected, _ = reference_symbol(5, qrcode.constants.ERROR_CORRECT_M, mask_pattern)
+    assert np.array_equal(remask_grid(grid, mask_pattern), expected)
+
+
+# The analytic prediction of a flip must read what decoding the flipped grid reads
+@pytest.mark.parametrize('error_correction', LEVELS)
+def test_analytic_evaluator_agrees_with_decode_grid(error_correction):
+    grid, qr = create_qr_matrix(URL, 5, error_correction)
+    evaluator = AnalyticEvaluator(grid, qr.version)
+    assert evaluator.base_payload == URL
+    rng = np.random.default_rng(0)
+    white = np.argwhere(grid == 1)
+    for _ in range(40):
+        positions = [tuple(position) for position in white[rng.choice(len(white), 12, replace=False)].tolist()]
+        flipped = grid.copy()
+        for row, col in positions:
+            flipped[row, col] = 0
+        assert evaluator.evaluate(positions) == decode_grid(flipped)
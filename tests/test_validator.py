@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from qr_validator import PayloadValidator, edit_distances, printable_mask, skeleton
+
+
+# Function to compute one Levenshtein distance the textbook way, as the reference for edit_distances
+def levenshtein(first, second):
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (first_char != second_char)))
+        previous = current
+    return previous[-1]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_edit_distances_match_levenshtein(seed):
+    rng = np.random.default_rng(seed)
+    alphabet = list('abc./:')
+    reference = ''.join(rng.choice(alphabet, rng.integers(0, 12)))
+    others = [''.join(rng.choice(alphabet, rng.integers(0, 15))) for _ in range(50)]
+    assert edit_distances(reference, others).tolist() == [levenshtein(reference, other) for other in others]
+
+
+def test_edit_distances_edge_cases():
+    assert edit_distances('abc', []).tolist() == []
+    assert edit_distances('', ['', 'ab']).tolist() == [0, 2]
+    assert edit_distances('kitten', ['sitting', 'kitten', '', 'kitteñ']).tolist() == [3, 0, 6, 1]
+
+
+def test_printable_mask_matches_str_methods():
+    payloads = ['https://www.hello.com', 'tab\there', 'café', '', '~ !', '\x7f', 'line\n']
+    expected = [payload.isascii() and payload.isprintable() for payload in payloads]
+    assert printable_mask(payloads).tolist() == expected
+
+
+def test_homoglyphs_score_as_the_original():
+    validator = PayloadValidator('https://example.com', min_similarity=0.9)
+    assert skeleton('https://examp1e.corn') == skeleton('https://example.com')
+    verdict = validator.validate('https://examp1e.corn')
+    assert (verdict['edits'], verdict['similarity'], verdict['accepted']) == (0, 1.0, True)
+    verdict = validator.validate('https://zzzzzzz.org')
+    assert verdict['reason'] == 'dissimilar'
+    assert verdict['edits'] == levenshtein(skeleton('https://zzzzzzz.org'), skeleton('https://example.com'))
+
+
+def test_batch_verdicts_match_single_verdicts():
+    payloads = ['https://examp1e.com', None, 'http://evil.example.org/x', 'ftp://example.com', 'not a url',
+                'https://examp1e.com']
+    batch = PayloadValidator('https://example.com', require_url=True, deny=['evil.example.org'])
+    single = PayloadValidator('https://example.com', require_url=True, deny=['evil.example.org'])
+    assert batch.validate_batch(payloads) == [single.validate(payload) if payload is not None else None
+                                              for payload in payloads]
+    assert [verdict['reason'] for verdict in batch.validate_batch(payloads) if verdict] == \
+        [None, 'denied', 'scheme', 'not_url', None]